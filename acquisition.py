@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from instrumentation import metrics
+
+Sample = namedtuple("Sample", "channel value status timestamp")
+
+DEFAULT_SAMPLE_PERIOD = 10.0  # seconds
+
+READ_SECONDS = metrics.histogram("sensor_read_seconds", "Latency of one sensor read")
+OVERRUNS = metrics.counter("acquisition_overruns_total", "Channels sampled a whole period late")
+
+
+class AcquisitionScheduler:
+    """Polls all sensor channels from a single background thread.
+
+    Each channel is sampled at its own period (periods maps channel to
+    seconds, anything missing uses default_period). Every pass reads all the
+    channels that are due and stamps them with the same timestamp, then
+    hands the list of samples to the listeners and to the queues.
+    Listeners run on the acquisition thread and must return quickly, for
+    the GUI they emit a Qt signal.
+    """
+
+    def __init__(self, sources, default_period=DEFAULT_SAMPLE_PERIOD, periods=None):
+        self.sources = list(sources)
+        periods = periods or {}
+        self.periods = [periods.get(source.channel, default_period) for source in self.sources]
+        self.next_due = [0.0] * len(self.sources)
+        self.listeners = []
+        self.queues = []
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.passes = 0
+        self.samples = 0
+        self.overruns = 0
+
+    def add_listener(self, callback):
+        # callback(samples) with the list of Sample read in one pass
+        self.listeners.append(callback)
+
+    def add_queue(self, sample_queue):
+        # Each Sample is put without blocking, when the queue is full it is dropped
+        self.queues.append(sample_queue)
+
+    def set_period(self, channel, period):
+        for i, source in enumerate(self.sources):
+            if source.channel == channel:
+                self.periods[i] = period
+                self.next_due[i] = 0.0
+
+    def start(self):
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="acquisition", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def poll_once(self, now=None):
+        # Read every channel that is due at monotonic time now
+        if now is None:
+            now = time.monotonic()
+        timestamp = time.time()
+        samples = []
+        for i, source in enumerate(self.sources):
+            if self.next_due[i] > now:
+                continue
+            start = time.perf_counter()
+            value, status = source.read()
+            READ_SECONDS.observe(time.perf_counter() - start)
+            samples.append(Sample(source.channel, value, status, timestamp))
+            # Stay on the channel's own grid, unless we fell a whole period behind
+            due = self.next_due[i] + self.periods[i]
+            if due <= now:
+                if self.next_due[i]:
+                    self.overruns += 1
+                    OVERRUNS.inc()
+                due = now + self.periods[i]
+            self.next_due[i] = due
+        if samples:
+            self._publish(samples)
+        return samples
+
+    def _publish(self, samples):
+        self.passes += 1
+        self.samples += len(samples)
+        for callback in self.listeners:
+            callback(samples)
+        for sample_queue in self.queues:
+            for sample in samples:
+                try:
+                    sample_queue.put_nowait(sample)
+                except queue.Full:
+                    pass
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            self.poll_once()
+            delay = min(self.next_due, default=1.0) - time.monotonic()
+            if delay > 0:
+                self.stop_event.wait(delay)
@@ -0,0 +1,192 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from instrumentation import metrics
+
+# Alarm state of a tank, the level states are ordered from empty to full
+STATE_OFFLINE = -1  # No sensor, or no reading yet
+STATE_EMPTY = 0
+STATE_CRITICAL = 1
+STATE_MODERATE = 2
+STATE_GOOD = 3
+STATE_HIGH = 4
+STATE_FULL = 5
+
+# Name (also the uploaded Alarm attribute), colour and status text of each state
+ALARM_STATES = {
+    STATE_OFFLINE: ("offline", None, "NO SENSOR"),
+    STATE_EMPTY: ("empty", "#BA1301", "EMPTY TANK"),  # Red
+    STATE_CRITICAL: ("critical", "#BA1301", "CRITICAL"),  # Red
+    STATE_MODERATE: ("moderate", "#E4670B", "MODERATE"),  # Orange
+    STATE_GOOD: ("good", "#EBA104", "GOOD"),  # Yellow
+    STATE_HIGH: ("high", "#94C816", "HIGH"),  # Green
+    STATE_FULL: ("full", "#94C816", "FULL TANK"),  # Green
+}
+STATE_NAMES = {state: name for state, (name, _, _) in ALARM_STATES.items()}
+STATE_BY_NAME = {name: state for state, name in STATE_NAMES.items()}
+
+# States that raise a notification when a tank enters them
+ALARM_RAISED = {STATE_OFFLINE, STATE_EMPTY, STATE_CRITICAL}
+
+DEFAULT_EMPTY_LEVEL = 0.0  # At or below: empty
+DEFAULT_THRESHOLDS = (0.26, 0.51, 0.76)  # Lower bounds of moderate, good and high
+DEFAULT_FULL_LEVEL = 1.0  # At or above: full
+DEFAULT_HYSTERESIS = 0.0  # Level fraction past a band threshold before the state changes
+DEFAULT_MIN_DURATION = 0.0  # seconds a new state must hold before it is reported
+
+EDGE_COUNT = len(DEFAULT_THRESHOLDS) + 2
+EMPTY_EPSILON = 1e-9  # The empty edge sits just above the empty level, so that level itself is empty
+# Levels of all tanks are searched in one sorted array, tank row r occupies [r * ROW_SPAN - 1, r * ROW_SPAN + 2]
+ROW_SPAN = 4.0
+_HYSTERESIS_MASK = np.array([0.0] + [1.0] * len(DEFAULT_THRESHOLDS) + [0.0])  # Not on the empty and full edges
+
+AlarmEvent = namedtuple("AlarmEvent", "channel timestamp previous state level")
+
+TRANSITIONS = metrics.counter("alarm_transitions_total", "Alarm state changes of all tanks")
+
+
+def compile_edges(empty_level=DEFAULT_EMPTY_LEVEL, thresholds=DEFAULT_THRESHOLDS, full_level=DEFAULT_FULL_LEVEL):
+    # Sorted state boundaries: the number of edges at or below a level is its state
+    edges = np.array([empty_level + EMPTY_EPSILON, *thresholds, full_level], dtype=np.float64)
+    if len(edges) != EDGE_COUNT or not np.all(np.diff(edges) > 0) or edges[0] < 0 or edges[-1] > 1:
+        raise ValueError(f"Alarm levels must be {EDGE_COUNT} increasing fractions between 0 and 1")
+    return edges
+
+
+DEFAULT_EDGES = compile_edges()
+
+
+def check_edges(edges, hysteresis):
+    # The edges, and the edges shifted down and up by the hysteresis, must all stay in order
+    shifted = [edges + sign * hysteresis * _HYSTERESIS_MASK for sign in (-1, 1)]
+    if (len(edges) != EDGE_COUNT or edges[0] < 0 or edges[-1] > 1 or hysteresis < 0
+            or not all(np.all(np.diff(e) > 0) for e in [edges, *shifted])):
+        raise ValueError(f"Alarm levels must be {EDGE_COUNT} increasing fractions between 0 and 1, "
+                         "further apart than the hysteresis")
+
+
+def classify_levels(levels, edges=DEFAULT_EDGES):
+    # Alarm state of each level with the default thresholds and no hysteresis, NaN is offline
+    levels = np.asarray(levels, dtype=np.float64)
+    states = np.searchsorted(edges, np.clip(levels, 0.0, 1.0), side="right")
+    return np.where(np.isnan(levels), STATE_OFFLINE, states)
+
+
+def alarm_state(level):
+    # State of a single level, for the widgets that are not fed by the service
+    return int(classify_levels(level))
+
+
+class AlarmEngine:
+    """Alarm states of every tank, evaluated for a whole pass at once.
+
+    Each tank has its own empty and full levels and band thresholds,
+    compiled into EDGE_COUNT sorted edges. The edges of all tanks are laid
+    out in one array, tank row r shifted by r * ROW_SPAN, so a single
+    searchsorted classifies the whole fleet.
+
+    Hysteresis: a tank only moves up to a band once its level is
+    hysteresis past the threshold, and only moves down once it is
+    hysteresis below it, so a level sitting on a threshold does not
+    flap. It does not apply to the empty and full levels. A new state must
+    then hold for min_duration seconds before the tank enters it; losing
+    the sensor and the first reading count at once. update() returns only
+    the transitions, as AlarmEvent.
+    """
+
+    def __init__(self, channels, empty_level=DEFAULT_EMPTY_LEVEL, thresholds=DEFAULT_THRESHOLDS,
+                 full_level=DEFAULT_FULL_LEVEL, hysteresis=DEFAULT_HYSTERESIS, min_duration=DEFAULT_MIN_DURATION):
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        edges = compile_edges(empty_level, thresholds, full_level)
+        check_edges(edges, hysteresis)
+        self.edges = np.tile(edges, (count, 1))
+        self.hysteresis = np.full(count, float(hysteresis))
+        self.min_durations = np.full(count, float(min_duration))
+        self.offsets = np.arange(count) * ROW_SPAN
+
+        self.states = np.full(count, STATE_OFFLINE, dtype=np.int64)
+        self.since = np.full(count, np.nan)  # Time the current state was entered
+        self.pending = np.full(count, STATE_OFFLINE, dtype=np.int64)  # State waiting for min_duration
+        self.pending_since = np.full(count, np.nan)
+
+        self.lock = threading.Lock()
+        self.transitions = 0
+        self._compile()
+
+    def configure(self, channel, empty_level=None, thresholds=None, full_level=None, hysteresis=None,
+                  min_duration=None):
+        row = self.rows[channel]
+        with self.lock:
+            current = self.edges[row]
+            empty_level = current[0] if empty_level is None else empty_level + EMPTY_EPSILON
+            edges = np.array([empty_level, *(current[1:-1] if thresholds is None else thresholds),
+                              current[-1] if full_level is None else full_level])
+            hysteresis = self.hysteresis[row] if hysteresis is None else hysteresis
+            check_edges(edges, hysteresis)
+            self.edges[row] = edges
+            self.hysteresis[row] = hysteresis
+            if min_duration is not None:
+                self.min_durations[row] = min_duration
+            self._compile()
+
+    def _compile(self):
+        # Flat sorted edges of the whole fleet, without hysteresis, for moving down and for moving up
+        hysteresis = self.hysteresis[:, None] * _HYSTERESIS_MASK
+        self.flat_edges = (self.edges + self.offsets[:, None]).ravel()
+        self.flat_down = (self.edges - hysteresis + self.offsets[:, None]).ravel()
+        self.flat_up = (self.edges + hysteresis + self.offsets[:, None]).ravel()
+
+    def _classify(self, flat_edges, rows, levels):
+        return np.searchsorted(flat_edges, levels + self.offsets[rows], side="right") - rows * EDGE_COUNT
+
+    def update(self, channels, timestamp, levels, connected):
+        """Evaluate one pass, arguments are arrays with one entry per channel.
+
+        A connected channel with a NaN level (an out of range reading)
+        keeps its state. Returns (state of each channel, list of AlarmEvent).
+        """
+        rows = np.array([self.rows[channel] for channel in channels], dtype=np.intp)
+        levels = np.asarray(levels, dtype=np.float64)
+        connected = np.asarray(connected, dtype=bool)
+        unknown = connected & np.isnan(levels)
+        levels = np.clip(np.nan_to_num(levels), -1.0, 2.0)
+
+        with self.lock:
+            current = self.states[rows]
+            up = self._classify(self.flat_up, rows, levels)
+            down = self._classify(self.flat_down, rows, levels)
+            candidates = np.where(up > current, up, np.where(down < current, down, current))
+            candidates = np.where(current == STATE_OFFLINE, self._classify(self.flat_edges, rows, levels), candidates)
+            candidates = np.where(connected, np.where(unknown, current, candidates), STATE_OFFLINE)
+
+            # A new state has to hold for min_duration, the countdown restarts when the candidate changes
+            changing = candidates != current
+            restart = changing & (candidates != self.pending[rows])
+            self.pending_since[rows[restart]] = timestamp
+            self.pending[rows] = np.where(changing, candidates, current)
+            immediate = (current == STATE_OFFLINE) | (candidates == STATE_OFFLINE)
+            held = timestamp - self.pending_since[rows] >= self.min_durations[rows]
+            moved = changing & (immediate | held)
+
+            states = np.where(moved, candidates, current)
+            moved_rows = rows[moved]
+            self.states[moved_rows] = states[moved]
+            self.since[moved_rows] = timestamp
+            events = [AlarmEvent(self.channels[row], timestamp, int(current[i]), int(states[i]),
+                                 float(levels[i]) if connected[i] and not unknown[i] else None)
+                      for i, row in zip(np.flatnonzero(moved), moved_rows)]
+            self.transitions += len(events)
+        TRANSITIONS.inc(len(events))
+        return states, events
+
+    def stats(self):
+        with self.lock:
+            counts = np.bincount(self.states - STATE_OFFLINE, minlength=len(ALARM_STATES))
+            return {
+                "transitions": self.transitions,
+                **{f"tanks_{STATE_NAMES[state]}": int(counts[state - STATE_OFFLINE]) for state in ALARM_STATES},
+            }
@@ -0,0 +1,311 @@
+"""Benchmarks of the hot paths, with stored baselines.
+
+    python bench.py                   run everything, compare with the baseline
+    python bench.py --save            run and store the results as the new baseline
+    python bench.py -k paint          only the benchmarks whose name contains "paint"
+    python bench.py --threshold 0.5   fail only beyond 50% slower than the baseline
+
+Runs headless: Qt uses the offscreen platform, DynamoDB is the in-memory
+fake, and the journal and history live in a scratch directory. Each
+benchmark is timed in batches; the reported time per operation is the
+median over the batches (p95 shown for latency spread), and baselines are
+compared on the best batch, which is the least sensitive to noise. The
+exit code is 1 when any benchmark is slower than its baseline by more
+than the threshold.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "bench_baseline.json")
+DEFAULT_THRESHOLD = 0.25
+
+BENCHMARKS = []
+
+
+def benchmark(name, number=1000, repeat=7):
+    # Register setup(): it prepares the state and returns the operation to time, and how many items one call handles
+    def register(setup):
+        BENCHMARKS.append((name, setup, number, repeat))
+        return setup
+    return register
+
+
+def measure(operation, number, repeat):
+    # (best, median, p95) seconds per operation over the batches, without the GC like timeit
+    operation()  # Warm up caches and lazy initialisation
+    per_op = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                operation()
+            per_op.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return min(per_op), statistics.median(per_op), float(np.percentile(per_op, 95))
+
+
+# Sensors
+
+for size in (10, 1000, 100000):
+    @benchmark(f"sensors.get_value[{size}]", number=10000)
+    def _get_value(size=size):
+        from sensors import Pressure
+        pressure = Pressure(channel=0, values=list(range(size)), seed=0)
+        return pressure.get_value, 1
+
+
+# Level math
+
+@benchmark("levels.updateCalculations[1 tank]", number=2000)
+def _update_calculations():
+    widgets = _cylinder_widgets(1)
+    widget = widgets[0]
+    widget.pressure = 20.0
+    return widget.updateCalculations, 1
+
+
+for count in (1, 100, 10000):
+    @benchmark(f"levels.compute_levels[{count} tanks]", number=200)
+    def _compute_levels(count=count):
+        from level_engine import compute_levels
+        from geometry import TankGeometry
+        rng = np.random.default_rng(0)
+        pressures = rng.uniform(5, 30, count)
+        geometries = [TankGeometry(radius=1.0, height=3.0)] * count
+        return (lambda: compute_levels(pressures, 0.74, 1.0, 3.0, 0.5, geometries=geometries)), count
+
+
+for count in (100, 10000):
+    @benchmark(f"alarms.update[{count} tanks]", number=200)
+    def _alarms(count=count):
+        from alarms import AlarmEngine
+        engine = AlarmEngine(range(count), hysteresis=0.02, min_duration=30.0)
+        channels = list(range(count))
+        rng = np.random.default_rng(0)
+        levels = rng.uniform(0, 1, (16, count))
+        connected = np.ones(count, dtype=bool)
+        timestamps = iter(range(10 ** 9))
+
+        def update():
+            timestamp = next(timestamps)
+            engine.update(channels, float(timestamp), levels[timestamp % 16], connected)
+        return update, count
+
+
+for count in (100, 10000):
+    @benchmark(f"forecast.update[{count} tanks]", number=200)
+    def _forecast(count=count):
+        from forecasting import ConsumptionForecaster
+        forecaster = ConsumptionForecaster(range(count))
+        channels = list(range(count))
+        rng = np.random.default_rng(0)
+        volumes = rng.uniform(1, 9, count)
+        timestamps = iter(range(10 ** 9))
+
+        def update():
+            timestamp = next(timestamps)
+            forecaster.update(channels, timestamp * 60.0, volumes - timestamp * 1e-3, 10.0)
+        return update, count
+
+
+@benchmark("service.process[100 tanks]", number=100)
+def _service_process():
+    from acquisition import Sample
+    service = _service(100)
+    timestamps = iter(range(10 ** 9))
+    rng = np.random.default_rng(0)
+    values = rng.uniform(5, 30, 100)
+
+    def process():
+        timestamp = float(next(timestamps))
+        service.process([Sample(channel, values[channel], 0, timestamp) for channel in range(100)])
+    return process, 100
+
+
+# Rendering
+
+for count in (1, 10, 100):
+    @benchmark(f"render.paintEvent[{count} tanks]", number=20)
+    def _paint(count=count):
+        from PyQt5.QtGui import QImage, QPainter
+        widgets = _cylinder_widgets(count)
+        displays = [widget.tank_display for widget in widgets]
+        for display in displays:
+            display.resize(180, 230)
+        image = QImage(180, 230, QImage.Format_ARGB32_Premultiplied)
+
+        def paint():
+            # render() goes through paintEvent, like a repaint on screen
+            for display in displays:
+                painter = QPainter(image)
+                display.render(painter)
+                painter.end()
+        return paint, count
+
+
+# Storage
+
+@benchmark("storage.reading_items", number=10000)
+def _reading_items():
+    from tank_store import TankStore
+    from fake_dynamodb import FakeDynamoDB
+    store = TankStore(FakeDynamoDB(), site="1")
+    timestamps = iter(range(10 ** 9))
+    return (lambda: store.reading_items(1, float(next(timestamps)), 12.5, 4.2, 0.61)), 1
+
+
+@benchmark("storage.put_readings[batch of 500]", number=20)
+def _put_readings():
+    from tank_store import TankStore
+    from fake_dynamodb import FakeDynamoDB
+    store = TankStore(FakeDynamoDB(), site="1")
+    timestamps = iter(range(10 ** 9))
+
+    def put():
+        items = []
+        for tank in range(250):
+            items.extend(store.reading_items(tank, float(next(timestamps)), 12.5, 4.2, 0.61))
+        store.put_readings(items)
+    return put, 500
+
+
+@benchmark("storage.journal_drain[batch of 500]", number=20)
+def _journal_drain():
+    from tank_store import TankStore
+    from fake_dynamodb import FakeDynamoDB
+    from journal import ReadingJournal, JournalDrainer
+    dynamodb = FakeDynamoDB()
+    store = TankStore(dynamodb, site="1")
+    journal = ReadingJournal(os.path.join(_workdir(), "bench_journal.db"))
+    drainer = JournalDrainer(journal, dynamodb, batch_size=500)
+    timestamps = iter(range(10 ** 9))
+
+    def drain():
+        items = []
+        for tank in range(250):
+            items.extend(store.reading_items(tank, float(next(timestamps)), 12.5, 4.2, 0.61))
+        journal.append_many(items)
+        drainer.drain_once()
+    return drain, 500
+
+
+# Shared fixtures
+
+_fixtures = {}
+
+
+def _workdir():
+    if "workdir" not in _fixtures:
+        _fixtures["tempdir"] = tempfile.TemporaryDirectory()
+        _fixtures["workdir"] = _fixtures["tempdir"].name
+    return _fixtures["workdir"]
+
+
+def _app():
+    if "app" not in _fixtures:
+        from PyQt5.QtWidgets import QApplication
+        _fixtures["app"] = QApplication.instance() or QApplication(sys.argv[:1])
+    return _fixtures["app"]
+
+
+def _pres():
+    if "pres" not in _fixtures:
+        _app()
+        import pres
+        _fixtures["pres"] = pres
+    return _fixtures["pres"]
+
+
+def _cylinder_widgets(count):
+    pres = _pres()
+    from sensors import Pressure
+    widgets = [pres.CylinderWidget(f"Tank {i + 1}", Pressure(channel=i, values=[20.0])) for i in range(count)]
+    for i, widget in enumerate(widgets):
+        widget.setTankLevel(i / max(count, 1))
+    _fixtures.setdefault("widgets", []).extend(widgets)  # Keep them alive
+    return widgets
+
+
+def _service(count):
+    from sensors import Pressure
+    from service import TankService
+    from fake_dynamodb import FakeDynamoDB
+    directory = tempfile.mkdtemp(dir=_workdir())
+    return TankService(sources=[Pressure(channel=i, values=[20.0]) for i in range(count)],
+                       dynamodb=FakeDynamoDB(), journal_path=os.path.join(directory, "readings.db"),
+                       history_dir=os.path.join(directory, "history"))
+
+
+def run(selected):
+    results = {}
+    for name, setup, number, repeat in selected:
+        operation, items = setup()
+        best, median, p95 = measure(operation, number, repeat)
+        results[name] = {"best_seconds_per_op": best, "seconds_per_op": median, "p95_seconds_per_op": p95,
+                         "items_per_second": items / median}
+    return results
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path benchmarks")
+    parser.add_argument("-k", dest="pattern", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown as a fraction of the baseline (default 0.25)")
+    args = parser.parse_args()
+
+    selected = [entry for entry in BENCHMARKS if args.pattern in entry[0]]
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(selected)
+    regressions = []
+    for name, result in results.items():
+        line = (f"{name:40s} {format_time(result['seconds_per_op'])}/op  p95 {format_time(result['p95_seconds_per_op'])}"
+                f"  {result['items_per_second']:14,.0f} items/s")
+        if name in baseline:
+            # The best batch is the least disturbed by the rest of the machine, compare on it
+            change = result["best_seconds_per_op"] / baseline[name]["best_seconds_per_op"] - 1
+            line += f"  {change:+7.1%} vs baseline"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.save:
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Baseline saved to", args.baseline)
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
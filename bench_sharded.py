@@ -0,0 +1,65 @@
+"""Throughput of sharded acquisition against the single acquisition thread.
+
+Runs a TankService on simulated channels sampled as fast as possible,
+first in this process, then with the channels split over 1, 2, ...
+worker processes, and reports the samples processed per second (read,
+conditioned, computed, journaled) and the samples dropped by full rings.
+DynamoDB is the in-memory fake, the journal and history live in a
+scratch directory. The speedup depends on the free CPU cores: on a
+single core the workers only add the ring overhead.
+
+    python bench_sharded.py [--channels 256] [--workers 1 2 4] [--seconds 5] [--period 0.01]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from fake_dynamodb import FakeDynamoDB
+from service import TankService, make_source
+from sharded_acquisition import assign_channels
+
+
+def run(channels, workers, seconds, period, workdir):
+    # (samples per second, dropped samples), workers=0 samples every channel in this process
+    directory = tempfile.mkdtemp(dir=workdir)
+    periods = {channel: period for channel in range(channels)}
+    service = TankService(sources=[make_source(channel) for channel in range(channels)],
+                          dynamodb=FakeDynamoDB(), periods=periods,
+                          journal_path=os.path.join(directory, "readings.db"),
+                          history_dir=os.path.join(directory, "history"),
+                          workers=assign_channels(range(channels), workers) if workers else [])
+    service.uploader.start()
+    service.scheduler.start()
+    time.sleep(1.0)  # Let the workers start and the caches warm up
+    before = service.scheduler.samples
+    start = time.perf_counter()
+    time.sleep(seconds)
+    samples = service.scheduler.samples - before
+    elapsed = time.perf_counter() - start
+    dropped = service.scheduler.stats()["dropped"] if workers else 0
+    service.scheduler.stop()
+    service.uploader.stop()
+    service.history.flush()
+    return samples / elapsed, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=256)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--period", type=float, default=0.01, help="sample period of every channel in seconds")
+    args = parser.parse_args()
+
+    print(f"{args.channels} channels, {os.cpu_count()} CPU(s)")
+    with tempfile.TemporaryDirectory() as workdir:
+        baseline, _ = run(args.channels, 0, args.seconds, args.period, workdir)
+        print(f"{'in process':12s} {baseline:12,.0f} samples/s")
+        for workers in args.workers:
+            rate, dropped = run(args.channels, workers, args.seconds, args.period, workdir)
+            print(f"{f'{workers} worker(s)':12s} {rate:12,.0f} samples/s  x{rate / baseline:.2f}  {dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
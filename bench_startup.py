@@ -0,0 +1,62 @@
+"""Cold-start benchmark of the headless service.
+
+Runs `python service.py --once` several times in fresh interpreters, in a
+scratch directory so the real journal and history are not touched, and
+reports how long it takes from process start until the first acquisition
+pass is journaled. Also checks that boto3 and PyQt5 are not imported on
+that path.
+
+    python bench_startup.py [--runs 10] [--budget 1.0]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+HEAVY_MODULES = ("boto3", "botocore", "PyQt5")
+
+
+def time_once(workdir):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(HERE, "service.py"), "--once"], cwd=workdir, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def heavy_imports(workdir):
+    # Heavy modules imported by a --once run
+    code = ("import sys, runpy; sys.argv = ['service.py', '--once']; "
+            f"sys.path.insert(0, {HERE!r}); runpy.run_path({os.path.join(HERE, 'service.py')!r}, run_name='__main__'); "
+            f"print('heavy:', *[m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+    output = subprocess.run([sys.executable, "-c", code], cwd=workdir, check=True, capture_output=True, text=True)
+    return output.stdout.splitlines()[-1].split()[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds allowed until the first pass")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        time_once(workdir)  # Warm the OS file cache and __pycache__
+        times = [time_once(workdir) for _ in range(args.runs)]
+        loaded = heavy_imports(workdir)
+
+    median = statistics.median(times)
+    print(f"first pass journaled: min {min(times) * 1000:.0f} ms, median {median * 1000:.0f} ms, "
+          f"max {max(times) * 1000:.0f} ms over {args.runs} runs")
+    print("heavy modules imported:", ", ".join(loaded) if loaded else "none")
+    if median > args.budget or loaded:
+        print(f"FAIL: budget {args.budget * 1000:.0f} ms, heavy modules must stay lazy")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
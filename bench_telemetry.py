@@ -0,0 +1,112 @@
+"""Bytes per reading of the telemetry frames against the DynamoDB requests.
+
+Builds the Tanks items of a synthetic trace (see replay.synthetic_trace)
+with alarm states, the way the service journals them, and compares the
+request bodies sent for them:
+
+    put_item       one PutItem per item (history and LATEST), DynamoDB JSON
+    batch_write    BatchWriteItem requests of 25 items, as the journal drainer sends them
+    frame          telemetry frames of a whole batch interval, raw, zlib and zstd (if installed)
+
+HTTP and TLS headers come on top of every request, so the per-item
+requests fare even worse than shown. Also reports encode and decode
+(expand back into items) time per reading.
+
+    python bench_telemetry.py [--tanks 100] [--interval 60] [--period 10]
+"""
+import argparse
+import json
+import time
+from decimal import Decimal
+
+import numpy as np
+
+from alarms import STATE_NAMES, classify_levels
+from replay import synthetic_trace
+from tank_store import TankStore
+from telemetry import FRAME_RAW, FRAME_ZLIB, FRAME_ZSTD, encode_frame, expand_frame
+from uploader import MAX_BATCH_ITEMS
+
+FULL_PRESSURE = 42.0  # Pressure of a full tank in the synthetic trace
+CAPACITY = 10.0  # m³
+
+
+def _attribute(value):
+    # DynamoDB JSON of one attribute value
+    if isinstance(value, str):
+        return {"S": value}
+    return {"N": str(Decimal(value))}
+
+
+def put_item_bytes(table_name, item):
+    body = {"TableName": table_name, "Item": {name: _attribute(value) for name, value in item.items()}}
+    return len(json.dumps(body, separators=(",", ":")))
+
+
+def batch_write_bytes(table_name, items):
+    requests = [{"PutRequest": {"Item": {name: _attribute(value) for name, value in item.items()}}}
+                for item in items]
+    return len(json.dumps({"RequestItems": {table_name: requests}}, separators=(",", ":")))
+
+
+def make_items(tanks, interval, period, start=1760000000.0):
+    # Journal items of interval seconds of readings of every tank
+    trace = synthetic_trace(tanks, samples=max(int(interval / period), 1), period=period)
+    store = TankStore(None)
+    items = []
+    for row, channel in enumerate(trace.channels):
+        levels = np.clip(trace.values[row] / FULL_PRESSURE, 0.0, 1.0)
+        for k, (pressure, level, state) in enumerate(zip(trace.values[row].tolist(), levels.tolist(),
+                                                         classify_levels(levels).tolist())):
+            timestamp = start + k * period + row * 0.003
+            if np.isnan(pressure):
+                items.extend(store.reading_items(channel, timestamp, None, None, None, "No Sensor Connected",
+                                                 STATE_NAMES[-1]))
+            else:
+                items.extend(store.reading_items(channel, timestamp, pressure, level * CAPACITY, level,
+                                                 alarm=STATE_NAMES[state]))
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tanks", type=int, default=100)
+    parser.add_argument("--interval", type=float, default=60.0, help="seconds of readings per frame")
+    parser.add_argument("--period", type=float, default=10.0, help="sample period of every tank in seconds")
+    args = parser.parse_args()
+
+    items = make_items(args.tanks, args.interval, args.period)
+    readings = len(items) // 2
+    sizes = {
+        "put_item": sum(put_item_bytes("Tanks", item) for item in items),
+        "batch_write": sum(batch_write_bytes("Tanks", items[i:i + MAX_BATCH_ITEMS])
+                           for i in range(0, len(items), MAX_BATCH_ITEMS)),
+    }
+    compressions = {"raw": FRAME_RAW, "zlib": FRAME_ZLIB}
+    try:
+        import zstandard  # noqa: F401
+        compressions["zstd"] = FRAME_ZSTD
+    except ImportError:
+        print("zstandard not installed, no zstd frames")
+
+    timings = {}
+    for name, compression in compressions.items():
+        start = time.perf_counter()
+        frame = encode_frame(items, compression)
+        encoded = time.perf_counter()
+        expand_frame(frame)
+        timings[name] = (encoded - start, time.perf_counter() - encoded)
+        sizes[f"frame {name}"] = len(frame)
+
+    print(f"{args.tanks} tanks, {readings} readings in {args.interval:g} s")
+    baseline = sizes["put_item"] / readings
+    for name, size in sizes.items():
+        line = f"{name:12s} {size:10,d} bytes  {size / readings:8.1f} bytes/reading  x{baseline / (size / readings):.1f}"
+        if name.startswith("frame "):
+            encode, decode = timings[name[6:]]
+            line += f"  encode {encode / readings * 1e6:.1f} us  decode {decode / readings * 1e6:.1f} us per reading"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import threading
+
+import numpy as np
+
+# Filter applied to each channel
+METHOD_NONE = 0
+METHOD_MEDIAN = 1  # Moving median over the last window samples
+METHOD_EMA = 2  # Exponential moving average
+METHOD_KALMAN = 3  # Scalar Kalman filter, random-walk model
+
+METHOD_NAMES = {"none": METHOD_NONE, "median": METHOD_MEDIAN, "ema": METHOD_EMA, "kalman": METHOD_KALMAN}
+
+DEFAULT_METHOD = METHOD_MEDIAN
+DEFAULT_WINDOW = 5
+MAX_WINDOW = 31
+DEFAULT_ALPHA = 0.3
+DEFAULT_PROCESS_NOISE = 0.001  # Variance added per sample by the Kalman model
+DEFAULT_MEASUREMENT_NOISE = 0.07  # Variance of the sensor noise
+DEFAULT_MAX_REJECTS = 3
+
+
+def check_window(window):
+    if not 1 <= window <= MAX_WINDOW:
+        raise ValueError(f"Median window must be between 1 and {MAX_WINDOW}")
+
+
+class SignalConditioner:
+    """Streaming filters for the raw pressure of many channels.
+
+    Every channel has its own method (METHOD_*), and its own window, EMA
+    alpha or Kalman noise variances. update() takes one sample per
+    channel of an acquisition pass and returns the conditioned values,
+    with all channels of a method filtered in one vectorized step. The
+    state is a fixed set of arrays, so each sample costs O(1) (the median
+    works on a ring of at most MAX_WINDOW samples).
+
+    With a spike limit, a sample further than spike_limit from the current
+    output is rejected and the output holds, unless max_rejects samples
+    in a row were rejected: then the jump is real (e.g. a refill) and the
+    channel restarts from the new level. A missing sample (NaN) passes
+    through and resets the channel, so a reconnected sensor starts fresh.
+    """
+
+    def __init__(self, channels, method=DEFAULT_METHOD, window=DEFAULT_WINDOW, alpha=DEFAULT_ALPHA,
+                 process_noise=DEFAULT_PROCESS_NOISE, measurement_noise=DEFAULT_MEASUREMENT_NOISE,
+                 spike_limit=None, max_rejects=DEFAULT_MAX_REJECTS):
+        check_window(window)
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.methods = np.full(count, method, dtype=np.int8)
+        self.windows = np.full(count, window, dtype=np.intp)
+        self.alphas = np.full(count, float(alpha))
+        self.process_noises = np.full(count, float(process_noise))
+        self.measurement_noises = np.full(count, float(measurement_noise))
+        self.spike_limits = np.full(count, np.inf if spike_limit is None else float(spike_limit))
+        self.max_rejects = np.full(count, max_rejects, dtype=np.int64)
+
+        self.ring = np.full((count, MAX_WINDOW), np.nan)
+        self.positions = np.zeros(count, dtype=np.intp)
+        self.outputs = np.full(count, np.nan)
+        self.variances = np.full(count, np.nan)  # Kalman error variance
+        self.rejects = np.zeros(count, dtype=np.int64)  # Consecutive rejected samples
+
+        self.lock = threading.Lock()
+        self.samples = 0
+        self.rejected = np.zeros(count, dtype=np.int64)
+
+    def configure(self, channel, method=None, window=None, alpha=None, process_noise=None,
+                  measurement_noise=None, spike_limit=None, max_rejects=None):
+        # method is a METHOD_* code or its name; spike_limit=0 turns spike rejection off
+        row = self.rows[channel]
+        with self.lock:
+            if method is not None:
+                self.methods[row] = METHOD_NAMES[method] if isinstance(method, str) else method
+            if window is not None:
+                check_window(window)
+                self.windows[row] = window
+            if alpha is not None:
+                self.alphas[row] = alpha
+            if process_noise is not None:
+                self.process_noises[row] = process_noise
+            if measurement_noise is not None:
+                self.measurement_noises[row] = measurement_noise
+            if spike_limit is not None:
+                self.spike_limits[row] = spike_limit if spike_limit > 0 else np.inf
+            if max_rejects is not None:
+                self.max_rejects[row] = max_rejects
+            self._reset(np.array([row]))
+
+    def _reset(self, rows):
+        self.ring[rows] = np.nan
+        self.positions[rows] = 0
+        self.outputs[rows] = np.nan
+        self.variances[rows] = np.nan
+        self.rejects[rows] = 0
+
+    def update(self, channels, values):
+        # Conditioned values for one sample per channel, NaN stays NaN
+        rows = np.array([self.rows[channel] for channel in channels], dtype=np.intp)
+        values = np.asarray(values, dtype=np.float64)
+        with self.lock:
+            self.samples += len(rows)
+            missing = np.isnan(values)
+            self._reset(rows[missing])
+
+            # Spike rejection against the current output
+            previous = self.outputs[rows]
+            jump = ~missing & (np.abs(values - previous) > self.spike_limits[rows])
+            spike = jump & (self.rejects[rows] < self.max_rejects[rows])
+            # A jump that persists is real: restart the filters from the new level
+            self._reset(rows[jump & ~spike])
+            self.rejects[rows[spike]] += 1
+            self.rejected[rows[spike]] += 1
+            accepted = ~missing & ~spike
+            self.rejects[rows[accepted]] = 0
+
+            good_rows, good_values = rows[accepted], values[accepted]
+            methods = self.methods[good_rows]
+            for method, step in ((METHOD_MEDIAN, self._median), (METHOD_EMA, self._ema),
+                                 (METHOD_KALMAN, self._kalman)):
+                selected = methods == method
+                if selected.any():
+                    step(good_rows[selected], good_values[selected])
+            none = methods == METHOD_NONE
+            self.outputs[good_rows[none]] = good_values[none]
+
+            return np.where(missing, np.nan, self.outputs[rows])
+
+    def _median(self, rows, values):
+        # Slots past a channel's window stay NaN, so nanmedian only sees the window
+        self.ring[rows, self.positions[rows] % self.windows[rows]] = values
+        self.positions[rows] += 1
+        self.outputs[rows] = np.nanmedian(self.ring[rows], axis=1)
+
+    def _ema(self, rows, values):
+        previous = self.outputs[rows]
+        self.outputs[rows] = np.where(np.isnan(previous), values,
+                                      previous + self.alphas[rows] * (values - previous))
+
+    def _kalman(self, rows, values):
+        estimates = self.outputs[rows]
+        variances = self.variances[rows] + self.process_noises[rows]
+        gains = variances / (variances + self.measurement_noises[rows])
+        new = np.isnan(estimates)
+        estimates = np.where(new, values, estimates + gains * (values - estimates))
+        self.outputs[rows] = estimates
+        self.variances[rows] = np.where(new, self.measurement_noises[rows], (1 - gains) * variances)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "samples": self.samples,
+                "rejected": int(self.rejected.sum()),
+                "rejected_by_channel": dict(zip(self.channels, self.rejected.tolist())),
+            }
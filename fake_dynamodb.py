@@ -0,0 +1,148 @@
+import re
+import threading
+import random
+import time
+
+# Key conditions understood by FakeTable.query, the forms used by tank_store
+_KEY_CONDITION = re.compile(
+    r"^\s*(\w+)\s*=\s*(:\w+)"
+    r"(?:\s+AND\s+(\w+)\s*(?:BETWEEN\s+(:\w+)\s+AND\s+(:\w+)|(>=|<=|>|<|=)\s*(:\w+)|begins_with\s*\(\s*\w+\s*,\s*(:\w+)\s*\)))?\s*$",
+    re.IGNORECASE)
+
+
+class FakeTable:
+    """In-memory stand-in for a boto3 DynamoDB Table (only what the app uses)."""
+
+    def __init__(self, name, key_names=("PK", "SK")):
+        self.name = name
+        self.key_names = key_names
+        self.items = {}  # (PK, SK) -> item
+        self.partitions = {}  # PK -> {SK: item}
+        self.put_count = 0
+        self.read_count = 0
+        self.lock = threading.Lock()
+
+    def _key(self, item):
+        return tuple(item[k] for k in self.key_names)
+
+    def put_item(self, Item):
+        item = dict(Item)
+        key = self._key(item)
+        with self.lock:
+            self.items[key] = item
+            self.partitions.setdefault(key[0], {})[key[1]] = item
+            self.put_count += 1
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def get_item(self, Key):
+        with self.lock:
+            item = self.items.get(self._key(Key))
+            self.read_count += 1
+        return {"Item": dict(item)} if item is not None else {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, **kwargs):
+        match = _KEY_CONDITION.match(KeyConditionExpression)
+        if match is None or match.group(1) != self.key_names[0]:
+            raise ValueError(f"Unsupported KeyConditionExpression: {KeyConditionExpression}")
+        values = ExpressionAttributeValues
+        pk = values[match.group(2)]
+        if match.group(3):
+            if match.group(4):
+                lo, hi = values[match.group(4)], values[match.group(5)]
+                test = lambda sk: lo <= sk <= hi
+            elif match.group(6):
+                operand = values[match.group(7)]
+                test = {
+                    ">": lambda sk: sk > operand, ">=": lambda sk: sk >= operand,
+                    "<": lambda sk: sk < operand, "<=": lambda sk: sk <= operand,
+                    "=": lambda sk: sk == operand,
+                }[match.group(6)]
+            else:
+                prefix = values[match.group(8)]
+                test = lambda sk: sk.startswith(prefix)
+        else:
+            test = lambda sk: True
+
+        with self.lock:
+            partition = self.partitions.get(pk, {})
+            sks = sorted((sk for sk in partition if test(sk)), reverse=not ScanIndexForward)
+            if ExclusiveStartKey is not None:
+                start = ExclusiveStartKey[self.key_names[1]]
+                sks = [sk for sk in sks if (sk > start if ScanIndexForward else sk < start)]
+            page = sks[:Limit] if Limit else sks
+            items = [dict(partition[sk]) for sk in page]
+            self.read_count += len(items)
+        response = {"Items": items, "Count": len(items)}
+        if Limit and len(sks) > Limit:
+            response["LastEvaluatedKey"] = {self.key_names[0]: pk, self.key_names[1]: page[-1]}
+        return response
+
+
+class FakeDynamoDB:
+    """In-memory stand-in for boto3.resource('dynamodb').
+
+    unprocessed_rate makes batch_write_item and batch_get_item hand back a
+    random share of the requests as unprocessed, like a throttled table
+    would, and latency adds a fixed delay per request to mimic a network
+    round-trip.
+    """
+
+    def __init__(self, unprocessed_rate=0.0, latency=0.0, seed=None):
+        self.tables = {}
+        self.unprocessed_rate = unprocessed_rate
+        self.latency = latency
+        self.batch_write_calls = 0
+        self.batch_get_calls = 0
+        self.random = random.Random(seed)
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def _throttled(self):
+        return self.unprocessed_rate and self.random.random() < self.unprocessed_rate
+
+    def batch_write_item(self, RequestItems):
+        if self.latency:
+            time.sleep(self.latency)
+        self.batch_write_calls += 1
+        count = sum(len(requests) for requests in RequestItems.values())
+        if count > 25:
+            raise ValueError("Too many items requested for the BatchWriteItem call")
+
+        unprocessed = {}
+        for table_name, requests in RequestItems.items():
+            table = self.Table(table_name)
+            keys = [table._key(request["PutRequest"]["Item"]) for request in requests]
+            if len(set(keys)) != len(keys):
+                raise ValueError("Provided list of item keys contains duplicates")
+            for request in requests:
+                if self._throttled():
+                    unprocessed.setdefault(table_name, []).append(request)
+                    continue
+                table.put_item(Item=request["PutRequest"]["Item"])
+        return {"UnprocessedItems": unprocessed}
+
+    def batch_get_item(self, RequestItems):
+        if self.latency:
+            time.sleep(self.latency)
+        self.batch_get_calls += 1
+        count = sum(len(request["Keys"]) for request in RequestItems.values())
+        if count > 100:
+            raise ValueError("Too many items requested for the BatchGetItem call")
+
+        responses = {}
+        unprocessed = {}
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            responses[table_name] = []
+            for key in request["Keys"]:
+                if self._throttled():
+                    unprocessed.setdefault(table_name, {"Keys": []})["Keys"].append(key)
+                    continue
+                item = table.get_item(Key=key).get("Item")
+                if item is not None:
+                    responses[table_name].append(item)
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
@@ -0,0 +1,197 @@
+import numpy as np
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, QListView, QStyledItemDelegate
+from PyQt5.QtCore import Qt, QSize, QAbstractListModel, QModelIndex, QSortFilterProxyModel
+
+from alarms import (STATE_CRITICAL, STATE_EMPTY, STATE_FULL, STATE_GOOD, STATE_HIGH, STATE_MODERATE,
+                    STATE_OFFLINE, classify_levels)
+from forecasting import forecast_text
+from geometry import TankGeometry
+from level_engine import DEFAULT_SCALING_FACTOR, STATUS_NO_SENSOR, compute_levels
+from sensors import SENSOR_OK
+from tank_render import paint_tank
+
+# Custom data roles exposed by FleetModel
+TankLevelRole = Qt.UserRole + 1
+LiquidTypeRole = Qt.UserRole + 2
+StatusRole = Qt.UserRole + 3  # Alarm state, see alarms.STATE_*
+ChannelRole = Qt.UserRole + 4
+
+# Filter choices as sets of alarm states
+STATUS_FILTERS = [
+    ("All tanks", None),
+    ("Critical", {STATE_EMPTY, STATE_CRITICAL}),
+    ("Moderate", {STATE_MODERATE}),
+    ("Good", {STATE_GOOD, STATE_HIGH, STATE_FULL}),
+    ("No sensor", {STATE_OFFLINE}),
+]
+
+TANK_CELL_SIZE = QSize(180, 300)
+
+
+class FleetModel(QAbstractListModel):
+    """List model holding the state of every tank of the site.
+
+    Tank parameters and results are kept in NumPy arrays, so a whole
+    acquisition pass is computed with one compute_levels call and reported
+    to the view with a single dataChanged signal.
+    """
+
+    def __init__(self, channels, names=None, parent=None):
+        super().__init__(parent)
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.names = list(names) if names is not None else [f"Tank {i + 1}" for i in range(count)]
+        self.liquid_types = ["Essence Sans Plomb"] * count
+        self.densities = np.full(count, 0.74)
+        self.radii = np.full(count, 1.0)
+        self.heights = np.full(count, 3.0)
+        self.scaling_factors = np.full(count, DEFAULT_SCALING_FACTOR)
+        self.geometries = [TankGeometry(radius=1.0, height=3.0)] * count
+        self.pressures = np.full(count, np.nan)
+        self.levels = np.zeros(count)
+        self.volumes = np.zeros(count)
+        self.connected = np.zeros(count, dtype=bool)
+        self.statuses = np.full(count, STATE_OFFLINE)  # Alarm state of each tank
+        self.forecasts = np.full((count, 4), np.nan)  # Time to empty, its bounds and time to full, from the service
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.channels)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return self.names[row]
+        if role == TankLevelRole:
+            return float(self.levels[row])
+        if role == LiquidTypeRole:
+            return self.liquid_types[row]
+        if role == StatusRole:
+            return int(self.statuses[row])
+        if role == ChannelRole:
+            return self.channels[row]
+        if role == Qt.ToolTipRole:
+            return forecast_text(*self.forecasts[row])
+        return None
+
+    def updateSamples(self, samples):
+        # Apply one acquisition pass, returns (rows, LevelResult) for the updated tanks
+        samples = [sample for sample in samples if sample.channel in self.rows]
+        if not samples:
+            return [], None
+        rows = np.array([self.rows[sample.channel] for sample in samples])
+        self.pressures[rows] = [sample.value if sample.status == SENSOR_OK else np.nan for sample in samples]
+        result = compute_levels(self.pressures[rows], self.densities[rows], self.radii[rows],
+                                self.heights[rows], self.scaling_factors[rows],
+                                geometries=[self.geometries[row] for row in rows])
+        return self.updateResult(samples, result)
+
+    def updateResult(self, samples, result):
+        # Apply a pass already computed elsewhere (e.g. by the acquisition service),
+        # result rows follow samples and every channel must belong to the model.
+        # Alarm states come with the result from the service, otherwise from the levels alone
+        rows = np.array([self.rows[sample.channel] for sample in samples])
+        self.pressures[rows] = [sample.value if sample.status == SENSOR_OK else np.nan for sample in samples]
+        # Out of range readings keep the last good level, like the tank widget
+        good = rows[result.valid]
+        self.levels[good] = result.levels[result.valid]
+        self.volumes[good] = result.volumes[result.valid]
+        self.connected[rows] = result.status != STATUS_NO_SENSOR
+        if result.alarm_states is not None:
+            self.statuses[rows] = result.alarm_states
+        else:
+            self.statuses[rows] = np.where(self.connected[rows], classify_levels(self.levels[rows]), STATE_OFFLINE)
+        if result.forecast is not None:
+            forecast = result.forecast
+            self.forecasts[rows] = np.column_stack((forecast.time_to_empty, forecast.time_to_empty_low,
+                                                    forecast.time_to_empty_high, forecast.time_to_full))
+        self.dataChanged.emit(self.index(int(rows.min())), self.index(int(rows.max())))
+        return rows, result
+
+
+class StatusFilterProxy(QSortFilterProxyModel):
+    # Shows only the tanks whose status is in the selected set (None shows all)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.statuses = None
+        self.setDynamicSortFilter(True)
+
+    def setStatuses(self, statuses):
+        self.statuses = statuses
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if self.statuses is None:
+            return True
+        return self.sourceModel().statuses[source_row] in self.statuses
+
+
+class TankDelegate(QStyledItemDelegate):
+    # Paints a tank cell with the same drawing as TankDisplayWidget
+
+    def paint(self, painter, option, index):
+        rect = option.rect
+        painter.save()
+        painter.setClipRect(rect)
+        painter.translate(rect.topLeft())
+        paint_tank(painter, rect.width(), rect.height(), index.data(TankLevelRole),
+                   index.data(Qt.DisplayRole), index.data(LiquidTypeRole), index.data(StatusRole))
+        painter.restore()
+
+    def sizeHint(self, option, index):
+        return TANK_CELL_SIZE
+
+
+class FleetView(QWidget):
+    """Scrollable grid of tanks for sites with many tanks.
+
+    The QListView only lays out and paints the cells in the viewport, so
+    startup and repaint cost do not grow with the number of tanks.
+    """
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.proxy = StatusFilterProxy(self)
+        self.proxy.setSourceModel(model)
+
+        self.layout = QVBoxLayout(self)
+        self.layout.setContentsMargins(0, 0, 0, 0)
+
+        self.filter_layout = QHBoxLayout()
+        self.filter_input = QComboBox()
+        for text, statuses in STATUS_FILTERS:
+            self.filter_input.addItem(text)
+        self.filter_input.currentIndexChanged.connect(self.onFilterChanged)
+        self.filter_layout.addWidget(self.filter_input)
+        self.summary_label = QLabel()
+        self.filter_layout.addWidget(self.summary_label)
+        self.filter_layout.addStretch()
+        self.layout.addLayout(self.filter_layout)
+
+        self.list_view = QListView()
+        self.list_view.setViewMode(QListView.IconMode)
+        self.list_view.setResizeMode(QListView.Adjust)
+        self.list_view.setMovement(QListView.Static)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setLayoutMode(QListView.Batched)
+        self.list_view.setSpacing(0)
+        self.list_view.setGridSize(TANK_CELL_SIZE)
+        self.list_view.setItemDelegate(TankDelegate(self.list_view))
+        self.list_view.setModel(self.proxy)
+        self.layout.addWidget(self.list_view)
+
+        model.dataChanged.connect(self.updateSummary)
+        self.updateSummary()
+
+    def onFilterChanged(self, index):
+        self.proxy.setStatuses(STATUS_FILTERS[index][1])
+
+    def updateSummary(self, *args):
+        counts = dict(zip(*np.unique(self.model.statuses, return_counts=True)))
+        self.summary_label.setText("   ".join(
+            f"{text}: {sum(counts.get(s, 0) for s in statuses)}"
+            for text, statuses in STATUS_FILTERS if statuses is not None))
@@ -0,0 +1,169 @@
+import math
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_HALF_LIFE = 6 * 3600.0  # seconds for a sample's weight in the regression to halve
+DEFAULT_REFILL_THRESHOLD = 0.0  # m³ above the trend that counts as a refill
+DEFAULT_REFILL_PCT = 2.0  # ... or this % of the tank capacity, whichever is larger
+DEFAULT_CONFIDENCE = 1.96  # Standard errors either side of the rate, 95%
+MIN_EFFECTIVE_SAMPLES = 5.0  # Below this many (weighted) samples nothing is forecast
+
+# Estimates per channel: rates in m³/s (positive while the tank drains), times in seconds from the time of
+# the forecast, NaN when unknown and inf when the tank never gets there at the current trend
+Forecast = namedtuple("Forecast", "rates rate_errors volumes time_to_empty time_to_empty_low time_to_empty_high "
+                                  "time_to_full refilled")
+
+
+class ConsumptionForecaster:
+    """Consumption rate and time to empty or full of every tank, updated online.
+
+    Each tank keeps the weighted sums of an exponentially weighted linear
+    regression of volume against time: a sample's weight halves every
+    half_life seconds, so the trend follows changes in consumption. A
+    sample costs O(1) per tank and a whole pass is one set of array
+    operations, history is never rescanned.
+
+    The rate comes with its standard error from the weighted residuals. The
+    time to empty is given with bounds for the rate plus or minus
+    confidence standard errors. A volume jumping above the trend by more
+    than the refill threshold is a refill (or a swapped tank): the tank's
+    regression restarts from that sample.
+    """
+
+    def __init__(self, channels, half_life=DEFAULT_HALF_LIFE, refill_threshold=DEFAULT_REFILL_THRESHOLD,
+                 refill_pct=DEFAULT_REFILL_PCT, confidence=DEFAULT_CONFIDENCE):
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.half_lives = np.full(count, float(half_life))
+        self.refill_thresholds = np.full(count, float(refill_threshold))
+        self.refill_pcts = np.full(count, float(refill_pct))
+        self.confidence = confidence
+
+        # Weighted sums over the samples since the last refill, times relative to the last sample
+        # (re-centred on every sample, so they stay small however long a tank runs)
+        self.last_times = np.full(count, np.nan)
+        self.last_volumes = np.full(count, np.nan)
+        self.capacities = np.full(count, np.nan)
+        self.sums = np.zeros((7, count))  # w, w², wt, wv, wt², wtv, wv²
+
+        self.lock = threading.Lock()
+        self.refills = np.zeros(count, dtype=np.int64)
+
+    def configure(self, channel, half_life=None, refill_threshold=None, refill_pct=None):
+        row = self.rows[channel]
+        with self.lock:
+            if half_life is not None:
+                self.half_lives[row] = half_life
+            if refill_threshold is not None:
+                self.refill_thresholds[row] = refill_threshold
+            if refill_pct is not None:
+                self.refill_pcts[row] = refill_pct
+            self._reset(np.array([row]))
+
+    def _reset(self, rows):
+        self.sums[:, rows] = 0.0
+
+    def update(self, channels, timestamp, volumes, capacities):
+        """Add one pass, arguments are arrays with one entry per channel and NaN for a missing volume.
+
+        Returns the Forecast of the channels after the pass.
+        """
+        all_rows = np.array([self.rows[channel] for channel in channels], dtype=np.intp)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        capacities = np.broadcast_to(np.asarray(capacities, dtype=np.float64), volumes.shape)
+        with self.lock:
+            good = ~np.isnan(volumes)
+            rows, volumes, capacities = all_rows[good], volumes[good], capacities[good]
+
+            # A volume well above the trend is a refill, the regression restarts there
+            forecast = self._estimate(rows, timestamp)
+            limits = np.maximum(self.refill_thresholds[rows], self.refill_pcts[rows] / 100 * capacities)
+            expected = np.where(np.isnan(forecast.volumes), self.last_volumes[rows], forecast.volumes)
+            refilled = volumes - expected > limits
+            self.refills[rows[refilled]] += 1
+            self._reset(rows[refilled])
+
+            # Forget in proportion to the time since each tank's last sample, move the time origin to
+            # this sample, then add it at t = 0
+            elapsed = np.nan_to_num(timestamp - self.last_times[rows])
+            decay = np.exp2(-elapsed / self.half_lives[rows])
+            w, w2, wt, wv, wtt, wtv, wvv = self.sums[:, rows] * decay
+            w2 *= decay
+            wtt = wtt - 2 * elapsed * wt + elapsed * elapsed * w
+            wtv = wtv - elapsed * wv
+            wt = wt - elapsed * w
+            self.sums[:, rows] = (w + 1, w2 + 1, wt, wv + volumes, wtt, wtv, wvv + volumes * volumes)
+            self.last_times[rows] = timestamp
+            self.last_volumes[rows] = volumes
+            self.capacities[rows] = capacities
+
+            forecast = self._estimate(all_rows, timestamp)
+            forecast.refilled[np.flatnonzero(good)[refilled]] = True
+            return forecast
+
+    def forecast(self, channels, timestamp=None):
+        # Forecast of the channels at timestamp (default: each channel's last sample), without a new sample
+        rows = np.array([self.rows[channel] for channel in channels], dtype=np.intp)
+        with self.lock:
+            return self._estimate(rows, timestamp)
+
+    def _estimate(self, rows, timestamp):
+        w, w2, wt, wv, wtt, wtv, wvv = self.sums[:, rows]
+        since_last = 0.0 if timestamp is None else timestamp - self.last_times[rows]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # Weighted least squares v = a + b t, and the standard error of b with the effective sample size
+            effective = w * w / w2
+            spread = w * wtt - wt * wt
+            slopes = (w * wtv - wt * wv) / spread
+            intercepts = (wv - slopes * wt) / w
+            residuals = np.maximum(wvv - intercepts * wv - slopes * wtv, 0.0)
+            variances = residuals / w * effective / (effective - 2)
+            errors = np.sqrt(variances * w * w / (spread * effective))
+            known = (effective >= MIN_EFFECTIVE_SAMPLES) & (spread > 0)
+            slopes = np.where(known, slopes, np.nan)
+            errors = np.where(known, errors, np.nan)
+            volumes = np.where(known, intercepts + slopes * since_last, np.nan)
+            volumes = np.clip(volumes, 0.0, self.capacities[rows])
+
+            rates = -slopes
+            time_to_empty = np.where(rates > 0, volumes / rates, np.inf)
+            fast, slow = rates + self.confidence * errors, rates - self.confidence * errors
+            time_to_empty_low = np.where(fast > 0, volumes / fast, np.inf)
+            time_to_empty_high = np.where(slow > 0, volumes / slow, np.inf)
+            time_to_full = np.where(slopes > 0, (self.capacities[rows] - volumes) / slopes, np.inf)
+        # Without a trend the times are unknown rather than never
+        unknown = np.isnan(rates)
+        time_to_empty, time_to_empty_low, time_to_empty_high, time_to_full = (
+            np.where(unknown, np.nan, times) for times in (time_to_empty, time_to_empty_low, time_to_empty_high,
+                                                           time_to_full))
+        return Forecast(rates, errors, volumes, time_to_empty, time_to_empty_low, time_to_empty_high, time_to_full,
+                        np.zeros(len(rows), dtype=bool))
+
+    def stats(self):
+        with self.lock:
+            return {"refills": int(self.refills.sum()),
+                    "refills_by_channel": dict(zip(self.channels, self.refills.tolist()))}
+
+
+def format_duration(seconds):
+    # Short text for a forecast time: "45 min", "6.5 h", "3.2 d", "-" when unknown or never
+    if seconds is None or math.isnan(seconds) or math.isinf(seconds):
+        return "-"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    if seconds < 2 * 86400:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} d"
+
+
+def forecast_text(time_to_empty, time_to_empty_low, time_to_empty_high, time_to_full):
+    # One line for a tank's forecast, e.g. "Empty in 6.5 h (5.9 h - 7.2 h)"
+    if not math.isnan(time_to_empty) and not math.isinf(time_to_empty):
+        return (f"Empty in {format_duration(time_to_empty)} "
+                f"({format_duration(time_to_empty_low)} - {format_duration(time_to_empty_high)})")
+    if not math.isnan(time_to_full) and not math.isinf(time_to_full):
+        return f"Full in {format_duration(time_to_full)}"
+    return "Empty in -"
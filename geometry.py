@@ -0,0 +1,180 @@
+import csv
+
+import numpy as np
+
+# Supported tank shapes
+VERTICAL = "vertical"  # Vertical cylinder, flat ends
+HORIZONTAL = "horizontal"  # Horizontal cylinder, flat ends, height is the length
+VERTICAL_SPHERICAL_ENDS = "vertical_spherical_ends"  # Vertical cylinder with hemispherical heads
+HORIZONTAL_SPHERICAL_ENDS = "horizontal_spherical_ends"  # Horizontal cylinder with hemispherical heads
+STRAPPING = "strapping"  # Calibration table supplied by the user
+
+SHAPE_NAMES = {
+    VERTICAL: "Vertical cylinder",
+    HORIZONTAL: "Horizontal cylinder",
+    VERTICAL_SPHERICAL_ENDS: "Vertical, spherical ends",
+    HORIZONTAL_SPHERICAL_ENDS: "Horizontal, spherical ends",
+    STRAPPING: "Strapping table",
+}
+
+DEFAULT_TABLE_POINTS = 2049  # Points of the precomputed level -> volume table
+
+
+def _spherical_cap(h, r):
+    # Volume of a sphere of radius r filled up to h (0 <= h <= 2r)
+    return np.pi * h ** 2 * (3 * r - h) / 3
+
+
+def _circular_segment(h, r):
+    # Area of a circle of radius r filled up to h (0 <= h <= 2r)
+    return r ** 2 * np.arccos((r - h) / r) - (r - h) * np.sqrt(np.maximum(2 * r * h - h ** 2, 0.0))
+
+
+class TankGeometry:
+    """Shape and dimensions of a tank.
+
+    radius and height are in metres. For horizontal tanks height is the
+    length of the cylindrical shell, for tanks with spherical ends it does
+    not include the heads. A strapping table is a sequence of
+    (level in m, volume in m³) pairs sorted by level.
+    """
+
+    def __init__(self, shape=VERTICAL, radius=1.0, height=3.0, strapping_table=None):
+        if shape not in SHAPE_NAMES:
+            raise ValueError(f"Unknown tank shape: {shape}")
+        if shape == STRAPPING:
+            if not strapping_table or len(strapping_table) < 2:
+                raise ValueError("A strapping table needs at least two points")
+            strapping_table = tuple((float(level), float(volume)) for level, volume in strapping_table)
+            if any(b[0] <= a[0] or b[1] < a[1] for a, b in zip(strapping_table, strapping_table[1:])):
+                raise ValueError("Strapping table levels must increase and volumes must not decrease")
+        self.shape = shape
+        self.radius = float(radius)
+        self.height = float(height)
+        self.strapping_table = strapping_table
+        self.key = (shape, self.radius, self.height, strapping_table)
+
+    def __eq__(self, other):
+        return isinstance(other, TankGeometry) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    @property
+    def max_level(self):
+        # Liquid height of a full tank
+        if self.shape == VERTICAL:
+            return self.height
+        if self.shape in (HORIZONTAL, HORIZONTAL_SPHERICAL_ENDS):
+            return 2 * self.radius
+        if self.shape == VERTICAL_SPHERICAL_ENDS:
+            return self.height + 2 * self.radius
+        return self.strapping_table[-1][0]
+
+    @property
+    def capacity(self):
+        return float(self.volume_at(self.max_level))
+
+    def volume_at(self, levels):
+        # Closed-form volume for liquid heights clipped to [0, max_level]
+        h = np.clip(np.asarray(levels, dtype=np.float64), 0.0, self.max_level)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self._volume_at(h)
+
+    def _volume_at(self, h):
+        r = self.radius
+        if self.shape == VERTICAL:
+            return np.pi * r ** 2 * h
+        if self.shape == HORIZONTAL:
+            return self.height * _circular_segment(h, r)
+        if self.shape == HORIZONTAL_SPHERICAL_ENDS:
+            return self.height * _circular_segment(h, r) + _spherical_cap(h, r)
+        if self.shape == VERTICAL_SPHERICAL_ENDS:
+            full = _spherical_cap(2 * r, r) + np.pi * r ** 2 * self.height
+            bottom = _spherical_cap(np.minimum(h, r), r)
+            shell = np.pi * r ** 2 * np.clip(h - r, 0.0, self.height)
+            top = np.where(h > r + self.height, _spherical_cap(r, r) - _spherical_cap(self.max_level - h, r), 0.0)
+            return np.minimum(bottom + shell + top, full)
+        levels, volumes = zip(*self.strapping_table)
+        return np.interp(h, levels, volumes)
+
+    def build_table(self, points=DEFAULT_TABLE_POINTS):
+        # Dense (levels, volumes) lookup table
+        if self.shape == STRAPPING:
+            levels, volumes = zip(*self.strapping_table)
+            return np.array(levels), np.array(volumes)
+        levels = np.linspace(0.0, self.max_level, points)
+        return levels, self.volume_at(levels)
+
+
+def load_strapping_table(path):
+    # Read a CSV file of "level,volume" rows (metres, cubic metres), a header row is allowed
+    table = []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            try:
+                table.append((float(row[0]), float(row[1])))
+            except ValueError:
+                continue
+    return sorted(table)
+
+
+class GeometryCache:
+    """Precomputed lookup tables, one per tank configuration.
+
+    Tables are built on first use and shared by every tank with the same
+    configuration. Call invalidate() when a tank's geometry is edited.
+    """
+
+    def __init__(self, points=DEFAULT_TABLE_POINTS):
+        self.points = points
+        self.tables = {}
+
+    def table(self, geometry):
+        table = self.tables.get(geometry.key)
+        if table is None:
+            table = geometry.build_table(self.points)
+            self.tables[geometry.key] = table
+        return table
+
+    def invalidate(self, geometry=None):
+        if geometry is None:
+            self.tables.clear()
+        else:
+            self.tables.pop(geometry.key, None)
+
+    def volumes(self, liquid_heights, geometries):
+        """Volumes and capacities for the liquid heights of many tanks.
+
+        geometries is one TankGeometry shared by every tank or one per
+        tank. Tanks with the same configuration are looked up together with
+        a single np.interp call. Heights outside the table are clamped, so
+        callers should compare them with the max_levels returned.
+        """
+        liquid_heights = np.asarray(liquid_heights, dtype=np.float64)
+        if isinstance(geometries, TankGeometry):
+            levels, volumes = self.table(geometries)
+            return (np.interp(liquid_heights, levels, volumes),
+                    np.full(liquid_heights.shape, volumes[-1]),
+                    np.full(liquid_heights.shape, levels[-1]))
+
+        flat_heights = liquid_heights.reshape(-1)
+        result = np.empty_like(flat_heights)
+        capacities = np.empty_like(flat_heights)
+        max_levels = np.empty_like(flat_heights)
+        groups = {}
+        for i, geometry in enumerate(geometries):
+            groups.setdefault(geometry.key, (geometry, []))[1].append(i)
+        for geometry, indices in groups.values():
+            levels, volumes = self.table(geometry)
+            result[indices] = np.interp(flat_heights[indices], levels, volumes)
+            capacities[indices] = volumes[-1]
+            max_levels[indices] = levels[-1]
+        shape = liquid_heights.shape
+        return result.reshape(shape), capacities.reshape(shape), max_levels.reshape(shape)
+
+
+# Cache shared by the whole application
+geometry_cache = GeometryCache()
@@ -0,0 +1,258 @@
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# Rollup resolutions in milliseconds: 1 min, 15 min, 1 h
+RESOLUTIONS_MS = (60_000, 900_000, 3_600_000)
+
+# Buckets kept in memory per resolution: 7 days, 90 days, 2 years
+ROLLUP_RETENTION = {60_000: 7 * 24 * 60, 900_000: 90 * 24 * 4, 3_600_000: 2 * 365 * 24}
+
+DEFAULT_RING_CAPACITY = 4096  # Raw samples kept in memory per series
+
+Series = namedtuple("Series", "timestamps mins maxs avgs resolution_ms")
+
+
+class Rollup:
+    """Incremental min/max/avg buckets of one series at one resolution."""
+
+    def __init__(self, resolution_ms, retention):
+        self.resolution_ms = resolution_ms
+        self.retention = retention
+        self.starts = np.empty(0, dtype=np.int64)
+        self.mins = np.empty(0)
+        self.maxs = np.empty(0)
+        self.sums = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.size = 0
+
+    def add(self, t_ms, value):
+        start = t_ms - t_ms % self.resolution_ms
+        if self.size and self.starts[self.size - 1] == start:
+            i = self.size - 1
+        elif self.size == 0 or self.starts[self.size - 1] < start:
+            i = self._open(start)
+        else:
+            # Late sample, find its bucket among the closed ones
+            i = int(np.searchsorted(self.starts[:self.size], start))
+            if i == self.size or self.starts[i] != start:
+                return  # Older than anything we keep, or a gap we never saw: ignore
+        self.mins[i] = min(self.mins[i], value)
+        self.maxs[i] = max(self.maxs[i], value)
+        self.sums[i] += value
+        self.counts[i] += 1
+
+    def extend(self, timestamps, values):
+        # Bulk load of sorted samples newer than the last bucket, e.g. from disk at startup
+        if len(timestamps) == 0:
+            return
+        starts = timestamps - timestamps % self.resolution_ms
+        firsts = np.flatnonzero(np.r_[True, starts[1:] != starts[:-1]])
+        new_starts = starts[firsts]
+        needed = self.size + len(new_starts)
+        if needed > len(self.starts):
+            self._grow(needed)
+        end = self.size + len(new_starts)
+        self.starts[self.size:end] = new_starts
+        self.mins[self.size:end] = np.minimum.reduceat(values, firsts)
+        self.maxs[self.size:end] = np.maximum.reduceat(values, firsts)
+        self.sums[self.size:end] = np.add.reduceat(values, firsts)
+        self.counts[self.size:end] = np.diff(np.r_[firsts, len(values)])
+        self.size = end
+        if self.size > self.retention:
+            self._keep_last(self.retention)
+
+    def _open(self, start):
+        if self.size == len(self.starts):
+            if self.size >= 2 * self.retention:
+                # Drop the oldest buckets past the retention, amortized over many samples
+                self._keep_last(self.retention)
+            else:
+                self._grow(max(64, 2 * len(self.starts)))
+        i = self.size
+        self.starts[i] = start
+        self.mins[i] = np.inf
+        self.maxs[i] = -np.inf
+        self.sums[i] = 0.0
+        self.counts[i] = 0
+        self.size += 1
+        return i
+
+    def _grow(self, capacity):
+        for name in ("starts", "mins", "maxs", "sums", "counts"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def _keep_last(self, count):
+        drop = self.size - count
+        for name in ("starts", "mins", "maxs", "sums", "counts"):
+            array = getattr(self, name)
+            array[:count] = array[drop:self.size]
+        self.size = count
+
+    def query(self, start_ms, end_ms):
+        lo = int(np.searchsorted(self.starts[:self.size], start_ms - start_ms % self.resolution_ms))
+        hi = int(np.searchsorted(self.starts[:self.size], end_ms, side="right"))
+        counts = self.counts[lo:hi]
+        return Series(self.starts[lo:hi].copy(), self.mins[lo:hi].copy(), self.maxs[lo:hi].copy(),
+                      self.sums[lo:hi] / np.maximum(counts, 1), self.resolution_ms)
+
+
+class ColumnFile:
+    """Append-only on-disk columns (int64 timestamps, float64 values), read through np.memmap."""
+
+    def __init__(self, path):
+        self.path = path
+        self.time_path = path + ".time.i8"
+        self.value_path = path + ".value.f8"
+        self.maps = None
+        self.count = os.path.getsize(self.time_path) // 8 if os.path.exists(self.time_path) else 0
+
+    def append(self, timestamps, values):
+        with open(self.time_path, "ab") as f:
+            f.write(np.ascontiguousarray(timestamps, dtype=np.int64).tobytes())
+        with open(self.value_path, "ab") as f:
+            f.write(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+        self.count += len(timestamps)
+        self.maps = None  # Remap on next read, the files grew
+
+    def columns(self):
+        if self.count == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if self.maps is None:
+            self.maps = (np.memmap(self.time_path, dtype=np.int64, mode="r", shape=(self.count,)),
+                         np.memmap(self.value_path, dtype=np.float64, mode="r", shape=(self.count,)))
+        return self.maps
+
+
+class TankSeries:
+    """Raw samples and rollups of one metric of one tank.
+
+    The newest raw samples sit in a fixed-size ring buffer. Before the ring
+    overwrites a sample it spills everything not yet on disk to the
+    series' column files, so raw history is kept on disk and the recent
+    window is served from memory. Samples must be appended in time order.
+    """
+
+    def __init__(self, path, capacity=DEFAULT_RING_CAPACITY):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.int64)
+        self.values = np.zeros(capacity)
+        self.head = 0  # Next slot to write
+        self.count = 0  # Samples in the ring
+        self.unspilled = 0  # Newest samples of the ring that are not on disk yet
+        self.disk = ColumnFile(path)
+        self.rollups = {res: Rollup(res, ROLLUP_RETENTION.get(res, 10000)) for res in RESOLUTIONS_MS}
+        # Rebuild the rollups from what a previous run spilled to disk
+        disk_t, disk_v = self.disk.columns()
+        for res, rollup in self.rollups.items():
+            lo = int(np.searchsorted(disk_t, disk_t[-1] - res * rollup.retention)) if len(disk_t) else 0
+            rollup.extend(np.asarray(disk_t[lo:]), np.asarray(disk_v[lo:]))
+
+    def append(self, t_ms, value):
+        if self.count == self.capacity and self.unspilled == self.capacity:
+            self.spill()
+        self.timestamps[self.head] = t_ms
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.unspilled += 1
+        for rollup in self.rollups.values():
+            rollup.add(t_ms, value)
+
+    def _ring(self, last):
+        # Indices of the last n samples of the ring, oldest first
+        return (np.arange(self.head - last, self.head)) % self.capacity
+
+    def spill(self):
+        if self.unspilled:
+            indices = self._ring(self.unspilled)
+            self.disk.append(self.timestamps[indices], self.values[indices])
+            self.unspilled = 0
+
+    def _raw_slices(self, start_ms, end_ms):
+        # (disk timestamps, disk values, ring timestamps, ring values) restricted to the range
+        indices = self._ring(self.count)
+        ring_t = self.timestamps[indices]
+        ring_v = self.values[indices]
+        disk_t, disk_v = self.disk.columns()
+        # Samples already spilled but still in the ring come from memory
+        cut = int(np.searchsorted(disk_t, ring_t[0])) if len(ring_t) else len(disk_t)
+        lo = int(np.searchsorted(disk_t[:cut], start_ms))
+        hi = int(np.searchsorted(disk_t[:cut], end_ms, side="right"))
+        rlo = int(np.searchsorted(ring_t, start_ms))
+        rhi = int(np.searchsorted(ring_t, end_ms, side="right"))
+        return disk_t[lo:hi], disk_v[lo:hi], ring_t[rlo:rhi], ring_v[rlo:rhi]
+
+    def raw_count(self, start_ms, end_ms):
+        # Number of raw samples in the range, without reading them
+        disk_t, _, ring_t, _ = self._raw_slices(start_ms, end_ms)
+        return len(disk_t) + len(ring_t)
+
+    def raw(self, start_ms, end_ms):
+        disk_t, disk_v, ring_t, ring_v = self._raw_slices(start_ms, end_ms)
+        return np.concatenate([disk_t, ring_t]), np.concatenate([disk_v, ring_v])
+
+
+class HistoryStore:
+    """Local time-series history, one series per (tank channel, metric).
+
+    query() returns min/max/avg arrays for any time range (epoch
+    milliseconds), from the coarsest data that still gives max_points
+    points: raw samples for short ranges, otherwise a rollup.
+    """
+
+    def __init__(self, directory="history", capacity=DEFAULT_RING_CAPACITY):
+        self.directory = directory
+        self.capacity = capacity
+        self.series = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, channel, metric):
+        return os.path.join(self.directory, f"tank{channel}_{metric}")
+
+    def _series(self, channel, metric):
+        key = (channel, metric)
+        series = self.series.get(key)
+        if series is None:
+            series = TankSeries(self._path(channel, metric), self.capacity)
+            self.series[key] = series
+        return series
+
+    def append(self, channel, t_ms, value, metric="level"):
+        with self.lock:
+            self._series(channel, metric).append(int(t_ms), float(value))
+
+    def append_many(self, channels, t_ms, values, metric="level"):
+        with self.lock:
+            for channel, value in zip(channels, values):
+                self._series(channel, metric).append(int(t_ms), float(value))
+
+    def query(self, channel, start_ms, end_ms, metric="level", max_points=500, resolution_ms=None):
+        # resolution_ms forces a rollup resolution, 0 forces raw samples
+        with self.lock:
+            if (channel, metric) not in self.series and not os.path.exists(ColumnFile(self._path(channel, metric)).time_path):
+                empty = np.empty(0)
+                return Series(np.empty(0, dtype=np.int64), empty, empty, empty, 0)
+            series = self._series(channel, metric)
+            if resolution_ms is None:
+                if series.raw_count(start_ms, end_ms) <= max_points:
+                    t, v = series.raw(start_ms, end_ms)
+                    return Series(t, v, v, v, 0)
+                span = end_ms - start_ms
+                resolution_ms = next((res for res in RESOLUTIONS_MS if span / res <= max_points), RESOLUTIONS_MS[-1])
+            elif resolution_ms == 0:
+                t, v = series.raw(start_ms, end_ms)
+                return Series(t, v, v, v, 0)
+            return series.rollups[resolution_ms].query(start_ms, end_ms)
+
+    def flush(self):
+        # Spill every ring to disk, e.g. before shutting down
+        with self.lock:
+            for series in self.series.values():
+                series.spill()
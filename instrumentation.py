@@ -0,0 +1,274 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from 50 µs to 10 s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+
+DEFAULT_METRICS_PORT = 9108
+
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s msg=\"%(message)s\"%(fields)s"
+
+_STANDARD_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+# Logging
+
+class KeyValueFormatter(logging.Formatter):
+    """One line per record: timestamp, level, logger and message, then the extra= fields as key=value."""
+
+    def __init__(self, fmt=LOG_FORMAT):
+        super().__init__(fmt)
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in _STANDARD_RECORD_FIELDS}
+        record.fields = "".join(f" {key}={value}" for key, value in fields.items() if key != "fields")
+        return super().format(record)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most burst records per message template every period seconds.
+
+    Records are grouped by logger and unformatted message, so a per-tick
+    log line with changing values counts as one stream. When a stream is let
+    through again, the record says how many were suppressed meanwhile.
+    """
+
+    def __init__(self, burst=5, period=60.0):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.streams = {}  # (logger, template) -> [window start, records in window, suppressed]
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            stream = self.streams.get(key)
+            if stream is None or now - stream[0] >= self.period:
+                suppressed = stream[2] if stream is not None else 0
+                stream = [now, 0, 0]
+                self.streams[key] = stream
+                if suppressed:
+                    record.suppressed = suppressed
+            if stream[1] >= self.burst:
+                stream[2] += 1
+                metrics.counter("log_records_suppressed_total", "Log records dropped by rate limiting").inc()
+                return False
+            stream[1] += 1
+            return True
+
+
+def setup_logging(level=logging.INFO, burst=5, period=60.0, stream=None):
+    # Root handler with key=value lines and rate limiting, call once from the entry point
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(KeyValueFormatter())
+    handler.addFilter(RateLimitFilter(burst, period))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+
+# Metrics
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def render(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter", f"{self.name} {self.value:g}"]
+
+
+class Gauge:
+    """Current value, either set() by the code or read from a callback at export time."""
+
+    def __init__(self, name, help_text, callback=None):
+        self.name = name
+        self.help = help_text
+        self.callback = callback
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def render(self):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logging.getLogger(__name__).warning("Gauge %s failed: %s", self.name, e)
+                value = float("nan")
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {value:g}"]
+
+
+class Histogram:
+    """Fixed-bucket histogram, observe() is a bisect and two increments."""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for upper, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if upper == float("inf") else f"{upper:g}"
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {total:g}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics of the process, created on first use and exported as Prometheus text."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(name)
+                if metric is None:
+                    metric = cls(name, *args, **kwargs)
+                    self.metrics[name] = metric
+        return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text="", callback=None):
+        gauge = self._get(Gauge, name, help_text)
+        if callback is not None:
+            gauge.set_callback(callback)
+        return gauge
+
+    def histogram(self, name, help_text="", buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets)
+
+    def render(self):
+        lines = []
+        for name in sorted(self.metrics):
+            lines.extend(self.metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        # Atomic write, e.g. for the node_exporter textfile collector
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+metrics = MetricsRegistry()
+
+
+class MetricsServer:
+    """Serves the registry as Prometheus text on http://host:port/metrics from a daemon thread.
+
+    routes adds other paths, as {path: callable returning (content type, body bytes)}.
+    """
+
+    def __init__(self, registry=metrics, port=DEFAULT_METRICS_PORT, host="127.0.0.1", routes=None):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Only needed when serving
+        routes = dict(routes or {}, **{"/metrics": lambda: ("text/plain; version=0.0.4", registry.render().encode())})
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                route = routes.get(self.path.split("?")[0])
+                if route is None:
+                    self.send_error(404)
+                    return
+                content_type, body = route()
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood the log
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsFileWriter:
+    """Rewrites the registry to a text file every interval seconds from a daemon thread."""
+
+    def __init__(self, path, registry=metrics, interval=15.0):
+        self.path = path
+        self.registry = registry
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="metrics-file", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(5.0)
+        self.registry.write_textfile(self.path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.registry.write_textfile(self.path)
+            except OSError as e:
+                logging.getLogger(__name__).warning("Cannot write metrics to %s: %s", self.path, e)
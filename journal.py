@@ -0,0 +1,386 @@
+import collections
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from instrumentation import metrics
+from telemetry import encode_frame
+from uploader import MAX_BATCH_ITEMS, BatchWriteError, batch_write, coalesce
+
+log = logging.getLogger(__name__)
+
+DRAIN_ERRORS = metrics.counter("journal_drain_errors_total", "Journal drain passes that failed")
+DRAINED = metrics.counter("journal_drained_total", "Readings replayed from the journal to DynamoDB")
+DEAD_LETTERED = metrics.counter("journal_dead_lettered_total", "Readings moved to the dead letters")
+
+# Errors of a request that fail again however often it is repeated: the item is rejected, the link is fine
+PERMANENT_ERROR_CODES = {"ValidationException", "SerializationException"}
+
+
+def is_permanent_error(error):
+    response = getattr(error, "response", None)
+    code = response.get("Error", {}).get("Code") if isinstance(response, dict) else None
+    # TypeError / ValueError: the item can not even be serialized (e.g. a float), or the fake table refused it
+    return (code in PERMANENT_ERROR_CODES or isinstance(error, (TypeError, ValueError))
+            or type(error).__name__ == "ParamValidationError")
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError(f"Cannot journal value of type {type(value).__name__}")
+
+
+def _decode(obj):
+    if len(obj) == 1 and "$decimal" in obj:
+        return Decimal(obj["$decimal"])
+    return obj
+
+
+def _encodes(item):
+    try:
+        encode_frame([item])
+        return True
+    except Exception:
+        return False
+
+
+class ReadingJournal:
+    """Append-only local journal of readings, kept in SQLite (WAL mode).
+
+    Every reading is written here before it goes to DynamoDB, so a reading
+    survives both an uplink outage and a crash of the process. The journal
+    holds at most max_rows readings; past that the oldest are evicted.
+    Readings DynamoDB keeps refusing are moved to a dead_letters table with
+    the reason, out of the way of the others.
+    """
+
+    def __init__(self, path="readings.db", max_rows=500000):
+        self.path = path
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # durable across process crashes in WAL mode
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, item TEXT NOT NULL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letters ("
+            "id INTEGER PRIMARY KEY, created REAL NOT NULL, failed REAL NOT NULL, reason TEXT NOT NULL, "
+            "item TEXT NOT NULL)"
+        )
+        self.count = self.conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+        self.dead_letters = self.conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+        self.appended = 0
+        self.evicted = 0
+
+    def append(self, item):
+        self.append_many([item])
+
+    def append_many(self, items):
+        now = time.time()
+        rows = [(now, json.dumps(item, default=_encode)) for item in items]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("INSERT INTO readings (created, item) VALUES (?, ?)", rows)
+            self.count += len(rows)
+            self.appended += len(rows)
+            excess = self.count - self.max_rows
+            if excess > 0:
+                # Oldest-first eviction keeps the disk usage bounded
+                self.conn.execute(
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings ORDER BY id LIMIT ?)",
+                    (excess,))
+                self.count -= excess
+                self.evicted += excess
+            self.conn.execute("COMMIT")
+
+    def peek(self, limit):
+        # Oldest readings first, as (id, item) pairs
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, item FROM readings ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [(row_id, json.loads(item, object_hook=_decode)) for row_id, item in rows]
+
+    def ack(self, ids):
+        # Remove readings that made it to DynamoDB
+        if not ids:
+            return
+        with self.lock:
+            self.conn.execute("BEGIN")
+            cursor = self.conn.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in ids])
+            self.count -= cursor.rowcount
+            self.conn.execute("COMMIT")
+
+    def dead_letter(self, ids, reason):
+        # Move readings that can not be written to the dead letters, kept for inspection and replay by hand
+        if not ids:
+            return
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dead_letters (id, created, failed, reason, item) "
+                "SELECT id, created, ?, ?, item FROM readings WHERE id = ?", [(now, reason, i) for i in ids])
+            cursor = self.conn.executemany("DELETE FROM readings WHERE id = ?", [(i,) for i in ids])
+            self.count -= cursor.rowcount
+            self.dead_letters += cursor.rowcount
+            self.conn.execute("COMMIT")
+
+    def dead_letter_count(self):
+        with self.lock:
+            return self.dead_letters
+
+    def depth(self):
+        with self.lock:
+            return self.count
+
+    def oldest_age(self):
+        with self.lock:
+            row = self.conn.execute("SELECT created FROM readings ORDER BY id LIMIT 1").fetchone()
+        return time.time() - row[0] if row else 0.0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class JournalDrainer:
+    """Replays the journal backlog to DynamoDB in large batches.
+
+    Each pass takes up to batch_size of the oldest readings and sends them
+    as parallel 25-item BatchWriteItem requests. Readings are removed from
+    the journal only once DynamoDB has accepted them, chunk by chunk. While
+    the uplink is down (is_connected returns False, or a write raises) the
+    drainer backs off and tries again.
+
+    A reading DynamoDB rejects (e.g. a ValidationException, found by
+    writing the items of a rejected chunk one at a time), or still leaves
+    unprocessed after dead_letter_after passes, goes to the journal's dead
+    letters so it does not hold back the backlog behind it.
+
+    On a metered uplink (is_metered returns True, e.g. after the LTE
+    failover) and given send_frame, the backlog goes out instead as one
+    compact telemetry frame (see telemetry.encode_frame) of up to
+    metered_batch_size readings every metered_interval seconds, and is
+    acknowledged once send_frame returns.
+    """
+
+    def __init__(self, journal, dynamodb, table_name="Tanks", batch_size=500, concurrency=4,
+                 is_connected=None, idle_interval=1.0, max_backoff=60.0, max_retries=5,
+                 key_names=("PK", "SK"), send_frame=None, is_metered=None, metered_interval=60.0,
+                 metered_batch_size=5000, dead_letter_after=5):
+        self.journal = journal
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.is_connected = is_connected
+        self.idle_interval = idle_interval
+        self.max_backoff = max_backoff
+        self.max_retries = max_retries
+        self.key_names = key_names
+        self.send_frame = send_frame
+        self.is_metered = is_metered
+        self.metered_interval = metered_interval
+        self.metered_batch_size = metered_batch_size
+        self.dead_letter_after = dead_letter_after
+        self.attempts = {}  # Row id -> failed passes, for the rows DynamoDB left unprocessed
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.drained = 0
+        self.failures = 0
+        self.frames = 0
+        self.history = collections.deque()  # (time, count) of recent drains, for the drain rate
+
+    def start(self):
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="journal-drainer", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=10.0):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.pool.shutdown(wait=False)
+
+    def notify(self):
+        # Wake the drainer up early, e.g. when the link comes back
+        self.wakeup.set()
+
+    def drain_rate(self, window=60.0):
+        # Readings per second written to DynamoDB over the last window seconds
+        now = time.monotonic()
+        while self.history and self.history[0][0] < now - window:
+            self.history.popleft()
+        return sum(count for _, count in self.history) / window
+
+    def stats(self):
+        return {
+            "depth": self.journal.depth(),
+            "oldest_age": self.journal.oldest_age(),
+            "drain_rate": self.drain_rate(),
+            "drained": self.drained,
+            "evicted": self.journal.evicted,
+            "failures": self.failures,
+            "dead_lettered": self.journal.dead_letter_count(),
+            "frames": self.frames,
+        }
+
+    def drain_once(self):
+        # Send one batch of the backlog, returns the number of readings drained
+        rows = self.journal.peek(self.batch_size)
+        if not rows:
+            return 0
+        ids_by_key, unkeyed = self._rows_by_key(rows)
+        self._dead_letter(unkeyed, "Item without its primary key")
+        items = coalesce([item for row_id, item in rows if row_id not in unkeyed], self.key_names)
+        chunks = [items[i:i + MAX_BATCH_ITEMS] for i in range(0, len(items), MAX_BATCH_ITEMS)]
+        futures = [self.pool.submit(batch_write, self.dynamodb, self.table_name, chunk, self.max_retries)
+                   for chunk in chunks]
+        unprocessed, pending, rejected = [], [], []
+        error = None
+        for future in futures:
+            try:
+                unprocessed.extend(future.result())
+            except BatchWriteError as e:
+                if is_permanent_error(e.cause):
+                    rejected.extend(e.failed)
+                else:
+                    pending.extend(e.failed)
+                    error = e.cause
+
+        # A rejected chunk does not say which item is wrong: write its items one at a time
+        dead = {}
+        for item in rejected:
+            try:
+                unprocessed.extend(batch_write(self.dynamodb, self.table_name, [item], self.max_retries))
+            except BatchWriteError as e:
+                if is_permanent_error(e.cause):
+                    for row_id in ids_by_key[self._key(item)]:
+                        dead[row_id] = f"Rejected by DynamoDB: {e.cause}"
+                else:
+                    pending.append(item)
+                    error = e.cause
+        for reason in set(dead.values()):
+            self._dead_letter([row_id for row_id, r in dead.items() if r == reason], reason)
+
+        # Rows left unprocessed pass after pass are given up on, like rejected ones
+        retry_ids = {row_id for item in pending for row_id in ids_by_key[self._key(item)]}
+        unprocessed_ids = [row_id for item in unprocessed for row_id in ids_by_key[self._key(item)]]
+        exhausted = []
+        for row_id in unprocessed_ids:
+            self.attempts[row_id] = self.attempts.get(row_id, 0) + 1
+            if self.attempts[row_id] >= self.dead_letter_after:
+                exhausted.append(row_id)
+        self._dead_letter(exhausted, f"Unprocessed after {self.dead_letter_after} passes")
+
+        failed_ids = retry_ids | set(unprocessed_ids) | set(dead) | unkeyed
+        written = [row_id for row_id, _ in rows if row_id not in failed_ids]
+        self.journal.ack(written)
+        for row_id in written:
+            self.attempts.pop(row_id, None)
+        self.drained += len(written)
+        DRAINED.inc(len(written))
+        self.history.append((time.monotonic(), len(written)))
+        if error is not None or unprocessed_ids:
+            self.failures += 1
+            DRAIN_ERRORS.inc()
+        if error is not None:
+            # The written chunks are acked, the others stay at the head of the journal for the next pass
+            raise error
+        return len(written) + len(dead) + len(exhausted) + len(unkeyed)
+
+    def drain_frame(self):
+        # Send one telemetry frame of the backlog through send_frame, returns the number of readings drained
+        rows = self.journal.peek(self.metered_batch_size)
+        if not rows:
+            return 0
+        # A frame carries one site, the readings of another (there should not be any) wait for the next frame
+        site = rows[0][1].get("Site")
+        rows = [(row_id, item) for row_id, item in rows if item.get("Site") == site]
+        try:
+            frame = encode_frame(coalesce([item for _, item in rows], self.key_names))
+        except Exception as e:
+            # Leave out the readings that can not be encoded, and send the others
+            broken = [row_id for row_id, item in rows if not _encodes(item)]
+            if not broken:
+                raise
+            self._dead_letter(broken, f"Can not be encoded: {e}")
+            return len(broken) + self.drain_frame()
+        ids = [row_id for row_id, _ in rows]
+        try:
+            self.send_frame(frame)
+        except Exception:
+            self.failures += 1
+            DRAIN_ERRORS.inc()
+            raise
+        self.journal.ack(ids)
+        self.frames += 1
+        self.drained += len(ids)
+        DRAINED.inc(len(ids))
+        self.history.append((time.monotonic(), len(ids)))
+        return len(ids)
+
+    def _key(self, item):
+        return tuple(item[k] for k in self.key_names)
+
+    def _rows_by_key(self, rows):
+        # ({key: row ids}, ids of the rows without a key), several rows share a key before coalescing
+        ids_by_key = {}
+        unkeyed = set()
+        for row_id, item in rows:
+            try:
+                ids_by_key.setdefault(self._key(item), []).append(row_id)
+            except (KeyError, TypeError):
+                unkeyed.add(row_id)
+        return ids_by_key, unkeyed
+
+    def _dead_letter(self, ids, reason):
+        if not ids:
+            return
+        log.error("Moving %d readings to the dead letters: %s", len(ids), reason)
+        self.journal.dead_letter(list(ids), reason)
+        for row_id in ids:
+            self.attempts.pop(row_id, None)
+        DEAD_LETTERED.inc(len(ids))
+
+    def _metered(self):
+        return self.send_frame is not None and self.is_metered is not None and self.is_metered()
+
+    def _run(self):
+        backoff = self.idle_interval
+        while not self.stopping:
+            if self.is_connected is not None and not self.is_connected():
+                self._wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            metered = self._metered()
+            try:
+                drained = self.drain_frame() if metered else self.drain_once()
+            except Exception as e:
+                log.warning("Error draining journal: %s", e)
+                self._wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = self.idle_interval
+            if metered and drained < self.metered_batch_size:
+                # Caught up: the next frame waits for a full interval of readings
+                self._wait(self.metered_interval)
+            elif drained == 0:
+                self._wait(self.idle_interval)
+
+    def _wait(self, seconds):
+        self.wakeup.wait(seconds)
+        self.wakeup.clear()
@@ -0,0 +1,76 @@
+from collections import namedtuple
+
+import numpy as np
+
+from geometry import geometry_cache
+
+G = 9.81  # Acceleration due to gravity in m/s^2
+DEFAULT_SCALING_FACTOR = 0.5  # Calibration factor applied to the hydrostatic height
+
+# Status codes returned per tank
+STATUS_OK = 0
+STATUS_NO_SENSOR = 1  # Pressure missing (NaN)
+STATUS_NEGATIVE = 2  # Computed volume below zero
+STATUS_OVERFLOW = 3  # Computed volume above the tank capacity
+STATUS_BAD_CONFIG = 4  # Density, radius or height not strictly positive
+
+STATUS_NAMES = {
+    STATUS_OK: "Connected",
+    STATUS_NO_SENSOR: "No Sensor Connected",
+    STATUS_NEGATIVE: "Below Range",
+    STATUS_OVERFLOW: "Above Range",
+    STATUS_BAD_CONFIG: "Invalid Configuration",
+}
+
+# alarm_states and forecast are filled in by the acquisition service,
+# see alarms.AlarmEngine and forecasting.ConsumptionForecaster
+LevelResult = namedtuple("LevelResult", "heights volumes capacities levels valid status alarm_states forecast",
+                         defaults=(None, None))
+
+
+def compute_levels(pressures, densities, radii, heights, scaling_factors=DEFAULT_SCALING_FACTOR,
+                   geometries=None):
+    """Compute liquid height, volume and level for a whole fleet of tanks.
+
+    All arguments are scalars or arrays broadcastable to the same shape, one
+    entry per tank; a missing pressure is NaN. Without geometries every tank
+    is a vertical cylinder of the given radius and height. Otherwise
+    geometries is a TankGeometry, or one per tank, and volumes come from the
+    precomputed lookup tables of geometry.geometry_cache.
+
+    Readings that fall outside the tank are kept in the result and flagged
+    through status and valid rather than dropped, levels are only
+    meaningful where valid is True.
+    """
+    pressures = np.asarray(pressures, dtype=np.float64)
+    densities = np.asarray(densities, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)
+    heights = np.asarray(heights, dtype=np.float64)
+    scaling_factors = np.asarray(scaling_factors, dtype=np.float64)
+    pressures, densities, radii, heights, scaling_factors = np.broadcast_arrays(
+        pressures, densities, radii, heights, scaling_factors)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        liquid_heights = pressures / (densities * G) * scaling_factors
+        if geometries is None:
+            areas = np.pi * radii ** 2
+            capacities = areas * heights
+            volumes = areas * liquid_heights
+            below = volumes < 0
+            above = volumes > capacities
+        else:
+            volumes, capacities, max_levels = geometry_cache.volumes(liquid_heights, geometries)
+            below = liquid_heights < 0
+            above = liquid_heights > max_levels
+            # The lookup table clamps, so out of range volumes are reported as NaN
+            volumes = np.where(below | above, np.nan, volumes)
+        levels = volumes / capacities
+
+    status = np.zeros(pressures.shape, dtype=np.int8)
+    status[below] = STATUS_NEGATIVE
+    status[above] = STATUS_OVERFLOW
+    status[(densities <= 0) | (radii <= 0) | (heights <= 0)] = STATUS_BAD_CONFIG
+    status[np.isnan(pressures)] = STATUS_NO_SENSOR
+    valid = status == STATUS_OK
+
+    return LevelResult(liquid_heights, volumes, capacities, levels, valid, status)
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+from instrumentation import metrics
+
+log = logging.getLogger(__name__)
+
+FAILOVER_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)  # Seconds, probes run about every second
+
+PROBE_SECONDS = metrics.histogram("link_probe_seconds", "Round-trip time of a successful uplink probe")
+PROBE_FAILURES = metrics.counter("link_probe_failures_total", "Uplink probes that got no answer")
+LINK_DOWNS = metrics.counter("link_down_total", "Times the uplink was declared down")
+FAILOVERS = metrics.counter("link_failovers_total", "Failovers (on_down) run after the uplink went down")
+FAILOVER_ERRORS = metrics.counter("link_failover_errors_total", "Failovers that raised")
+DETECTION_SECONDS = metrics.histogram("link_detection_seconds", "First failed probe -> link declared down",
+                                      buckets=FAILOVER_BUCKETS)
+FAILOVER_SECONDS = metrics.histogram("link_failover_seconds", "First failed probe -> failover finished",
+                                     buckets=FAILOVER_BUCKETS)
+
+# Probes open a TCP connection to public DNS servers, no subprocess involved
+PROBE_TARGETS = [("8.8.8.8", 53), ("1.1.1.1", 53)]
+
+# Interfaces billed by volume (LTE modem, PPP dial-up, USB tethering), by name prefix
+METERED_INTERFACES = ("wwan", "ppp", "usb")
+
+LINK_UNKNOWN = "unknown"
+LINK_UP = "up"
+LINK_DOWN = "down"
+
+
+def default_route_interface(route_table="/proc/net/route"):
+    # Interface of the IPv4 default route with the lowest metric, None if there is none
+    try:
+        with open(route_table) as f:
+            rows = [line.split() for line in f.readlines()[1:]]
+    except OSError:
+        return None
+    routes = [(int(row[6]), row[0]) for row in rows if len(row) > 7 and row[1] == "00000000" and row[7] == "00000000"]
+    return min(routes)[1] if routes else None
+
+
+class LinkManager:
+    """Long-lived uplink monitor running on an asyncio event loop.
+
+    Every probe tries all targets concurrently with non-blocking sockets
+    and succeeds as soon as one answers within probe_timeout. The link is
+    declared down after down_after failed probes in a row and up again
+    after up_after good ones, so a single lost probe does not flap the
+    state. While the link is down probes back off exponentially up to
+    max_backoff.
+
+    Subscribers are called with (state, manager) on every state change,
+    from the event loop thread, and must return quickly. on_down, if given,
+    runs in a worker thread when the link goes down (e.g. LTE failover).
+    """
+
+    def __init__(self, targets=PROBE_TARGETS, interface=None, probe_timeout=0.5, interval=1.0,
+                 max_backoff=30.0, down_after=3, up_after=2, on_down=None):
+        self.targets = targets
+        self.interface = interface  # Probe through this interface only, e.g. "wlan0" (needs root)
+        self.probe_timeout = probe_timeout
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.down_after = down_after
+        self.up_after = up_after
+        self.on_down = on_down
+        self.state = LINK_UNKNOWN
+        self.subscribers = []
+        self.successes = 0  # Consecutive good probes
+        self.failures = 0  # Consecutive failed probes
+        self.first_failure = None  # monotonic time of the first failure of the current streak
+        self.loop = None
+        self.task = None
+        self.thread = None
+        self.metrics = {
+            "probes": 0,
+            "probe_failures": 0,
+            "transitions": 0,
+            "last_probe_rtt": None,
+            "last_detection_latency": None,  # First failed probe -> link declared down
+            "last_failover_latency": None,  # First failed probe -> on_down finished
+        }
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    @property
+    def is_up(self):
+        return self.state != LINK_DOWN
+
+    @property
+    def is_metered(self):
+        # True while traffic leaves through a metered interface, e.g. after the LTE failover
+        interface = self.interface or default_route_interface()
+        return interface is not None and interface.startswith(METERED_INTERFACES)
+
+    async def _connect(self, target):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            if self.interface:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, self.interface.encode())
+            await loop.sock_connect(sock, target)
+        finally:
+            sock.close()
+
+    async def probe(self):
+        # True if any target accepts a connection within probe_timeout
+        start = time.monotonic()
+        tasks = [asyncio.ensure_future(self._connect(target)) for target in self.targets]
+        ok = False
+        try:
+            for future in asyncio.as_completed(tasks, timeout=self.probe_timeout):
+                try:
+                    await future
+                    ok = True
+                    break
+                except OSError:
+                    continue
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self.metrics["probes"] += 1
+        if ok:
+            self.metrics["last_probe_rtt"] = time.monotonic() - start
+            PROBE_SECONDS.observe(self.metrics["last_probe_rtt"])
+        else:
+            self.metrics["probe_failures"] += 1
+            PROBE_FAILURES.inc()
+        return ok
+
+    async def run(self):
+        while True:
+            ok = await self.probe()
+            await self._update(ok)
+            if self.state == LINK_DOWN:
+                # Back off while down, but never beyond max_backoff
+                delay = min(self.interval * 2 ** max(self.failures - self.down_after, 0), self.max_backoff)
+            else:
+                delay = self.interval
+            await asyncio.sleep(delay)
+
+    async def _update(self, ok):
+        now = time.monotonic()
+        if ok:
+            self.successes += 1
+            self.failures = 0
+            self.first_failure = None
+            if self.state != LINK_UP and (self.state == LINK_UNKNOWN or self.successes >= self.up_after):
+                self._set_state(LINK_UP)
+            return
+
+        self.failures += 1
+        self.successes = 0
+        if self.first_failure is None:
+            self.first_failure = now
+        if self.state != LINK_DOWN and (self.state == LINK_UNKNOWN or self.failures >= self.down_after):
+            detection = now - self.first_failure
+            self.metrics["last_detection_latency"] = detection
+            LINK_DOWNS.inc()
+            DETECTION_SECONDS.observe(detection)
+            self._set_state(LINK_DOWN)
+            if self.on_down is not None:
+                started = self.first_failure
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self.on_down)
+                except Exception as e:
+                    FAILOVER_ERRORS.inc()
+                    log.error("Failover error: %s", e)
+                failover = time.monotonic() - started
+                self.metrics["last_failover_latency"] = failover
+                FAILOVERS.inc()
+                FAILOVER_SECONDS.observe(failover)
+                log.warning("Failover done %.1f s after the first failed probe (link down detected after %.1f s)",
+                            failover, detection)
+
+    def _set_state(self, state):
+        log.info("Link %s -> %s", self.state, state)
+        self.state = state
+        self.metrics["transitions"] += 1
+        for callback in self.subscribers:
+            try:
+                callback(state, self)
+            except Exception as e:
+                log.warning("Link subscriber error: %s", e)
+
+    def start(self):
+        # Run the manager on its own event loop in a daemon thread
+        if self.thread is not None:
+            return
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.run())
+        self.thread = threading.Thread(target=self._run_loop, name="link-manager", daemon=True)
+        self.thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.loop.close()
+
+    def stop(self, timeout=5.0):
+        if self.thread is None:
+            return
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(timeout)
+        self.thread = None
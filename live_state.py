@@ -0,0 +1,159 @@
+"""Latest state of every tank of a running TankService, for clients in other processes.
+
+StateRecorder is a service listener that keeps the last reading of each
+channel and renders it as JSON; service.py serves it at /state next to
+/metrics (--metrics-port). ServiceClient polls that endpoint and hands
+the channels that changed to its listeners as (samples, LevelResult),
+exactly like TankService.add_listener, so the GUI can attach to the
+service running on the box instead of sampling the sensors a second time.
+"""
+import json
+import logging
+import threading
+
+import numpy as np
+
+from acquisition import Sample
+from forecasting import Forecast
+from instrumentation import DEFAULT_METRICS_PORT
+from level_engine import LevelResult
+
+log = logging.getLogger(__name__)
+
+STATE_PATH = "/state"
+DEFAULT_STATE_URL = f"http://127.0.0.1:{DEFAULT_METRICS_PORT}{STATE_PATH}"
+DEFAULT_POLL_INTERVAL = 1.0
+
+_SAMPLE_FIELDS = ("values", "sample_status", "timestamps")
+_RESULT_FIELDS = ("heights", "volumes", "capacities", "levels", "valid", "status", "alarm_states")
+_FORECAST_FIELDS = ("time_to_empty", "time_to_empty_low", "time_to_empty_high", "time_to_full")
+
+
+class StateRecorder:
+    """Service listener keeping the last sample, level result and forecast of each channel."""
+
+    def __init__(self, channels):
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.columns = {name: np.full(count, np.nan) for name in _SAMPLE_FIELDS + _RESULT_FIELDS + _FORECAST_FIELDS}
+        self.lock = threading.Lock()
+
+    def __call__(self, samples, result):
+        rows = np.array([self.rows[sample.channel] for sample in samples], dtype=np.intp)
+        with self.lock:
+            self.columns["values"][rows] = [sample.value for sample in samples]
+            self.columns["sample_status"][rows] = [sample.status for sample in samples]
+            self.columns["timestamps"][rows] = [sample.timestamp for sample in samples]
+            for name in _RESULT_FIELDS:
+                self.columns[name][rows] = getattr(result, name)
+            if result.forecast is not None:
+                for name in _FORECAST_FIELDS:
+                    self.columns[name][rows] = getattr(result.forecast, name)
+
+    def render(self):
+        # JSON of every channel, NaN where a channel has no reading yet
+        with self.lock:
+            state = {name: column.tolist() for name, column in self.columns.items()}
+        return json.dumps(dict(state, channels=self.channels)).encode()
+
+    def route(self):
+        # (content type, body), for MetricsServer routes
+        return "application/json", self.render()
+
+
+def decode_state(body):
+    # (samples, LevelResult) of the channels that have a reading in a /state body
+    state = json.loads(body)
+    columns = {name: np.array(values, dtype=np.float64) for name, values in state.items() if name != "channels"}
+    seen = ~np.isnan(columns["timestamps"])
+    channels = [channel for channel, keep in zip(state["channels"], seen) if keep]
+    columns = {name: column[seen] for name, column in columns.items()}
+    samples = [Sample(channel, value, int(status), timestamp) for channel, value, status, timestamp
+               in zip(channels, columns["values"].tolist(), columns["sample_status"].tolist(),
+                      columns["timestamps"].tolist())]
+    unknown = np.full(len(channels), np.nan)  # Not served, the GUI only shows the times
+    forecast = Forecast(rates=unknown, rate_errors=unknown, volumes=unknown,
+                        refilled=np.zeros(len(channels), dtype=bool),
+                        **{name: columns[name] for name in _FORECAST_FIELDS})
+    result = LevelResult(heights=columns["heights"], volumes=columns["volumes"], capacities=columns["capacities"],
+                         levels=columns["levels"], valid=columns["valid"].astype(bool),
+                         status=columns["status"].astype(np.int64),
+                         alarm_states=columns["alarm_states"].astype(np.int64), forecast=forecast)
+    return samples, result
+
+
+def _subset(samples, result, keep):
+    # The rows of a pass where keep is True
+    indices = np.flatnonzero(keep)
+    forecast = Forecast(*(field[indices] for field in result.forecast))
+    fields = [field[indices] for field in result[:-1]]
+    return [samples[i] for i in indices], LevelResult(*fields, forecast)
+
+
+class ServiceClient:
+    """Polls the /state endpoint of a running service every interval seconds on a background thread.
+
+    Listeners get (samples, LevelResult) of the channels with a new reading
+    since the previous poll, from the polling thread.
+    """
+
+    def __init__(self, url=DEFAULT_STATE_URL, interval=DEFAULT_POLL_INTERVAL, timeout=2.0):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.channels = []
+        self.listeners = []
+        self.last_timestamps = {}
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+        self.errors = 0
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def fetch(self):
+        # (samples, LevelResult) of every channel with a reading, raises OSError when the service is unreachable
+        import urllib.request  # Only clients of a running service need it
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            body = response.read()
+        samples, result = decode_state(body)
+        self.channels = json.loads(body)["channels"]
+        return samples, result
+
+    def poll(self):
+        samples, result = self.fetch()
+        new = np.array([self.last_timestamps.get(sample.channel) != sample.timestamp for sample in samples],
+                       dtype=bool)
+        if not new.any():
+            return 0
+        samples, result = _subset(samples, result, new)
+        for sample in samples:
+            self.last_timestamps[sample.channel] = sample.timestamp
+        for callback in self.listeners:
+            callback(samples, result)
+        return len(samples)
+
+    def start(self):
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="service-client", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def _run(self):
+        while not self.stopping:
+            try:
+                self.poll()
+            except OSError as e:
+                self.errors += 1
+                log.warning("Tank service unreachable at %s: %s", self.url, e)
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
@@ -0,0 +1,177 @@
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import serial
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PORT = "/dev/ttyUSB2"
+DEFAULT_BAUDRATE = 115200
+
+FINAL_OK = ("OK", "CONNECT")
+FINAL_ERROR = ("ERROR", "+CME ERROR", "+CMS ERROR", "NO CARRIER", "NO DIALTONE", "BUSY")
+
+LINE_END = re.compile(rb"[\r\n]")
+
+# +CREG / +CEREG registration states
+REGISTRATION_STATES = {
+    0: "not registered",
+    1: "registered, home network",
+    2: "searching",
+    3: "registration denied",
+    4: "unknown",
+    5: "registered, roaming",
+}
+
+
+class ModemError(Exception):
+    def __init__(self, command, message, lines=None):
+        super().__init__(f"{command}: {message}")
+        self.command = command
+        self.lines = lines or []
+
+
+class ModemTimeout(ModemError):
+    pass
+
+
+class Modem:
+    """Persistent AT-command session with the LTE modem.
+
+    The serial port stays open and is owned by one worker thread that runs
+    queued commands one at a time. Each command returns as soon as the
+    modem answers with a final result code (OK, ERROR, +CME ERROR, ...)
+    rather than after a fixed sleep, and fails with ModemTimeout if no
+    answer comes within its timeout. Lines that arrive between commands
+    are unsolicited result codes and are handed to on_urc.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, baudrate=DEFAULT_BAUDRATE, default_timeout=5.0, on_urc=None):
+        self.port = port
+        self.baudrate = baudrate
+        self.default_timeout = default_timeout
+        self.on_urc = on_urc
+        self.serial = None
+        self.commands = queue.Queue()
+        self.thread = None
+        self.buffer = b""
+        self.last_signal = None
+        self.last_registration = None
+
+    def open(self):
+        if self.serial is not None:
+            return
+        self.serial = serial.Serial(self.port, self.baudrate, timeout=0.05)
+        self.thread = threading.Thread(target=self._run, name="modem", daemon=True)
+        self.thread.start()
+
+    def close(self):
+        if self.serial is None:
+            return
+        self.commands.put(None)
+        self.thread.join(5.0)
+        self.serial.close()
+        self.serial = None
+        self.thread = None
+
+    def submit(self, command, timeout=None):
+        # Queue a command, the Future resolves to its response lines (without the final OK)
+        self.open()
+        future = Future()
+        self.commands.put((command, timeout or self.default_timeout, future))
+        return future
+
+    def command(self, command, timeout=None):
+        return self.submit(command, timeout).result()
+
+    def _readline(self, deadline):
+        # One stripped line, or None once the deadline is reached
+        # Echoes end with a bare CR, answers with CR LF: either ends a line
+        while True:
+            match = LINE_END.search(self.buffer)
+            if match:
+                break
+            if time.monotonic() >= deadline:
+                return None
+            self.buffer += self.serial.read(self.serial.in_waiting or 1)
+        line, self.buffer = self.buffer[:match.start()], self.buffer[match.end():]
+        return line.strip().decode(errors="replace")
+
+    def _execute(self, command, timeout):
+        self.serial.write(command.encode() + b"\r\n")
+        deadline = time.monotonic() + timeout
+        lines = []
+        while True:
+            line = self._readline(deadline)
+            if line is None:
+                # Drop whatever is left so a late answer is not read by the next command
+                self.serial.reset_input_buffer()
+                self.buffer = b""
+                raise ModemTimeout(command, f"no answer within {timeout} s", lines)
+            if not line or line == command:
+                continue  # Blank line or command echo
+            if line in FINAL_OK:
+                return lines
+            if line.startswith(FINAL_ERROR):
+                raise ModemError(command, line, lines)
+            lines.append(line)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.commands.get(timeout=0.1)
+            except queue.Empty:
+                self._poll_urcs()
+                continue
+            if item is None:
+                return
+            command, timeout, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self._execute(command, timeout))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _poll_urcs(self):
+        deadline = time.monotonic() + 0.05
+        while True:
+            try:
+                line = self._readline(deadline)
+            except serial.SerialException as e:
+                log.warning("Modem read error: %s", e)
+                return
+            if line is None:
+                return
+            if line and self.on_urc is not None:
+                self.on_urc(line)
+
+    def signal_quality(self):
+        # (RSSI in dBm or None if unknown, bit error rate class or None) from AT+CSQ
+        for line in self.command("AT+CSQ"):
+            match = re.match(r"\+CSQ:\s*(\d+),\s*(\d+)", line)
+            if match:
+                rssi, ber = int(match.group(1)), int(match.group(2))
+                self.last_signal = (-113 + 2 * rssi if rssi != 99 else None, ber if ber != 99 else None)
+                return self.last_signal
+        raise ModemError("AT+CSQ", "unexpected answer")
+
+    def registration(self):
+        # (state code, description) of the EPS registration from AT+CEREG?
+        for line in self.command("AT+CEREG?"):
+            match = re.match(r"\+CEREG:\s*\d+,\s*(\d+)", line)
+            if match:
+                state = int(match.group(1))
+                self.last_registration = (state, REGISTRATION_STATES.get(state, "unknown"))
+                return self.last_registration
+        raise ModemError("AT+CEREG?", "unexpected answer")
+
+    def connect_lte(self, apn):
+        # Define the PDP context and activate it, each step waits for the modem's answer
+        self.command("AT", timeout=2.0)
+        self.command(f'AT+CGDCONT=1,"IP","{apn}"', timeout=5.0)
+        self.command("AT+CGACT=1,1", timeout=30.0)  # Activation can take a while on a weak network
@@ -0,0 +1,99 @@
+import os
+import pty
+import threading
+import time
+import tty
+
+# Default answers of the simulated modem: command -> (response lines, delay in seconds)
+DEFAULT_RESPONSES = {
+    "AT": (["OK"], 0.0),
+    "AT+CSQ": (["+CSQ: 20,99", "OK"], 0.0),
+    "AT+CEREG?": (["+CEREG: 0,1", "OK"], 0.0),
+    "AT+CREG?": (["+CREG: 0,1", "OK"], 0.0),
+    "AT+CGACT=1,1": (["OK"], 0.2),
+}
+
+
+class ModemSimulator:
+    """Fake AT modem behind a pseudo-terminal, for exercising the modem driver without hardware.
+
+    Open sim.port with pyserial (or Modem(port=sim.port)) like a real
+    /dev/ttyUSB device. Commands are echoed, answered from responses
+    (exact match first, then the longest matching prefix, otherwise
+    ERROR) after the configured delay; a None response never answers, to
+    test timeouts. urc() pushes an unsolicited line.
+    """
+
+    def __init__(self, responses=None, echo=True):
+        self.responses = dict(DEFAULT_RESPONSES)
+        self.responses.update(responses or {})
+        self.echo = echo
+        self.received = []
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.lock = threading.Lock()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="modem-sim", daemon=True)
+        self.thread.start()
+
+    def _write(self, lines):
+        with self.lock:
+            os.write(self.master, b"".join(b"\r\n" + line.encode() + b"\r\n" for line in lines))
+
+    def urc(self, line):
+        self._write([line])
+
+    def _answer(self, command):
+        if command in self.responses:
+            return self._entry(self.responses[command])
+        prefixes = [p for p in self.responses if command.startswith(p) and p != "AT"]
+        if prefixes:
+            return self._entry(self.responses[max(prefixes, key=len)])
+        if command.startswith("AT+CGDCONT="):
+            return ["OK"], 0.0
+        return ["ERROR"], 0.0
+
+    @staticmethod
+    def _entry(response):
+        # A None response (never answers) has no delay
+        return (None, 0.0) if response is None else response
+
+    def _run(self):
+        buffer = b""
+        while self.running:
+            try:
+                data = os.read(self.master, 1024)
+            except OSError:
+                return
+            buffer += data
+            while b"\r" in buffer:
+                raw, buffer = buffer.split(b"\r", 1)
+                command = raw.strip(b"\n ").decode(errors="replace")
+                if not command:
+                    continue
+                self.received.append(command)
+                if self.echo:
+                    with self.lock:
+                        os.write(self.master, raw.strip(b"\n ") + b"\r")
+                lines, delay = self._answer(command)
+                if lines is None:
+                    continue
+                if delay:
+                    time.sleep(delay)
+                self._write(lines)
+
+    def close(self):
+        self.running = False
+        os.close(self.slave)
+        os.close(self.master)
+
+
+if __name__ == "__main__":
+    sim = ModemSimulator()
+    print("Simulated modem on", sim.port)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.close()
@@ -1,43 +1,90 @@
-from decimal import Decimal
+import argparse
+import logging
 import sys
-import time
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QLabel, QSizePolicy, QSpacerItem, QGridLayout, QScrollArea, QLineEdit, QComboBox,  
     QFrame)
-from PyQt5.QtGui import QPainter, QColor, QPen, QFont, QIcon
-from PyQt5.QtCore import QRect, QSize, Qt, QTimer
-from sensors import Pressure # type: ignore
-import boto3
+from PyQt5.QtGui import QPainter, QIcon
+from PyQt5.QtCore import QSize, Qt, QObject, pyqtSignal
+from sensors import SENSOR_OK # type: ignore
+from level_engine import DEFAULT_SCALING_FACTOR, STATUS_NAMES, compute_levels
+from fleet_view import FleetModel, FleetView
+from service import REGION, TABLE_NAME, TANK_SHARDS, LazyDynamoDB, TankService
+from live_state import DEFAULT_STATE_URL, ServiceClient
+from geometry import SHAPE_NAMES, VERTICAL, STRAPPING, TankGeometry, geometry_cache, load_strapping_table
+from tank_render import paint_tank
+from alarms import ALARM_STATES, STATE_BY_NAME, STATE_OFFLINE, alarm_state
+from forecasting import forecast_text
+from instrumentation import setup_logging
+from remote_fleet import DEFAULT_POLL_INTERVAL, DEFAULT_TTL, RemoteFleet, RemoteTankCache
+
+log = logging.getLogger("pres")
+
+# Acquisition, computation, history and upload run in the headless service (service.py), the window is one of
+# its clients: by default it attaches to the service running on the box, with --local it runs its own, and with
+# --remote it reads tanks from the Tanks table. Set by the entry point, only a --local window has a service.
+service = None
+
+# Above this many tanks the window shows the virtualized fleet grid instead of one widget per tank
+MAX_TANK_WIDGETS = 8
+
+
+class AcquisitionBridge(QObject):
+    # Carries the samples and results of each acquisition pass to the GUI thread, from
+    # a TankService or a live_state.ServiceClient
+    samplesReady = pyqtSignal(object, object)
+
+    def __init__(self, source):
+        super().__init__()
+        source.add_listener(self.samplesReady.emit)
 
-# Initialize the DynamoDB client
-dynamodb = boto3.resource('dynamodb', region_name='eu-west-3')  
 
-# Define the table
-table = dynamodb.Table('Tanks')
+class RemoteBridge(QObject):
+    # Carries the items of each remote poll to the GUI thread
+    itemsReady = pyqtSignal(object)
 
-# Créez les objets Pressure pour chaque tank
-tank1 = Pressure(channel=0, values=list(range(10, 40)))
-tank2 = Pressure(channel=1) 
-tank3 = Pressure(channel=2) 
-tank4 = Pressure(channel=3) 
+    def __init__(self, fleet):
+        super().__init__()
+        fleet.add_listener(self.itemsReady.emit)
 
-# Utiliser une liste pour contenir les objets Pressure
-pressure_objects = [tank1, tank2, tank3, tank4]
 
 class MainWindow(QWidget):
-    def __init__(self):
+    # Shows the passes of service (in this process) or client (attached to a running service),
+    # or the tanks of remote_fleet
+    def __init__(self, service=None, client=None, remote_fleet=None):
         super().__init__()
         self.setWindowTitle("Tank Level Monitoring System")
         self.setGeometry(0, 0, 700, 350)  # Set initial size
         # self.setWindowFlags(Qt.FramelessWindowHint)  # Enlever la barre en haut
         self.setWindowIcon(QIcon('IrWise.png'))
-        self.initUI()
+        if remote_fleet is not None:
+            self.initRemoteUI(remote_fleet)
+            self.bridge = RemoteBridge(remote_fleet)
+            self.bridge.itemsReady.connect(self.onItems)
+            return
+        if service is not None:
+            self.initUI([source.channel for source in service.sources], service.sources)
+        else:
+            # Sensors belong to the service, the tanks can not be configured from here
+            self.initUI(client.channels, [None] * len(client.channels))
 
-    def initUI(self):
+        self.bridge = AcquisitionBridge(service if service is not None else client)
+        self.bridge.samplesReady.connect(self.onSamples)
+
+    def initUI(self, channels, pressure_objects):
         self.layout = QHBoxLayout(self)
  
         # Create and add multiple tank widgets
         self.tank_widgets = []
+        self.fleet_model = None
+        if len(channels) > MAX_TANK_WIDGETS:
+            # Large sites: one model for every tank, only the visible ones are painted
+            self.fleet_model = FleetModel(channels)
+            self.fleet_view = FleetView(self.fleet_model)
+            self.layout.addWidget(self.fleet_view)
+            self.tank_widgets_by_channel = {}
+            return
+
         for i , pressure_obj in enumerate(pressure_objects):  # Adjusted to fit 2x2 grid
             #pressure_obj = Pressure(channel=i)  # Ici, on crée un objet Pressure avec un channel différent pour chaque réservoir
             tank_widget = CylinderWidget(tank_name=f"Tank {i + 1}", pressure_obj=pressure_obj)
@@ -47,6 +94,50 @@ class MainWindow(QWidget):
             self.layout.setSpacing(0)
             self.tank_widgets.append(tank_widget)
 
+        self.tank_widgets_by_channel = dict(zip(channels, self.tank_widgets))
+
+    def initRemoteUI(self, remote_fleet):
+        # One row of tank widgets per site, scrolled when they do not fit
+        self.layout = QHBoxLayout(self)
+        self.fleet_model = None
+        scroll_area = QScrollArea()
+        scroll_area.setWidgetResizable(True)
+        content = QWidget()
+        grid = QGridLayout(content)
+        grid.setSpacing(0)
+        self.tank_widgets = []
+        self.tank_widgets_by_key = {}
+        rows = {}
+        columns = {}
+        for site, tank in remote_fleet.cache.keys:
+            row = rows.setdefault(site, len(rows))
+            column = columns[site] = columns.get(site, -1) + 1
+            tank_widget = CylinderWidget(tank_name=f"Site {site} Tank {tank + 1}", pressure_obj=None)
+            grid.addWidget(tank_widget, row, column)
+            self.tank_widgets.append(tank_widget)
+            self.tank_widgets_by_key[(site, tank)] = tank_widget
+        scroll_area.setWidget(content)
+        self.layout.addWidget(scroll_area)
+
+    def onItems(self, items):
+        for key, item in items.items():
+            tank_widget = self.tank_widgets_by_key.get(key)
+            if tank_widget is not None:
+                tank_widget.showItem(item)
+
+    def onSamples(self, samples, result):
+        if self.fleet_model is not None:
+            self.fleet_model.updateResult(samples, result)
+            return
+        forecast = result.forecast
+        for i, sample in enumerate(samples):
+            tank_widget = self.tank_widgets_by_channel.get(sample.channel)
+            if tank_widget is None:
+                continue
+            tank_widget.updateReading(sample, bool(result.valid[i]), float(result.volumes[i]), float(result.levels[i]),
+                                      int(result.status[i]), int(result.alarm_states[i]))
+            tank_widget.showForecast(float(forecast.time_to_empty[i]), float(forecast.time_to_empty_low[i]),
+                                     float(forecast.time_to_empty_high[i]), float(forecast.time_to_full[i]))
 
 class CylinderWidget(QWidget):
     def __init__(self,tank_name, pressure_obj):
@@ -60,17 +151,16 @@ class CylinderWidget(QWidget):
         self.pressure = 0.0  # Initial pressure
         self.pressure_obj = pressure_obj
         self.height = 3.0 # Tank Height
-        self.index=0 # Initialize index for cycling through values
-        self.values = self.pressure_obj.get_value()  # Récupère les valeurs de pression
-        print(f"Pressure Values: {self.values}")
-        self.pressure=self.pressure_obj.get_value()
+        self.scaling_factor = DEFAULT_SCALING_FACTOR  # Adjust this factor as needed to calibrate
+        self.shape = VERTICAL  # Tank shape, see geometry.SHAPE_NAMES
+        self.strapping_path = ""  # CSV calibration table, for the strapping shape
+        self.geometry = TankGeometry(self.shape, self.radius, self.height)
+        self.timestamp = None  # Acquisition time of the current pressure
+        self.alarm_state = STATE_OFFLINE  # Alarm state from the service, see alarms.AlarmEngine
+        self.label_color = None  # Colour the labels currently have
+        # Readings are pushed by the acquisition service through updateReading
         self.initUI()
 
-        # Set up a timer to update the pressure periodically
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.updatePressure)
-        self.timer.start(10000)  # Update every 10 seconds
-
     def initUI(self):
         self.layout = QVBoxLayout(self)
 
@@ -85,6 +175,9 @@ class CylinderWidget(QWidget):
         self.info_layout.addWidget(self.volume_label,alignment=Qt.AlignCenter)
         self.level_label = QLabel("Level: 0.0 %")
         self.info_layout.addWidget(self.level_label,alignment=Qt.AlignCenter)
+        self.forecast_label = QLabel("Empty in -")
+        self.forecast_label.setStyleSheet("font-size: 11px")
+        self.info_layout.addWidget(self.forecast_label,alignment=Qt.AlignCenter)
         
         self.layout.addLayout(self.info_layout)
         self.setLayout(self.layout)
@@ -99,50 +192,65 @@ class CylinderWidget(QWidget):
         self.parameter_btn.setFixedSize(90, 30)
         self.parameter_btn.clicked.connect(self.showSettings)
         self.button_layout.addWidget(self.parameter_btn, alignment=Qt.AlignCenter)
+        # A remote tank is configured on the box that reads it
+        self.parameter_btn.setVisible(self.pressure_obj is not None)
 
         self.layout.addLayout(self.button_layout)
         self.setLayout(self.layout)
 
-    def update_pressure(self):
-        # Récupère la valeur de pression du capteur
-        pressure = self.pressure_obj.get_value()
-        print(f"Pressure: {pressure}")
-        
-        if pressure != "no sensor connected" and pressure is not None:
-            return pressure
+    def updateReading(self, sample, valid, volume, tank_level, status, state):
+        # Show a reading computed by the acquisition service, state is its alarm state
+        log.debug("New pressure %s on channel %s", sample.value, sample.channel)
+        self.timestamp = sample.timestamp
+        # Vérifier si la nouvelle pression est valide
+        if sample.status == SENSOR_OK:
+            self.pressure = sample.value
+            if valid:
+                self.showLevel(tank_level, volume, state)
+            else:
+                log.debug("Volume %s is out of expected range (%s)", volume, STATUS_NAMES[status])
         else:
-            # En cas d'absence de données valides, affichez un message d'erreur
+            # Si aucun capteur n'est connecté, afficher un message d'erreur
             self.volume_label.setText("No sensor connected")
             self.level_label.setText("Level: - %")
-            return None
 
-    def updatePressure(self):
-        # Mettre à jour la pression depuis le capteur
-        new_pressure = self.pressure_obj.get_value()
-        print(f"New Pressure: {new_pressure}")
-        # Vérifier si la nouvelle pression est valide
-        if new_pressure != "no sensor connected":
-            self.pressure = new_pressure
-            self.updateCalculations()
-            self.updateLabelColors()
-            self.tank_display.update()
+    def showItem(self, item):
+        # Show a Tanks table item (remote mode), its Alarm attribute is the alarm state of the box
+        self.timestamp = item["timestamp"]
+        if item["Status"] == "Connected":
+            self.pressure = float(item["Value"])
+            self.showLevel(float(item["TankLevelPercentage"]) / 100, float(item["Volume"]),
+                           STATE_BY_NAME.get(item.get("Alarm")))
         else:
-            # Si aucun capteur n'est connecté, afficher un message d'erreur
+            self.alarm_state = STATE_OFFLINE
             self.volume_label.setText("No sensor connected")
             self.level_label.setText("Level: - %")
-
-        
+            self.tank_display.refresh()
+        self.forecast_label.setText(f"Updated {item['timestamp'][11:19]} UTC")
+
+    def showLevel(self, tank_level, volume, state=None):
+        self.tank_level = tank_level  # Update tank level as a percentage
+        self.volume = volume  # Update volume
+        # Without the service (e.g. a settings change) the state comes from the level alone
+        self.alarm_state = alarm_state(tank_level) if state is None else state
+        self.volume_label.setText(f"Volume: {self.volume:.2f} m³")
+        self.level_label.setText(f"Level: {self.tank_level * 100:.2f} %")
+        self.updateLabelColors()
+        self.tank_display.refresh()  # Trigger repaint
+
+    def showForecast(self, time_to_empty, time_to_empty_low, time_to_empty_high, time_to_full):
+        # Forecast of the service, see forecasting.ConsumptionForecaster
+        text = forecast_text(time_to_empty, time_to_empty_low, time_to_empty_high, time_to_full)
+        if text != self.forecast_label.text():
+            self.forecast_label.setText(text)
 
     def updateLabelColors(self):
-        if 0 <= self.tank_level < 0.26:
-            color = "#BA1301"
-        elif 0.25 <= self.tank_level < 0.51:
-            color = "#E4670B"
-        elif 0.5 <= self.tank_level < 0.76:
-            color = "#EBA104"
-        elif 0.75 <= self.tank_level <= 1.0:
-            color = "#94C816"
-        
+        # Restyling the labels is costly, only do it when the alarm state changes colour
+        color = ALARM_STATES[self.alarm_state][1]
+        if color is None or color == self.label_color:
+            return
+        self.label_color = color
+
         self.volume_label.setStyleSheet(f"font-size: 12px;color: {color}")
         self.level_label.setStyleSheet(f"font-size: 12px;color: {color}")
 
@@ -152,251 +260,50 @@ class CylinderWidget(QWidget):
 
     def setTankLevel(self, level):
         self.tank_level = level
-        self.tank_display.update()  # Trigger repaint
+        self.alarm_state = alarm_state(level)
+        self.tank_display.refresh()  # Trigger repaint
 
     def updateCalculations(self):
-        # Perform calculations based on current pressure, density, and radius
-        g = 9.81  # Acceleration due to gravity in m/s^2
-        scaling_factor = 0.5  # Adjust this factor as needed to calibrate
-
-        # Ensure pressure is a single value (not a list)
+        # Recompute the displayed level after a settings change, the service stores the next readings
         if isinstance(self.pressure, list):
             self.pressure = self.pressure[0] if isinstance(self.pressure[0], (int, float)) else None
 
-        print(f"Debug - Current Pressure: {self.pressure}")
-    
+        log.debug("Current pressure %s", self.pressure)
+
         if self.pressure is not None:
-            try:
-                # Apply the scaling factor to reduce the calculated height
-                height = (float(self.pressure) / (self.density * g)) * scaling_factor
-                print(f"Debug - Calculated Height with Scaling: {height}")
-            
-                area = 3.14159 * (self.radius ** 2)  # Calculate the area of the tank base
-                tank_volume = area * self.height  # Assuming tank height is 3 meters
-                volume = area * height  # Calculate the volume of the liquid
-
-                print(f"Debug - Calculated Volume: {volume}, Tank Volume: {tank_volume}")
-
-                if volume >= 0 and volume <= tank_volume:
-                    self.tank_level = volume / tank_volume  # Update tank level as a percentage
-                    self.volume = volume  # Update volume
-                    self.volume_label.setText(f"Volume: {self.volume:.2f} m³")
-                    self.level_label.setText(f"Level: {self.tank_level * 100:.2f} %")
-                    self.tank_display.update()  # Trigger repaint
-
-                    # Store updated data in DynamoDB
-                    self.store_data_in_dynamodb()
-
-                else:
-                    print("Debug - Volume is out of expected range.")
-            except ValueError:
-                print("Error in calculating height.")
+            # Perform calculations based on current pressure, density, and radius
+            result = compute_levels(self.pressure, self.density, self.radius, self.height, self.scaling_factor,
+                                    geometries=self.geometry)
+            volume = float(result.volumes)
+
+            if result.valid:
+                self.showLevel(float(result.levels), volume)
+            else:
+                log.debug("Volume %s is out of expected range (%s)", volume, STATUS_NAMES[int(result.status)])
         else:
             # Handle the case where pressure is not a number
             self.volume_label.setText("No sensor connected")
             self.level_label.setText("Level: - %")
 
-    def store_data_in_dynamodb(self):
-        # Convert float values to Decimal for DynamoDB
-        tank_number = self.pressure_obj.channel + 1  # Adjust to ensure Tank#1 is 0001, Tank#2 is 0002, etc.
-        sk_value = f"{tank_number:04d}"
-        data = {
-            "PK": "Tank#1",
-            "SK": sk_value,  # Use channel as unique identifier for SK
-            "TankNumber": tank_number,
-            "Value": Decimal(str(self.pressure)) if self.pressure is not None else Decimal("0.0"),
-            "Status": "Connected" if self.pressure is not None else "No Sensor Connected",
-            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),  # Current timestamp in ISO 8601 format
-            "Volume": Decimal(str(round(self.volume, 2))) if self.volume is not None else Decimal("0.0"),
-            "TankLevelPercentage": Decimal(str(round(self.tank_level * 100, 2))) if self.tank_level is not None else Decimal("0.0")
-        }
-
-        # Insert data into DynamoDB
-        try:
-            response = table.put_item(Item=data)
-            print("Data stored successfully:", response)
-        except Exception as e:
-            print("Error storing data:", e)        
-
 class TankDisplayWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.cylinder_widget = parent
         self.setMinimumSize(130, 230)
+        self.displayed_state = None
+
+    def refresh(self):
+        # Repaint only if what is drawn changes: the whole percent, the name or the liquid type
+        cw = self.cylinder_widget
+        state = (int(cw.tank_level * 100), cw.alarm_state, cw.tank_name, cw.liquid_type)
+        if state != self.displayed_state:
+            self.displayed_state = state
+            self.update()
 
     def paintEvent(self, event):
         painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-
-        # Set background color to blue
-        painter.setBrush(QColor(4, 12, 36))
-        painter.drawRect(2, 0, self.width()+130, self.height())
-
-        # Set color of the tank
-        tank_color = QColor(165, 165, 165)  # Light gray color
-        painter.setBrush(tank_color)
-        pen = QPen(tank_color, 2)
-        painter.setPen(pen)
-
-        # Draw tank shape
-        tank_width = 60
-        tank_height = 100
-        tank_x = ((self.width() - tank_width) // 2)-25
-        tank_y = (self.height() - tank_height) // 2
-
-        # Fill top ellipse
-        painter.drawEllipse(QRect(int(tank_x), int(tank_y), int(tank_width), int(tank_width // 2)))
-
-        # Fill bottom ellipse
-        painter.drawEllipse(QRect(int(tank_x), int(tank_y + tank_height - tank_width // 2), int(tank_width), int(tank_width // 2)))
-
-        # Draw curved sides
-        painter.drawRect(int(tank_x), int(tank_y + tank_width // 4), int(tank_width), int(tank_height - tank_width // 2))
-
-        # Define colors for different level ranges
-        colors = {
-            (0, 25): QColor("#94C816"),   # Green
-            (25, 50): QColor("#EBA104"),  # Yellow
-            (50, 75): QColor("#E4670B"),  # Orange
-            (75, 100): QColor("#BA1301")  # Red
-        }
-
-        # Draw tank level indicator line with different colors based on tank level percentage
-        level_x = tank_x + tank_width + 20
-        level_height = tank_height
-
-        for (start, end), color in colors.items():
-            line_color = color
-            start_y = tank_y + tank_height * start / 100
-            end_y = tank_y + tank_height * end / 100
-            painter.setPen(QPen(line_color, 8))
-            painter.drawLine(int(level_x), int(start_y), int(level_x), int(end_y))  # Vertical line
-
-        # Draw tank level indicator
-        level_indicator_height = 5  # Height of the indicator rectangle
-        level_indicator_width = 20  # Width of the indicator rectangle
-        level_indicator_y = int(tank_y + tank_height * (1 - self.cylinder_widget.tank_level))
-        level_indicator_x = int(tank_x + tank_width + 10)  # Adjust the position of the indicator
-        if 0 <= self.cylinder_widget.tank_level < 0.26:
-            painter.setPen(QColor("#BA1301"))
-            painter.setBrush(QColor("#BA1301"))
-        elif 0.25 <= self.cylinder_widget.tank_level < 0.51:
-            painter.setPen(QColor("#E4670B"))
-            painter.setBrush(QColor("#E4670B"))
-        elif 0.5 <= self.cylinder_widget.tank_level < 0.76:
-            painter.setPen(QColor("#EBA104"))
-            painter.setBrush(QColor("#EBA104"))
-        elif 0.75 <= self.cylinder_widget.tank_level <= 1.0:
-            painter.setPen(QColor("#94C816"))
-            painter.setBrush(QColor("#94C816"))
-
-        painter.drawRect(level_indicator_x, level_indicator_y - level_indicator_height // 2, level_indicator_width, level_indicator_height)  # Draw the indicator rectangle
-
-        # Draw tank level labels
-        font = QFont("Arial", 10)
-        painter.setFont(font)
-        painter.setPen(QPen(QColor(194, 221, 228), 8))
-        painter.drawText(level_x + 3, tank_y + tank_height + 25, "0%")  # 0% label
-        painter.drawText(level_x + 3, tank_y - 13, "100%")  # 100% label
-
-        # Draw tank name
-        font = QFont("Arial", 10)
-        painter.setFont(font)
-        painter.drawText(tank_x + 23, tank_y + tank_height + 40, self.cylinder_widget.tank_name)
-
-        # Draw liquid type
-        font = QFont("Arial", 9)
-        painter.setFont(font)
-        if self.cylinder_widget.liquid_type == "Essence Sans Plomb":
-            painter.drawText(tank_x-4, tank_y + tank_height + 60, self.cylinder_widget.liquid_type)
-        elif self.cylinder_widget.liquid_type == "GPL":
-            painter.drawText(tank_x + 30, tank_y + tank_height + 60, self.cylinder_widget.liquid_type)
-        elif self.cylinder_widget.liquid_type == "Gasoil 50":
-            painter.drawText(tank_x+20, tank_y + tank_height + 60, self.cylinder_widget.liquid_type)
-        else:
-            painter.drawText(tank_x, tank_y + tank_height + 60, self.cylinder_widget.liquid_type)
-
-        # Draw tank level
-        font = QFont("Arial", 9)
-        painter.setFont(font)
-        if 0 <= self.cylinder_widget.tank_level < 0.26:
-            painter.setPen(QColor("#BA1301"))
-            painter.setBrush(QColor("#BA1301"))
-            if self.cylinder_widget.tank_level == 0:
-                painter.drawText(tank_x-3, tank_y + tank_height -140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-                painter.drawText(tank_x-3, tank_y + tank_height -120, f"EMPTY TANK")
-
-            else:
-                painter.drawText(tank_x -3, tank_y + tank_height -140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-                painter.drawText(tank_x -3, tank_y + tank_height -120, f"CRITICAL")
-
-        elif 0.25 <= self.cylinder_widget.tank_level < 0.51:
-            painter.setPen(QColor("#E4670B"))
-            painter.setBrush(QColor("#E4670B"))
-            painter.drawText(tank_x -3, tank_y + tank_height -140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-            painter.drawText(tank_x -3, tank_y + tank_height -120, f"MODERATE")
-
-        elif 0.5 <= self.cylinder_widget.tank_level < 0.76:
-            painter.setPen(QColor("#EBA104"))
-            painter.setBrush(QColor("#EBA104"))
-            painter.drawText(tank_x -3, tank_y + tank_height - 140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-            painter.drawText(tank_x -3, tank_y + tank_height -120, f"GOOD")
-
-        elif 0.75 <= self.cylinder_widget.tank_level <= 1.0:
-            painter.setPen(QColor("#94C816"))
-            painter.setBrush(QColor("#94C816"))
-            if self.cylinder_widget.tank_level == 1:
-                painter.drawText(tank_x-3, tank_y + tank_height-140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-                painter.drawText(tank_x -3, tank_y + tank_height -120, f"FULL TANK")
-
-            else:
-                painter.drawText(tank_x-3, tank_y + tank_height-140, f"Tank Level={int(self.cylinder_widget.tank_level * 100)}%")
-                painter.drawText(tank_x -3, tank_y + tank_height -120, f"HIGH")
-
-        
-        painter.drawText(level_x + 15, level_indicator_y - level_indicator_height // 2, f"{int(self.cylinder_widget.tank_level * 100)}%")
-
-        # Draw tank level indicator shape
-        tank_fill_height = tank_height * self.cylinder_widget.tank_level  # Calculate the height of the filled area
-        tank_fill_y = tank_y + tank_height - tank_fill_height  # Calculate the y-coordinate of the filled area
-
-
-        if self.cylinder_widget.tank_level <= 0.29 and self.cylinder_widget.tank_level > 0.19:  # If the tank level is between 20% and 30%
-            # Calculate the height and width of the bottom ellipse
-            bottom_ellipse_height = tank_height * self.cylinder_widget.tank_level * 1.2  # Adjusting the factor (1.2) to fit visually
-            # Draw the bottom ellipse for the filled area
-            painter.drawEllipse(QRect(int(tank_x), int(tank_y + tank_height - bottom_ellipse_height), int(tank_width), int(bottom_ellipse_height)))
-
-        elif self.cylinder_widget.tank_level <= 0.19 and self.cylinder_widget.tank_level> 0:  # If the tank level is 19% or less
-            if self.cylinder_widget.tank_level>0.09 and self.cylinder_widget.tank_level<=0.19:
-                bottom_ellipse_height = tank_height * self.cylinder_widget.tank_level * 1.2  # Adjusting the factor (1.2) to fit visually
-                bottom_ellipse_width = tank_width * 3 / 4  # Adjusting the factor to fit visually
-            elif self.cylinder_widget.tank_level>0.02 and self.cylinder_widget.tank_level<=0.09:
-                bottom_ellipse_height = tank_height * self.cylinder_widget.tank_level * 1.2   # Adjusting the factor (1.2) to fit visually
-                bottom_ellipse_width = tank_width * 0.4  # Adjusting the factor to fit visually
-            elif self.cylinder_widget.tank_level>0 and self.cylinder_widget.tank_level<=0.02:
-                bottom_ellipse_height = tank_height * self.cylinder_widget.tank_level * 1.2   # Adjusting the factor (1.2) to fit visually
-                bottom_ellipse_width = tank_width * 0.3  # Adjusting the factor to fit visually
-            # Draw the bottom ellipse for the filled area
-            painter.drawEllipse(QRect(int(tank_x + (tank_width - bottom_ellipse_width) / 2), int(tank_y + tank_height - bottom_ellipse_height), int(bottom_ellipse_width), int(bottom_ellipse_height)))
-        
-        elif self.cylinder_widget.tank_level == 0:
-            pass   
-            
-        else:
-            # Draw the top ellipse of the filled area
-            painter.drawEllipse(QRect(int(tank_x), int(tank_fill_y), int(tank_width), int(tank_width // 2)))
-
-            # Limit the filled area to the lower edge of the bottom ellipse
-            bottom_ellipse_bottom_y = tank_y + tank_height  # Y-coordinate of the bottom edge of the bottom ellipse
-            if tank_fill_y + tank_fill_height > bottom_ellipse_bottom_y:
-                tank_fill_height = bottom_ellipse_bottom_y - tank_fill_y
-
-            # Draw the bottom ellipse of the filled area
-            painter.drawEllipse(QRect(int(tank_x), int(tank_fill_y + tank_fill_height - tank_width // 2), int(tank_width), int(tank_width // 2)))
-
-            # Draw the curved sides of the filled area
-            painter.drawRect(int(tank_x), int(tank_fill_y + tank_width // 4), int(tank_width), int(tank_fill_height - tank_width // 2))
+        cw = self.cylinder_widget
+        paint_tank(painter, self.width(), self.height(), cw.tank_level, cw.tank_name, cw.liquid_type, cw.alarm_state)
 
 
 class SettingsWidget(QWidget):
@@ -441,10 +348,26 @@ class SettingsWidget(QWidget):
         self.height_input = QLineEdit()
         self.height_input.setText(str(self.cylinder_widget.height))
         self.layout.addSpacing(10)
-        self.layout.addWidget(self.createLabel("Tank Height (m)"))
+        self.layout.addWidget(self.createLabel("Tank Height / Length (m)"))
         self.height_input.setStyleSheet("color: #000000; font-size: 10pt; font-family: Arial, sans-serif;")
         self.layout.addWidget(self.height_input)
 
+        self.shape_input = QComboBox()
+        for shape, shape_name in SHAPE_NAMES.items():
+            self.shape_input.addItem(shape_name, shape)
+        self.shape_input.setCurrentIndex(self.shape_input.findData(self.cylinder_widget.shape))
+        self.layout.addSpacing(10)
+        self.layout.addWidget(self.createLabel("Tank Shape"))
+        self.shape_input.setStyleSheet("color: #000000; font-size: 10pt; font-family: Arial, sans-serif;")
+        self.layout.addWidget(self.shape_input)
+
+        self.strapping_input = QLineEdit()
+        self.strapping_input.setText(self.cylinder_widget.strapping_path)
+        self.layout.addSpacing(10)
+        self.layout.addWidget(self.createLabel("Strapping Table (CSV level,volume)"))
+        self.strapping_input.setStyleSheet("color: #000000; font-size: 10pt; font-family: Arial, sans-serif;")
+        self.layout.addWidget(self.strapping_input)
+
         self.save_button = QPushButton("Save")
         self.save_button.clicked.connect(self.saveSettings)
         self.layout.addWidget(self.save_button)
@@ -464,13 +387,31 @@ class SettingsWidget(QWidget):
         self.setLayout(self.layout)
 
     def saveSettings(self):
+        shape = self.shape_input.currentData()
+        strapping_path = self.strapping_input.text().strip()
+        radius = float(self.radius_input.text())
+        height = float(self.height_input.text())
+        try:
+            strapping_table = load_strapping_table(strapping_path) if shape == STRAPPING else None
+            geometry = TankGeometry(shape, radius, height, strapping_table)
+        except (OSError, ValueError) as e:
+            log.warning("Invalid tank geometry: %s", e)
+            return
+
         self.cylinder_widget.liquid_type = self.density_input.currentText()
         self.cylinder_widget.tank_name= self.name_input.text()
         self.cylinder_widget.density = float(self.density_input.currentData())
-        self.cylinder_widget.radius = float(self.radius_input.text())
-        self.cylinder_widget.height = float(self.height_input.text())
-        pressure_value = self.cylinder_widget.pressure_obj.get_values()["pressure"]
-        self.cylinder_widget.pressure = pressure_value
+        self.cylinder_widget.radius = radius
+        self.cylinder_widget.height = height
+        self.cylinder_widget.shape = shape
+        self.cylinder_widget.strapping_path = strapping_path
+        if geometry != self.cylinder_widget.geometry:
+            # Drop the lookup table of the old configuration, the new one is built on first use
+            geometry_cache.invalidate(self.cylinder_widget.geometry)
+            self.cylinder_widget.geometry = geometry
+        if service is not None:
+            service.configure(self.cylinder_widget.pressure_obj.channel, density=self.cylinder_widget.density,
+                              radius=radius, height=height, geometry=geometry)
         self.cylinder_widget.updateCalculations()
         self.close()
 
@@ -478,16 +419,55 @@ class SettingsWidget(QWidget):
         try:
             self.cylinder_widget.liquid_type = self.density_input.currentText()
             self.cylinder_widget.tank_name=self.name_input.text()
-            pressure_value = self.cylinder_widget.pressure_obj.get_values()["pressure"]
-            self.cylinder_widget.pressure = pressure_value
-            self.cylinder_widget.density = float(self.density_input.text())
+            self.cylinder_widget.density = float(self.density_input.currentData())
             self.cylinder_widget.radius = float(self.radius_input.text())
             self.cylinder_widget.updateCalculations()
         except ValueError:
             pass
 
+def main():
+    global service
+    parser = argparse.ArgumentParser(description="Tank level monitoring window")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--service", default=DEFAULT_STATE_URL,
+                      help="state endpoint of the running service (service.py --metrics-port), the default")
+    mode.add_argument("--local", action="store_true", help="run the acquisition service in this process instead")
+    mode.add_argument("--remote", nargs="+", metavar="SITE", help="show these sites, read from the Tanks table")
+    parser.add_argument("--tanks", type=int, default=4, help="tanks per remote site, numbered from 0")
+    parser.add_argument("--ttl", type=float, default=DEFAULT_TTL,
+                        help="seconds a remote tank is shown before it is re-read")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL, help="seconds between remote polls")
+    args = parser.parse_args()
+    setup_logging()
+    app = QApplication(sys.argv[:1])
+
+    if args.remote:
+        cache = RemoteTankCache(LazyDynamoDB(REGION), {site: range(args.tanks) for site in args.remote},
+                                table_name=TABLE_NAME, shards=TANK_SHARDS, ttl=args.ttl)
+        remote_fleet = RemoteFleet(cache, interval=args.interval)
+        app.aboutToQuit.connect(remote_fleet.stop)
+        window = MainWindow(remote_fleet=remote_fleet)
+        window.show()
+        remote_fleet.start()
+    elif args.local:
+        service = TankService()
+        app.aboutToQuit.connect(service.stop)
+        window = MainWindow(service=service)
+        window.show()
+        service.start()
+    else:
+        client = ServiceClient(args.service)
+        try:
+            client.fetch()  # The channels of the service
+        except OSError as e:
+            raise SystemExit(f"No tank service at {args.service} ({e}), start service.py --metrics-port "
+                             "or run pres.py --local")
+        app.aboutToQuit.connect(client.stop)
+        window = MainWindow(client=client)
+        window.show()
+        client.start()
+    sys.exit(app.exec_())
+
+
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
-    window = MainWindow()
-    window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    main()
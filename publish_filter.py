@@ -0,0 +1,175 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from alarms import STATE_OFFLINE, classify_levels
+
+# Why a reading went through, in priority order
+REASON_FIRST = "first"
+REASON_STATUS = "status"  # Connected <-> no sensor
+REASON_BAND = "band"  # Tank entered another alarm state
+REASON_HEARTBEAT = "heartbeat"  # Nothing published for heartbeat seconds
+REASON_CHANGE = "change"  # Volume moved past the deadband
+REASON_COMPRESSION = "compression"  # Held point emitted when the swinging door closed
+
+REASONS = (REASON_FIRST, REASON_STATUS, REASON_BAND, REASON_HEARTBEAT, REASON_CHANGE, REASON_COMPRESSION)
+
+DEFAULT_DEADBAND = 0.0  # m³
+DEFAULT_DEADBAND_PCT = 0.5  # % of the tank capacity
+DEFAULT_HEARTBEAT = 300.0  # seconds
+
+Publication = namedtuple("Publication", "channel timestamp pressure volume level connected reason state")
+
+
+class PublishFilter:
+    """Decides which readings are worth sending to the cloud.
+
+    A connected reading is published when its volume moved by more than the
+    channel's deadband since the last published one: the larger of the
+    absolute deadband (m³) and deadband_pct percent of the tank capacity.
+    Whatever the deadband says, a reading goes through when the channel
+    connects or loses its sensor, when the tank enters another alarm state
+    (see alarms), and when nothing was published for heartbeat seconds.
+
+    With a compression deviation (m³) a channel uses swinging-door
+    compression instead of the deadband: every reading is held and only
+    published when a straight line from the last published point
+    can no longer stay within the deviation of every reading since. The
+    held reading is then published late, so the cloud history can be
+    rebuilt by linear interpolation within the deviation. A forced reading
+    first publishes any held one.
+
+    Parameters and state are NumPy arrays indexed by channel row, so a
+    whole acquisition pass is filtered at once.
+    """
+
+    def __init__(self, channels, deadband=DEFAULT_DEADBAND, deadband_pct=DEFAULT_DEADBAND_PCT,
+                 heartbeat=DEFAULT_HEARTBEAT, compression=None):
+        count = len(channels)
+        self.channels = list(channels)
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.deadbands = np.full(count, float(deadband))
+        self.deadband_pcts = np.full(count, float(deadband_pct))
+        self.heartbeats = np.full(count, float(heartbeat))
+        self.compressions = np.full(count, np.nan if compression is None else float(compression))
+
+        # Last published reading
+        self.last_times = np.full(count, np.nan)
+        self.last_volumes = np.full(count, np.nan)
+        self.last_connected = np.zeros(count, dtype=bool)
+        self.last_bands = np.full(count, STATE_OFFLINE)
+        # Swinging door: slopes in m³/s from the last published point, and the held reading
+        self.upper_slopes = np.full(count, np.inf)
+        self.lower_slopes = np.full(count, -np.inf)
+        self.held = [None] * count
+
+        self.lock = threading.Lock()
+        self.offered = 0
+        self.counts = dict.fromkeys(REASONS, 0)
+
+    def configure(self, channel, deadband=None, deadband_pct=None, heartbeat=None, compression=None):
+        # compression=0 turns swinging-door compression off for the channel
+        row = self.rows[channel]
+        with self.lock:
+            if deadband is not None:
+                self.deadbands[row] = deadband
+            if deadband_pct is not None:
+                self.deadband_pcts[row] = deadband_pct
+            if heartbeat is not None:
+                self.heartbeats[row] = heartbeat
+            if compression is not None:
+                self.compressions[row] = compression if compression > 0 else np.nan
+                self._reset_door(row)
+
+    def update(self, channels, timestamp, pressures, volumes, levels, capacities, connected, states=None):
+        """Filter one acquisition pass, arguments are arrays with one entry per channel.
+
+        Disconnected channels are passed with connected False (their values
+        are ignored). states are the alarm states of the channels, by default
+        those of the levels without hysteresis. Returns the list of
+        Publication to upload, oldest first.
+        """
+        rows = np.array([self.rows[channel] for channel in channels], dtype=np.intp)
+        pressures = np.asarray(pressures, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.float64)
+        levels = np.asarray(levels, dtype=np.float64)
+        connected = np.asarray(connected, dtype=bool)
+        if states is None:
+            states = classify_levels(levels)
+        bands = np.where(connected, states, STATE_OFFLINE)
+
+        with self.lock:
+            first = np.isnan(self.last_times[rows])
+            status = ~first & (connected != self.last_connected[rows])
+            band = ~first & ~status & connected & (bands != self.last_bands[rows])
+            heartbeat = ~first & (timestamp - self.last_times[rows] >= self.heartbeats[rows])
+            limits = np.maximum(self.deadbands[rows], self.deadband_pcts[rows] / 100 * np.asarray(capacities))
+            moved = connected & (np.abs(volumes - self.last_volumes[rows]) > limits)
+            forced = first | status | band | heartbeat
+            compressed = ~forced & connected & ~np.isnan(self.compressions[rows])
+
+            reasons = np.select([first, status, band, heartbeat, moved],
+                                [REASON_FIRST, REASON_STATUS, REASON_BAND, REASON_HEARTBEAT, REASON_CHANGE], "")
+            self.offered += len(rows)
+            publications = []
+            for i in np.flatnonzero(forced | moved | compressed):
+                row = rows[i]
+                reading = Publication(self.channels[row], timestamp, float(pressures[i]), float(volumes[i]),
+                                      float(levels[i]), bool(connected[i]), str(reasons[i]), int(bands[i]))
+                if compressed[i]:
+                    held = self._swing(row, reading)
+                    if held is not None:
+                        publications.append(held)
+                    continue
+                if self.held[row] is not None:
+                    publications.append(self.held[row]._replace(reason=REASON_COMPRESSION))
+                self._publish(row, reading, bands[i])
+                publications.append(reading)
+
+            for publication in publications:
+                self.counts[publication.reason] += 1
+            return publications
+
+    def _publish(self, row, reading, band):
+        self.last_times[row] = reading.timestamp
+        self.last_volumes[row] = reading.volume if reading.connected else np.nan
+        self.last_connected[row] = reading.connected
+        self.last_bands[row] = band
+        self._reset_door(row)
+
+    def _reset_door(self, row):
+        self.upper_slopes[row] = np.inf
+        self.lower_slopes[row] = -np.inf
+        self.held[row] = None
+
+    def _swing(self, row, reading):
+        # Narrow the door with the new reading, returns the held reading if the door closed
+        deviation = self.compressions[row]
+        published = None
+        dt = reading.timestamp - self.last_times[row]
+        upper = min(self.upper_slopes[row], (reading.volume + deviation - self.last_volumes[row]) / dt)
+        lower = max(self.lower_slopes[row], (reading.volume - deviation - self.last_volumes[row]) / dt)
+        if lower > upper and self.held[row] is not None:
+            # The held reading becomes the new pivot, the door restarts from it
+            published = self.held[row]._replace(reason=REASON_COMPRESSION)
+            # Held readings are never forced, so the alarm state did not change since the pivot
+            self._publish(row, published, self.last_bands[row])
+            dt = reading.timestamp - published.timestamp
+            upper = (reading.volume + deviation - published.volume) / dt
+            lower = (reading.volume - deviation - published.volume) / dt
+        self.upper_slopes[row] = upper
+        self.lower_slopes[row] = lower
+        self.held[row] = reading
+        return published
+
+    def stats(self):
+        with self.lock:
+            published = sum(self.counts.values())
+            return {
+                "offered": self.offered,
+                "published": published,
+                "suppressed": self.offered - published,
+                "suppression_ratio": 1 - published / self.offered if self.offered else 0.0,
+                **{f"published_{reason}": count for reason, count in self.counts.items()},
+            }
@@ -0,0 +1,174 @@
+"""Tank state of remote sites, read from the Tanks table instead of local sensors.
+
+RemoteTankCache keeps the newest item of every watched tank and RemoteFleet
+polls it in the background for the dashboard's remote mode (pres.py --remote).
+Nothing here needs Qt.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import metrics
+from tank_store import LATEST_SK, TIMESTAMP_PREFIX, TankStore
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 15.0  # seconds a cached tank is served without asking the table
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_CONCURRENCY = 8  # Queries in flight
+
+REMOTE_ITEMS_READ = metrics.counter("remote_items_read_total", "Tanks items read by the remote fleet view")
+REMOTE_REFRESH_ERRORS = metrics.counter("remote_refresh_errors_total", "Remote tank refreshes that failed")
+
+
+class RemoteTankCache:
+    """Read-through cache of the newest Tanks item of each watched tank.
+
+    tanks maps each site to its tank numbers, a tank is keyed by (site,
+    tank number). The first read of a tank fetches its LATEST item, with
+    one BatchGetItem per 100 tanks of a site. After that, a tank whose entry
+    is older than ttl seconds is refreshed with TankStore.newest_after: one
+    newest-first, one-item Query per history partition for an item newer
+    than the last one seen, so a refresh reads at most one item per
+    partition however long the tank was not polled, and the table is never
+    scanned. Entries younger than ttl are served from memory.
+    """
+
+    def __init__(self, dynamodb, tanks, table_name="Tanks", shards=None, ttl=DEFAULT_TTL,
+                 concurrency=DEFAULT_CONCURRENCY):
+        self.stores = {site: TankStore(dynamodb, table_name=table_name, site=site, shards=shards)
+                       for site in tanks}
+        self.keys = [(site, tank) for site, numbers in tanks.items() for tank in numbers]
+        self.ttl = ttl
+        self.pool = ThreadPoolExecutor(max_workers=concurrency)
+        self.lock = threading.Lock()
+        self.items = {}  # key -> newest item
+        self.last_sks = {}  # key -> sort key of the newest history item seen
+        self.fetched = {}  # key -> monotonic time of the last refresh
+        self.hits = 0
+        self.misses = 0
+        self.items_read = 0
+        self.errors = 0
+
+    def get(self, keys=None):
+        # {key: item} of the keys (default: every watched tank) that have an item, refreshing the stale ones
+        keys = self.keys if keys is None else keys
+        self.refresh(keys)
+        with self.lock:
+            return {key: self.items[key] for key in keys if key in self.items}
+
+    def refresh(self, keys=None):
+        """Refresh the entries of keys older than ttl, returns {key: item} of the tanks with a newer item."""
+        keys = self.keys if keys is None else keys
+        now = time.monotonic()
+        with self.lock:
+            stale = [key for key in keys if now - self.fetched.get(key, -self.ttl) >= self.ttl]
+            self.hits += len(keys) - len(stale)
+            self.misses += len(stale)
+            unseen = [key for key in stale if key not in self.last_sks]
+            seen = [key for key in stale if key in self.last_sks]
+
+        by_site = {}
+        for site, tank in unseen:
+            by_site.setdefault(site, []).append(tank)
+        futures = [self.pool.submit(self._latest, site, tanks) for site, tanks in by_site.items()]
+        futures += [self.pool.submit(self._newer, key) for key in seen]
+        changed = {}
+        for future in futures:
+            try:
+                changed.update(future.result())
+            except Exception as e:
+                # The tanks stay stale and are tried again on the next refresh
+                self.errors += 1
+                REMOTE_REFRESH_ERRORS.inc()
+                log.warning("Error reading remote tanks: %s", e)
+        return changed
+
+    def _latest(self, site, tanks):
+        latest = self.stores[site].latest(tanks)
+        found = {(site, tank): item for tank, item in latest.items()}
+        self._store(found, [(site, tank) for tank in tanks], len(latest))
+        return found
+
+    def _newer(self, key):
+        site, tank = key
+        newest = self.stores[site].newest_after(tank, self.last_sks[key])
+        found = {key: dict(newest, SK=LATEST_SK)} if newest is not None else {}
+        self._store(found, [key], len(found))
+        return found
+
+    def _store(self, found, keys, count):
+        now = time.monotonic()
+        with self.lock:
+            for key, item in found.items():
+                self.items[key] = item
+                self.last_sks[key] = TIMESTAMP_PREFIX + item["timestamp"]
+            for key in keys:
+                self.fetched[key] = now
+            self.items_read += count
+        REMOTE_ITEMS_READ.inc(count)
+
+    def invalidate(self, keys=None):
+        # Refresh keys (default: all) on the next read whatever their age
+        with self.lock:
+            for key in self.keys if keys is None else keys:
+                self.fetched.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"tanks": len(self.keys), "cached": len(self.items), "hits": self.hits, "misses": self.misses,
+                    "items_read": self.items_read, "errors": self.errors}
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+
+
+class RemoteFleet:
+    """Polls a RemoteTankCache every interval seconds on a background thread.
+
+    Listeners are called with {(site, tank number): item} of the tanks that
+    have a newer item, from the polling thread; the first poll reports
+    every tank found.
+    """
+
+    def __init__(self, cache, interval=DEFAULT_POLL_INTERVAL):
+        self.cache = cache
+        self.interval = interval
+        self.listeners = []
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.thread = None
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def poll(self):
+        changed = self.cache.refresh()
+        if changed:
+            for callback in self.listeners:
+                try:
+                    callback(changed)
+                except Exception as e:
+                    log.warning("Remote fleet listener error: %s", e)
+        return changed
+
+    def start(self):
+        if self.thread is None:
+            self.stopping = False
+            self.thread = threading.Thread(target=self._run, name="remote-fleet", daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stopping = True
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.cache.close()
+
+    def _run(self):
+        while not self.stopping:
+            self.poll()
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
@@ -0,0 +1,273 @@
+"""Trace replay and load test of the whole pipeline on one box.
+
+Streams pressure traces for any number of tanks through the real
+acquisition scheduler, TankService (conditioning, levels, alarms,
+forecast, history, publish filter) and the storage path (uploader,
+journal, drainer) into an in-memory fake Tanks table, at an accelerated
+rate, and reports:
+
+    sustained samples/s against the offered rate, and scheduler overruns
+    latency percentiles from acquisition to computed levels, and to the table
+    memory (RSS) growth over the run
+
+    python replay.py --tanks 100 500 1000 --speed 60 --seconds 30
+    python replay.py --trace site.csv --tanks 2000
+    python replay.py --save synthetic.bin --tanks 50    write a synthetic trace
+
+Traces are CSV with a timestamp,channel,pressure header, Parquet with the
+same columns (needs pyarrow), or binary records of TRACE_DTYPE (.bin or
+.npy). A trace with fewer channels than --tanks is tiled, each copy
+shifted in phase. Without --trace a synthetic trace is generated: tanks
+draining at random rates with refills, sensor noise and dropouts.
+"""
+import argparse
+import calendar
+import csv
+import os
+import resource
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fake_dynamodb import FakeDynamoDB
+from instrumentation import setup_logging
+from sensors import SensorBank
+from service import TankService
+
+TRACE_DTYPE = np.dtype([("timestamp", "<f8"), ("channel", "<i4"), ("pressure", "<f8")])
+
+DEFAULT_PERIOD = 10.0  # Trace sample period in seconds, when the trace does not tell
+DEFAULT_SPEED = 60.0  # Trace seconds replayed per wall-clock second
+DEFAULT_SECONDS = 30.0
+DEFAULT_WARMUP = 5.0  # Wall-clock seconds before the measurement starts
+
+# values[i] are the pressures of channels[i] every period seconds, NaN where the sensor was missing
+Trace = namedtuple("Trace", "channels values period")
+
+
+# Traces
+
+def load_trace(path):
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet traces need pyarrow (pip install pyarrow), or convert to CSV")
+        table = pyarrow.parquet.read_table(path, columns=["timestamp", "channel", "pressure"])
+        records = np.empty(table.num_rows, dtype=TRACE_DTYPE)
+        for name in TRACE_DTYPE.names:
+            records[name] = table.column(name).to_numpy()
+    elif path.endswith(".npy"):
+        records = np.load(path).astype(TRACE_DTYPE)
+    elif path.endswith(".bin"):
+        records = np.fromfile(path, dtype=TRACE_DTYPE)
+    else:
+        with open(path, newline="") as f:
+            rows = [(float(row["timestamp"]), int(row["channel"]), float(row["pressure"] or "nan"))
+                    for row in csv.DictReader(f)]
+        records = np.array(rows, dtype=TRACE_DTYPE)
+    return trace_from_records(records)
+
+
+def trace_from_records(records):
+    # One row of values per channel in time order, padded with NaN to the longest channel
+    records = np.sort(records, order=("channel", "timestamp"))
+    channels, starts, counts = np.unique(records["channel"], return_index=True, return_counts=True)
+    values = np.full((len(channels), counts.max()), np.nan)
+    for row, (start, count) in enumerate(zip(starts, counts)):
+        values[row, :count] = records["pressure"][start:start + count]
+    steps = np.diff(records["timestamp"])[np.diff(records["channel"]) == 0]
+    period = float(np.median(steps)) if len(steps) else DEFAULT_PERIOD
+    return Trace(channels.tolist(), values, period)
+
+
+def save_trace(trace, path, start=0.0):
+    rows, samples = trace.values.shape
+    records = np.empty(rows * samples, dtype=TRACE_DTYPE)
+    records["timestamp"] = np.tile(start + np.arange(samples) * trace.period, rows)
+    records["channel"] = np.repeat(trace.channels, samples)
+    records["pressure"] = trace.values.ravel()
+    if path.endswith(".npy"):
+        np.save(path, records)
+    elif path.endswith(".bin"):
+        records.tofile(path)
+    elif path.endswith(".parquet"):
+        raise SystemExit("Writing Parquet is not supported, save as .csv or .bin")
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(TRACE_DTYPE.names)
+            writer.writerows(records.tolist())
+
+
+def synthetic_trace(tanks, samples=1000, period=DEFAULT_PERIOD, seed=0):
+    # Draining tanks refilled near empty, with sensor noise and the odd dropout
+    rng = np.random.default_rng(seed)
+    full, refill_at = 42.0, 4.0  # Pressures of a full tank and of the refill point
+    rates = rng.uniform(0.005, 0.05, tanks)[:, None]  # Pressure drop per sample
+    drained = rng.uniform(0, full - refill_at, tanks)[:, None] + rates * np.arange(samples)
+    values = full - drained % (full - refill_at) + rng.normal(0, 0.1, (tanks, samples))
+    values[rng.random((tanks, samples)) < 0.001] = np.nan
+    return Trace(list(range(tanks)), np.round(values, 2), period)
+
+
+def tile_trace(trace, tanks):
+    # Trace for exactly tanks channels, repeating the recorded ones with a phase shift per copy
+    count, samples = trace.values.shape
+    values = np.empty((tanks, samples))
+    for tank in range(tanks):
+        values[tank] = np.roll(trace.values[tank % count], (tank // count) * 7)
+    return Trace(list(range(tanks)), values, trace.period)
+
+
+# Measurement
+
+class RecordingDynamoDB(FakeDynamoDB):
+    """Fake DynamoDB that notes how long each history item took from acquisition to the table."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(latency=latency)
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        response = super().batch_write_item(RequestItems)
+        now = time.time()
+        latencies = [now - _parse_timestamp(request["PutRequest"]["Item"]["timestamp"])
+                     for requests in RequestItems.values() for request in requests
+                     if request["PutRequest"]["Item"]["SK"] != "LATEST"]
+        with self.lock:
+            self.latencies.extend(latencies)
+        return response
+
+
+def _parse_timestamp(text):
+    # Inverse of tank_store.format_timestamp
+    return calendar.timegm(time.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")) + int(text[20:23]) / 1000
+
+
+def rss_bytes():
+    # Resident memory of this process, from /proc when available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": float("nan"), "p95": float("nan"), "p99": float("nan")}
+    p50, p95, p99 = np.percentile(values, (50, 95, 99))
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def run_load(trace, speed=DEFAULT_SPEED, seconds=DEFAULT_SECONDS, warmup=DEFAULT_WARMUP, network_latency=0.0,
+             workdir=None):
+    """Replay trace through a fresh TankService for warmup + seconds, returns the report as a dict."""
+    with tempfile.TemporaryDirectory(dir=workdir) as directory:
+        bank = SensorBank()
+        lengths = (~np.isnan(trace.values)).cumsum(axis=1).argmax(axis=1) + 1  # Up to the last recorded sample
+        sources = bank.add_channels(trace.channels, trace.values, lengths)
+        period = trace.period / speed
+        dynamodb = RecordingDynamoDB(network_latency)
+        service = TankService(sources=sources, dynamodb=dynamodb, periods={c: period for c in trace.channels},
+                              journal_path=os.path.join(directory, "readings.db"),
+                              history_dir=os.path.join(directory, "history"))
+        service.drainer.is_connected = None  # The fake table is always reachable
+
+        processed = []
+        service.add_listener(lambda samples, result: processed.append(time.time() - samples[0].timestamp))
+        memory = []
+        sampling = threading.Event()
+
+        def sample_memory():
+            while not sampling.wait(0.5):
+                memory.append((time.monotonic(), rss_bytes()))
+
+        memory_thread = threading.Thread(target=sample_memory, name="replay-memory", daemon=True)
+        service.uploader.start()
+        service.drainer.start()
+        service.scheduler.start()
+        memory_thread.start()
+
+        time.sleep(warmup)
+        start, samples_before, overruns_before = time.monotonic(), service.scheduler.samples, service.scheduler.overruns
+        passes_before = len(processed)
+        with dynamodb.lock:
+            stored_before = len(dynamodb.latencies)
+        time.sleep(seconds)
+        elapsed = time.monotonic() - start
+        samples = service.scheduler.samples - samples_before
+        overruns = service.scheduler.overruns - overruns_before
+
+        service.scheduler.stop()
+        service.uploader.stop()
+        # Give the drainer time to empty the journal, so the storage latencies include the tail
+        deadline = time.monotonic() + 30.0
+        while service.journal.depth() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        service.drainer.stop()
+        sampling.set()
+        memory_thread.join()
+        service.history.flush()
+        service.journal.close()
+
+    measured = [(t, rss) for t, rss in memory if t >= start]
+    growth = (measured[-1][1] - measured[0][1]) / (measured[-1][0] - measured[0][0]) * 60 if len(measured) > 1 else 0.0
+    offered = len(trace.channels) * speed / trace.period
+    return {
+        "tanks": len(trace.channels),
+        "offered_samples_per_second": offered,
+        "samples_per_second": samples / elapsed,
+        "keeps_up": samples / elapsed >= 0.95 * offered,
+        "overruns": overruns,
+        "process_latency": percentiles(processed[passes_before:]),
+        "storage_latency": percentiles(dynamodb.latencies[stored_before:]),
+        "items_written": dynamodb.Table(service.tank_store.table_name).put_count,
+        "journal_left": service.journal.depth(),
+        "upload_dropped": service.uploader.stats()["dropped"],
+        "rss_bytes": measured[-1][1] if measured else rss_bytes(),
+        "rss_growth_bytes_per_minute": growth,
+    }
+
+
+def format_report(report):
+    process, storage = report["process_latency"], report["storage_latency"]
+    return (f"{report['tanks']:6d} tanks  {report['samples_per_second']:10,.0f} / "
+            f"{report['offered_samples_per_second']:,.0f} samples/s {'ok' if report['keeps_up'] else 'BEHIND':6s} "
+            f"overruns {report['overruns']:<6d}"
+            f"process p50/p95/p99 {process['p50'] * 1000:.1f}/{process['p95'] * 1000:.1f}/{process['p99'] * 1000:.1f} ms  "
+            f"to table {storage['p50']:.2f}/{storage['p95']:.2f}/{storage['p99']:.2f} s  "
+            f"RSS {report['rss_bytes'] / 2 ** 20:.0f} MB {report['rss_growth_bytes_per_minute'] / 2 ** 20:+.1f} MB/min")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="CSV, Parquet or binary trace (default: synthetic)")
+    parser.add_argument("--tanks", type=int, nargs="+", default=[100], help="tank counts to run, one run each")
+    parser.add_argument("--speed", type=float, default=DEFAULT_SPEED, help="trace seconds per wall-clock second")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="measured wall-clock seconds per run")
+    parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP)
+    parser.add_argument("--period", type=float, default=DEFAULT_PERIOD, help="sample period of a synthetic trace")
+    parser.add_argument("--network-latency", type=float, default=0.0, help="seconds added to each table request")
+    parser.add_argument("--log-level", default="ERROR", help="service log level, alarms and refills are INFO")
+    parser.add_argument("--save", help="write the (synthetic or tiled) trace of the first tank count here and exit")
+    args = parser.parse_args()
+    setup_logging(args.log_level.upper())
+
+    recorded = load_trace(args.trace) if args.trace else None
+    for tanks in args.tanks:
+        trace = tile_trace(recorded, tanks) if recorded else synthetic_trace(tanks, period=args.period)
+        if args.save:
+            save_trace(trace, args.save)
+            print(f"Saved {tanks} channels x {trace.values.shape[1]} samples to {args.save}")
+            return
+        print(format_report(run_load(trace, args.speed, args.seconds, args.warmup, args.network_latency)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
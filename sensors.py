@@ -1,17 +1,138 @@
-import random
+import numpy as np
+
+# Status codes returned with every read
+SENSOR_OK = 0
+SENSOR_NOT_CONNECTED = 1
+
+NO_SENSOR_MESSAGE = "no sensor connected"
+
+
+class SensorBank:
+    """Preallocated ring buffers for a set of pressure channels.
+
+    Samples live in one 2-D float64 array (one row per channel) with a read
+    cursor per channel, so reading a channel is an index lookup and reading
+    every channel is a single vectorized gather. A channel without samples
+    reads as NaN with status SENSOR_NOT_CONNECTED.
+    """
+
+    def __init__(self, noise=0.0, seed=None):
+        self.noise = noise  # Simulated jitter, uniform in [0, noise)
+        self.rng = np.random.default_rng(seed)
+        self.channels = []
+        self.buffer = np.empty((0, 0), dtype=np.float64)
+        self.lengths = np.zeros(0, dtype=np.int64)
+        self.cursors = np.zeros(0, dtype=np.int64)
+
+    def add_channel(self, channel, values=None):
+        # Allocation happens here, once per channel, never on the read path
+        samples = np.asarray(values if values is not None else [], dtype=np.float64)
+        rows, capacity = self.buffer.shape
+        capacity = max(capacity, len(samples))
+        buffer = np.full((rows + 1, capacity), np.nan, dtype=np.float64)
+        buffer[:rows, :self.buffer.shape[1]] = self.buffer
+        buffer[rows, :len(samples)] = samples
+        self.buffer = buffer
+        self.lengths = np.append(self.lengths, len(samples))
+        self.cursors = np.append(self.cursors, 0)
+        self.channels.append(channel)
+        return RingBufferSource(self, rows, channel)
+
+    def add_channels(self, channels, values, lengths=None):
+        # Bulk add_channel with one allocation: values is 2-D, one row per channel, used up to lengths
+        values = np.asarray(values, dtype=np.float64)
+        lengths = np.full(len(channels), values.shape[1], dtype=np.int64) if lengths is None else np.asarray(lengths)
+        rows, capacity = self.buffer.shape
+        capacity = max(capacity, values.shape[1])
+        buffer = np.full((rows + len(channels), capacity), np.nan, dtype=np.float64)
+        buffer[:rows, :self.buffer.shape[1]] = self.buffer
+        buffer[rows:, :values.shape[1]] = values
+        self.buffer = buffer
+        self.lengths = np.append(self.lengths, lengths)
+        self.cursors = np.append(self.cursors, np.zeros(len(channels), dtype=np.int64))
+        self.channels.extend(channels)
+        return [RingBufferSource(self, rows + i, channel) for i, channel in enumerate(channels)]
+
+    def read_all_channels(self):
+        # One sample per channel: (values, status) arrays indexed like self.channels
+        connected = self.lengths > 0
+        rows = np.flatnonzero(connected)
+        # Channels without samples read as NaN, and are not indexed (the buffer may have no columns at all)
+        values = np.full(len(self.channels), np.nan)
+        values[rows] = self.buffer[rows, self.cursors[rows]]
+        self.cursors[rows] = (self.cursors[rows] + 1) % self.lengths[rows]
+        if self.noise:
+            values = np.round(values + self.rng.uniform(0.0, self.noise, len(values)), 2)
+        status = np.where(connected, SENSOR_OK, SENSOR_NOT_CONNECTED).astype(np.int8)
+        return values, status
+
+    def _read(self, row):
+        length = self.lengths[row]
+        if length == 0:
+            return float("nan"), SENSOR_NOT_CONNECTED
+        cursor = self.cursors[row]
+        value = float(self.buffer[row, cursor])
+        self.cursors[row] = (cursor + 1) % length
+        if self.noise:
+            value = round(value + self.rng.uniform(0.0, self.noise), 2)
+        return value, SENSOR_OK
+
+    def _read_many(self, row, k):
+        length = self.lengths[row]
+        if length == 0:
+            return np.full(k, np.nan), SENSOR_NOT_CONNECTED
+        cursor = self.cursors[row]
+        values = self.buffer[row].take(np.arange(cursor, cursor + k) % length)
+        self.cursors[row] = (cursor + k) % length
+        if self.noise:
+            values = np.round(values + self.rng.uniform(0.0, self.noise, k), 2)
+        return values, SENSOR_OK
+
+
+class RingBufferSource:
+    """One channel of a SensorBank."""
+
+    def __init__(self, bank, row, channel):
+        self.bank = bank
+        self.row = row
+        self.channel = channel
+
+    @property
+    def connected(self):
+        return self.bank.lengths[self.row] > 0
+
+    def read(self):
+        # Next sample as (value, status), O(1)
+        return self.bank._read(self.row)
+
+    def read_many(self, k):
+        # Next k samples as (float64 array, status)
+        return self.bank._read_many(self.row, k)
+
 
 class Pressure:
-    def __init__(self, channel, values=None):
+    """Compatibility wrapper over a single-channel SensorBank.
+
+    get_value() keeps its historical return values: [value], or
+    ["no sensor connected"] when the channel has no samples. New code should
+    use read() / read_many() and test the status code instead.
+    """
+
+    def __init__(self, channel, values=None, noise=0.9, seed=None):
         self.channel = channel
         self.values = values  # La liste des valeurs de pression
-        self.current_index = 0  # Un index pour suivre la position actuelle dans la liste
+        bank = SensorBank(noise=noise, seed=seed)
+        # Les valeurs sont parcourues en ordre inverse
+        self.source = bank.add_channel(channel, list(reversed(values)) if values is not None else None)
+
+    def read(self):
+        return self.source.read()
+
+    def read_many(self, k):
+        return self.source.read_many(k)
 
     def get_value(self):
-        if self.values is not None:
-            # Parcourir les valeurs en inversant l'ordre (utilisation de reversed)
-            reversed_values = list(reversed(self.values))  # Inverser les valeurs
-            value = round(reversed_values[self.current_index] + random.uniform(0.0, 0.9), 2)
-            self.current_index = (self.current_index + 1) % len(reversed_values)  # Tourner dans la liste inversée
-            return [value]  # Retourner la valeur dans une liste comme demandé
-        else:
-            return ["no sensor connected"]  # Si aucune valeur, indiquer l'absence du capteur
\ No newline at end of file
+        value, status = self.source.read()
+        if status != SENSOR_OK:
+            return [NO_SENSOR_MESSAGE]  # Si aucune valeur, indiquer l'absence du capteur
+        return [value]  # Retourner la valeur dans une liste comme demandé
@@ -0,0 +1,376 @@
+import argparse
+import logging
+import signal
+import threading
+import time
+
+import numpy as np
+
+from sensors import Pressure, SENSOR_OK
+from uploader import BatchUploader
+from journal import ReadingJournal, JournalDrainer
+from level_engine import DEFAULT_SCALING_FACTOR, STATUS_NO_SENSOR, compute_levels
+from acquisition import AcquisitionScheduler, DEFAULT_SAMPLE_PERIOD, Sample
+from history import HistoryStore
+from tank_store import TankStore
+from telemetry import HttpFrameSender
+from link_manager import LinkManager, LINK_UP
+from geometry import TankGeometry
+from publish_filter import PublishFilter
+from conditioning import SignalConditioner
+from alarms import ALARM_RAISED, STATE_NAMES, STATE_OFFLINE, AlarmEngine
+from forecasting import ConsumptionForecaster
+from instrumentation import metrics, setup_logging, MetricsServer, MetricsFileWriter
+from live_state import STATE_PATH, StateRecorder
+
+log = logging.getLogger("service")
+
+PASS_SECONDS = metrics.histogram("acquisition_pass_seconds", "Processing time of one acquisition pass")
+COMPUTE_SECONDS = metrics.histogram("level_compute_seconds", "Conditioning and level computation of one pass")
+
+REGION = "eu-west-3"
+TABLE_NAME = "Tanks"
+
+# Site of this box, and write shards for high-rate tanks as {tank number: shards}
+SITE_ID = "1"
+TANK_SHARDS = {}
+
+# Sampling period per channel in seconds, e.g. {0: 1.0} for a fast-drain tank
+SAMPLE_PERIODS = {}
+
+# Sharded acquisition for sites with several ADC boards: the channels of each worker
+# process, e.g. [range(0, 64), range(64, 128)] (see sharded_acquisition.assign_channels).
+# Empty: every channel is sampled in this process.
+ACQUISITION_WORKERS = []
+
+# Signal conditioning per channel, e.g. {0: {"method": "kalman", "spike_limit": 5.0}},
+# see SignalConditioner.configure
+CONDITIONING = {}
+
+# Alarm thresholds per channel, e.g. {0: {"thresholds": (0.2, 0.5, 0.8), "hysteresis": 0.02, "min_duration": 60}},
+# see AlarmEngine.configure
+ALARM_SETTINGS = {}
+
+# Consumption forecast settings per channel, e.g. {0: {"half_life": 3600, "refill_pct": 5.0}},
+# see ConsumptionForecaster.configure
+FORECAST_SETTINGS = {}
+
+# Endpoint that takes compact telemetry frames (see telemetry.TelemetryReceiver) while the uplink is
+# metered, e.g. "https://telemetry.example.com/frames". None: readings always go to DynamoDB directly.
+TELEMETRY_URL = None
+TELEMETRY_INTERVAL = 60.0  # seconds between frames on a metered uplink
+
+# Publish filter settings per channel, e.g. {0: {"deadband_pct": 1.0, "compression": 0.05}},
+# see PublishFilter.configure
+PUBLISH_SETTINGS = {}
+
+
+# Simulated pressure samples per channel, channel 0 plays a draining tank
+SIMULATED_VALUES = {0: list(range(10, 40))}
+
+
+def make_source(channel):
+    # Source of one channel, also called in the worker processes of sharded acquisition
+    return Pressure(channel=channel, values=SIMULATED_VALUES.get(channel))
+
+
+def default_sources():
+    # Créez les objets Pressure pour chaque tank
+    return [make_source(channel) for channel in range(4)]
+
+
+class LazyDynamoDB:
+    """Stands in for boto3.resource('dynamodb'), boto3 is only imported on first use.
+
+    Importing boto3 and building the resource takes longer than everything
+    else at startup, and nothing needs it before the journal is drained.
+    """
+
+    def __init__(self, region_name=REGION):
+        self.region_name = region_name
+        self.resource = None
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self.resource is None:
+            with self.lock:
+                if self.resource is None:
+                    import boto3
+                    self.resource = boto3.resource("dynamodb", region_name=self.region_name)
+        return getattr(self.resource, name)
+
+
+class TankService:
+    """Headless acquisition service: sensors -> level computation -> history and upload.
+
+    Nothing here needs Qt. Every acquisition pass is conditioned (see
+    conditioning.SignalConditioner), then computed with one compute_levels
+    call from the per-channel parameters (see configure()), appended to the
+    local history and queued for upload through the journal. Clients such
+    as the GUI register with add_listener() and get (samples, LevelResult)
+    of each pass, on the acquisition thread.
+    """
+
+    def __init__(self, sources=None, dynamodb=None, site=SITE_ID, table_name=TABLE_NAME, shards=None,
+                 periods=None, journal_path="readings.db", history_dir="history", workers=None,
+                 source_factory=make_source):
+        workers = ACQUISITION_WORKERS if workers is None else workers
+        periods = SAMPLE_PERIODS if periods is None else periods
+        if workers:
+            # Channels are sampled by worker processes, the service aggregates them
+            from sharded_acquisition import ShardedAcquisition
+            self.scheduler = ShardedAcquisition(workers, source_factory, default_period=DEFAULT_SAMPLE_PERIOD,
+                                                periods=periods)
+            self.scheduler.add_listener(self.process_arrays)
+            self.sources = self.scheduler.sources
+        else:
+            # One scheduler samples every channel
+            self.sources = sources if sources is not None else default_sources()
+            self.scheduler = AcquisitionScheduler(self.sources, default_period=DEFAULT_SAMPLE_PERIOD,
+                                                  periods=periods)
+            self.scheduler.add_listener(self.process)
+        self.dynamodb = dynamodb if dynamodb is not None else LazyDynamoDB()
+        self.tank_store = TankStore(self.dynamodb, table_name=table_name, site=site,
+                                    shards=TANK_SHARDS if shards is None else shards)
+
+        # Every reading is journaled locally first, then replayed to DynamoDB in batches,
+        # so nothing is lost while the uplink is down
+        self.journal = ReadingJournal(journal_path, max_rows=500000)
+
+        # Uplink state: the drainer pauses while the link is down and resumes as soon as it is back.
+        # On a metered link (LTE) it batches the backlog into telemetry frames instead, when there is an endpoint
+        self.link_manager = LinkManager()
+        self.drainer = JournalDrainer(self.journal, self.dynamodb, table_name=table_name, batch_size=500,
+                                      is_connected=lambda: self.link_manager.is_up,
+                                      send_frame=HttpFrameSender(TELEMETRY_URL) if TELEMETRY_URL else None,
+                                      is_metered=lambda: self.link_manager.is_metered,
+                                      metered_interval=TELEMETRY_INTERVAL)
+        self.link_manager.subscribe(lambda state, manager: self.drainer.notify() if state == LINK_UP else None)
+
+        # Local history of every tank for trend charts and reports
+        self.history = HistoryStore(history_dir)
+
+        # Readings are journaled by a background writer so acquisition never waits on the disk
+        self.uploader = BatchUploader(self.dynamodb, table_name=table_name, flush_size=25, max_latency=2.0,
+                                      journal=self.journal)
+
+        count = len(self.sources)
+        self.channels = [source.channel for source in self.sources]
+        self.rows = {channel: row for row, channel in enumerate(self.channels)}
+        self.densities = np.full(count, 0.74)
+        self.radii = np.full(count, 1.0)
+        self.heights = np.full(count, 3.0)
+        self.scaling_factors = np.full(count, DEFAULT_SCALING_FACTOR)
+        self.geometries = [TankGeometry(radius=1.0, height=3.0)] * count
+        self.listeners = []
+
+        # Raw pressures are smoothed and cleared of spikes before the level computation
+        self.conditioner = SignalConditioner(self.channels)
+        for channel, settings in CONDITIONING.items():
+            if channel in self.rows:
+                self.conditioner.configure(channel, **settings)
+
+        # Alarm states of every tank, shared by the GUI colours, the uploaded Alarm attribute and notifications
+        self.alarms = AlarmEngine(self.channels)
+        for channel, settings in ALARM_SETTINGS.items():
+            if channel in self.rows:
+                self.alarms.configure(channel, **settings)
+        self.alarm_listeners = []
+
+        # Consumption rate and time to empty of every tank, updated with each pass
+        self.forecaster = ConsumptionForecaster(self.channels)
+        for channel, settings in FORECAST_SETTINGS.items():
+            if channel in self.rows:
+                self.forecaster.configure(channel, **settings)
+
+        # Only readings that say something new are uploaded, the local history keeps them all
+        self.publish_filter = PublishFilter(self.channels)
+        for channel, settings in PUBLISH_SETTINGS.items():
+            if channel in self.rows:
+                self.publish_filter.configure(channel, **settings)
+
+        metrics.gauge("uploader_queue_depth", "Readings waiting to be journaled", self.uploader.queue.qsize)
+        metrics.gauge("journal_depth", "Readings in the journal not yet in DynamoDB", self.journal.depth)
+        metrics.gauge("journal_oldest_age_seconds", "Age of the oldest reading in the journal",
+                      lambda: self.journal.oldest_age() or 0.0)
+        metrics.gauge("journal_dead_letters", "Readings DynamoDB refused, kept aside in the journal",
+                      self.journal.dead_letter_count)
+        metrics.gauge("link_up", "1 while the uplink is up", lambda: float(self.link_manager.is_up))
+        if workers:
+            metrics.gauge("sharded_samples_dropped", "Samples dropped because a worker ring was full",
+                          lambda: self.scheduler.stats()["dropped"])
+        metrics.gauge("tanks_alarm_raised", "Tanks offline, empty or critical",
+                      lambda: int(np.isin(self.alarms.states, list(ALARM_RAISED)).sum()))
+        metrics.gauge("publish_suppression_ratio", "Share of readings held back by the publish filter",
+                      lambda: self.publish_filter.stats()["suppression_ratio"])
+
+    def add_listener(self, callback):
+        # callback(samples, result) after each pass, result rows follow the samples
+        self.listeners.append(callback)
+
+    def add_alarm_listener(self, callback):
+        # callback(events) with the alarms.AlarmEvent of a pass, only when some tank changed state
+        self.alarm_listeners.append(callback)
+
+    def configure(self, channel, density=None, radius=None, height=None, scaling_factor=None, geometry=None):
+        row = self.rows[channel]
+        if density is not None:
+            self.densities[row] = density
+        if radius is not None:
+            self.radii[row] = radius
+        if height is not None:
+            self.heights[row] = height
+        if scaling_factor is not None:
+            self.scaling_factors[row] = scaling_factor
+        if geometry is not None:
+            self.geometries[row] = geometry
+
+    def process(self, samples):
+        # One acquisition pass as a list of Sample
+        samples = [sample for sample in samples if sample.channel in self.rows]
+        if not samples:
+            return
+        self.process_arrays([sample.channel for sample in samples], [sample.value for sample in samples],
+                            [sample.status for sample in samples], samples[0].timestamp)
+
+    def process_arrays(self, channels, values, statuses, timestamp):
+        # One acquisition pass as arrays of channel, value and SENSOR_* status, all taken at timestamp
+        with PASS_SECONDS.time():
+            self._process(list(channels), np.asarray(values, dtype=np.float64), np.asarray(statuses), timestamp)
+
+    def _process(self, channels, values, statuses, timestamp):
+        compute_start = time.perf_counter()
+        rows = np.array([self.rows[channel] for channel in channels])
+        pressures = np.where(statuses == SENSOR_OK, values, np.nan)
+        pressures = self.conditioner.update(channels, pressures)
+        result = compute_levels(pressures, self.densities[rows], self.radii[rows], self.heights[rows],
+                                self.scaling_factors[rows], geometries=[self.geometries[row] for row in rows])
+        connected = result.status != STATUS_NO_SENSOR
+        states, events = self.alarms.update(channels, timestamp, np.where(result.valid, result.levels, np.nan),
+                                            connected)
+        forecast = self.forecaster.update(channels, timestamp, np.where(result.valid, result.volumes, np.nan),
+                                          result.capacities)
+        result = result._replace(alarm_states=states, forecast=forecast)
+        COMPUTE_SECONDS.observe(time.perf_counter() - compute_start)
+
+        valid_channels = [channel for channel, valid in zip(channels, result.valid) if valid]
+        self.history.append_many(valid_channels, timestamp * 1000, result.levels[result.valid], "level")
+        self.history.append_many(valid_channels, timestamp * 1000, result.volumes[result.valid], "volume")
+        # Out of range readings are not uploaded, losing the sensor is
+        offered = result.valid | ~connected
+        publications = self.publish_filter.update(
+            [channel for channel, keep in zip(channels, offered) if keep], timestamp, pressures[offered],
+            result.volumes[offered], result.levels[offered], result.capacities[offered], result.valid[offered],
+            states[offered])
+        for publication in publications:
+            if publication.connected:
+                self.submit_reading(publication.channel, publication.pressure, publication.volume,
+                                    publication.level, publication.timestamp, publication.state)
+            else:
+                self.submit_reading(publication.channel, None, None, None, publication.timestamp, publication.state)
+
+        if events:
+            self.notify_alarms(events)
+        for i in np.flatnonzero(forecast.refilled):
+            log.info("Tank %d refilled", channels[i] + 1, extra={"volume": float(result.volumes[i])})
+
+        if self.listeners:
+            # Clients see the conditioned pressure
+            samples = [Sample(channel, float(pressure) if status == SENSOR_OK else float(value), int(status), timestamp)
+                       for channel, pressure, value, status in zip(channels, pressures, values, statuses)]
+            for callback in self.listeners:
+                callback(samples, result)
+
+    def submit_reading(self, channel, pressure, volume, tank_level, timestamp, state=None):
+        # Queue the history and latest-state items of one reading for upload, state is its alarm state
+        tank_number = channel + 1  # Channel 0 is tank 0001, channel 1 is tank 0002, etc.
+        status = "Connected" if pressure is not None else "No Sensor Connected"
+        timestamp = timestamp if timestamp is not None else time.time()
+        alarm = STATE_NAMES[state] if state is not None else None
+        for item in self.tank_store.reading_items(tank_number, timestamp, pressure, volume, tank_level, status,
+                                                  alarm):
+            self.uploader.submit(item)
+
+    def notify_alarms(self, events):
+        # Log the transitions, then hand them to the alarm listeners. Entering an alarm state is a warning,
+        # except right after the first reading or a reconnection
+        for event in events:
+            raised = event.state in ALARM_RAISED and event.previous != STATE_OFFLINE
+            level = logging.WARNING if raised else logging.INFO
+            log.log(level, "Tank %d alarm %s -> %s", event.channel + 1, STATE_NAMES[event.previous],
+                    STATE_NAMES[event.state], extra={"tank_level": event.level})
+        for callback in self.alarm_listeners:
+            callback(events)
+
+    def start(self):
+        self.uploader.start()
+        self.link_manager.start()
+        self.drainer.start()
+        self.scheduler.start()
+
+    def stop(self):
+        self.scheduler.stop()
+        self.uploader.stop()
+        self.drainer.stop()
+        self.link_manager.stop()
+        self.history.flush()
+
+    def run_once(self, timeout=5.0):
+        # One acquisition pass, journaled and spilled to disk before returning, returns the number of samples
+        self.uploader.start()
+        if isinstance(self.scheduler, AcquisitionScheduler):
+            count = len(self.scheduler.poll_once())
+        else:
+            # Sharded: the workers have to start, wait until each channel was sampled once
+            self.scheduler.start()
+            deadline = time.monotonic() + timeout
+            while self.scheduler.samples < len(self.channels) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.scheduler.stop()
+            count = self.scheduler.samples
+        self.uploader.stop()
+        self.history.flush()
+        return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless tank acquisition service")
+    parser.add_argument("--once", action="store_true", help="journal one acquisition pass and exit")
+    parser.add_argument("--log-level", default="INFO")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help=f"serve Prometheus metrics on this port, and the tank state at {STATE_PATH} for the GUI")
+    parser.add_argument("--metrics-file", default=None, help="write Prometheus metrics to this file")
+    args = parser.parse_args()
+    setup_logging(args.log_level.upper())
+
+    service = TankService()
+    if args.once:
+        count = service.run_once()
+        log.info("Journaled %d samples, journal depth %d", count, service.journal.depth())
+        return
+
+    exporters = []
+    if args.metrics_port is not None:
+        state = StateRecorder(service.channels)
+        service.add_listener(state)
+        exporters.append(MetricsServer(port=args.metrics_port, routes={STATE_PATH: state.route}))
+    if args.metrics_file:
+        exporters.append(MetricsFileWriter(args.metrics_file))
+    for exporter in exporters:
+        exporter.start()
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    service.start()
+    log.info("Acquisition service running")
+    try:
+        stopped.wait()
+    except KeyboardInterrupt:
+        pass
+    service.stop()
+    for exporter in exporters:
+        exporter.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import logging
+import multiprocessing
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from acquisition import AcquisitionScheduler, DEFAULT_SAMPLE_PERIOD
+from instrumentation import metrics
+
+log = logging.getLogger(__name__)
+
+# One sample in the shared ring, 24 bytes
+SLOT_DTYPE = np.dtype([("channel", "<i4"), ("status", "<i4"), ("value", "<f8"), ("timestamp", "<f8")])
+HEADER_SLOTS = 4  # int64: head (samples written), tail (samples read), dropped samples, spare
+HEADER_BYTES = HEADER_SLOTS * 8
+DEFAULT_RING_CAPACITY = 65536  # Samples per worker ring
+
+AGGREGATED = metrics.counter("sharded_samples_total", "Samples read from the worker rings")
+
+
+def assign_channels(channels, workers):
+    # Split channels into workers contiguous ranges of (almost) the same size
+    channels = list(channels)
+    size, extra = divmod(len(channels), workers)
+    shards = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(channels[start:end])
+        start = end
+    return [shard for shard in shards if shard]
+
+
+class SampleRing:
+    """Single-producer, single-consumer ring of samples in a shared memory block.
+
+    The producer writes a whole acquisition pass into the slots and then
+    advances head; the consumer copies everything between tail and head
+    and advances tail. Both counters only grow, and each is written by one
+    side only. The lock is held just for reading or moving a counter, so
+    the slot writes are visible before the new head on any CPU. A pass that
+    does not fit is dropped whole and counted.
+    """
+
+    def __init__(self, buffer, offset, capacity, lock):
+        self.capacity = capacity
+        self.lock = lock
+        self.header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=buffer, offset=offset)
+        self.slots = np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=buffer, offset=offset + HEADER_BYTES)
+
+    @staticmethod
+    def size(capacity):
+        return HEADER_BYTES + capacity * SLOT_DTYPE.itemsize
+
+    def push(self, channels, values, statuses, timestamp):
+        count = len(channels)
+        with self.lock:
+            head, tail = int(self.header[0]), int(self.header[1])
+        if count > self.capacity - (head - tail):
+            with self.lock:
+                self.header[2] += count
+            return False
+        index = np.arange(head, head + count) % self.capacity
+        self.slots["channel"][index] = channels
+        self.slots["status"][index] = statuses
+        self.slots["value"][index] = values
+        self.slots["timestamp"][index] = timestamp
+        with self.lock:
+            self.header[0] = head + count
+        return True
+
+    def pop_all(self):
+        # Copy of every unread sample, oldest first
+        with self.lock:
+            head, tail = int(self.header[0]), int(self.header[1])
+        if head == tail:
+            return self.slots[:0].copy()
+        records = self.slots[np.arange(tail, head) % self.capacity]
+        with self.lock:
+            self.header[1] = head
+        return records
+
+    @property
+    def dropped(self):
+        with self.lock:
+            return int(self.header[2])
+
+
+def _attach(name):
+    # Attach to the parent's block, the parent alone unlinks it. Before Python 3.13 attaching registers
+    # the block again with the resource tracker the workers share with the parent, which is harmless.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(shm_name, offset, capacity, lock, channels, source_factory, default_period, periods, stop_event):
+    # Worker process: sample its channels and push every pass into its ring
+    shm = _attach(shm_name)
+    ring = SampleRing(shm.buf, offset, capacity, lock)
+    sources = [source_factory(channel) for channel in channels]
+    scheduler = AcquisitionScheduler(sources, default_period=default_period, periods=periods)
+
+    def push(samples):
+        ring.push(np.fromiter((sample.channel for sample in samples), dtype=np.int32, count=len(samples)),
+                  np.fromiter((sample.value for sample in samples), dtype=np.float64, count=len(samples)),
+                  np.fromiter((sample.status for sample in samples), dtype=np.int32, count=len(samples)),
+                  samples[0].timestamp)
+
+    scheduler.add_listener(push)
+    scheduler.start()
+    try:
+        stop_event.wait()
+    except KeyboardInterrupt:
+        pass
+    scheduler.stop()
+    del ring  # Release the views on the buffer before closing it
+    shm.close()
+
+
+class RemoteChannel:
+    """Stands for a channel sampled in a worker process (see ShardedAcquisition.sources)."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+
+class ShardedAcquisition:
+    """Acquisition spread over worker processes, for sites with many boards.
+
+    shards lists the channels of each worker, e.g. one list per ADC board.
+    Each worker builds its sources with source_factory(channel) (a
+    module-level function, so it can be sent to the process) and runs an
+    AcquisitionScheduler on them. Samples travel through one shared memory
+    ring per worker, never pickled. A single aggregator thread in this
+    process drains the rings and hands each pass to the listeners as
+    arrays: callback(channels, values, statuses, timestamp).
+    """
+
+    def __init__(self, shards, source_factory, default_period=DEFAULT_SAMPLE_PERIOD, periods=None,
+                 ring_capacity=DEFAULT_RING_CAPACITY, poll_interval=0.005):
+        self.shards = [list(shard) for shard in shards]
+        self.source_factory = source_factory
+        self.default_period = default_period
+        self.periods = periods or {}
+        self.ring_capacity = ring_capacity
+        self.poll_interval = poll_interval
+        self.listeners = []
+        self.shm = None
+        self.rings = []
+        self.processes = []
+        self.context = multiprocessing.get_context()
+        self.stop_event = self.context.Event()
+        self.thread = None
+        self.stopping = threading.Event()
+        self.passes = 0
+        self.samples = 0
+
+    @property
+    def channels(self):
+        return [channel for shard in self.shards for channel in shard]
+
+    @property
+    def sources(self):
+        return [RemoteChannel(channel) for channel in self.channels]
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def start(self):
+        if self.shm is not None:
+            return
+        ring_size = SampleRing.size(self.ring_capacity)
+        self.shm = shared_memory.SharedMemory(create=True, size=ring_size * len(self.shards))
+        self.stop_event.clear()
+        for i, shard in enumerate(self.shards):
+            lock = self.context.Lock()
+            ring = SampleRing(self.shm.buf, i * ring_size, self.ring_capacity, lock)
+            ring.header[:] = 0
+            self.rings.append(ring)
+            periods = {channel: period for channel, period in self.periods.items() if channel in shard}
+            process = self.context.Process(
+                target=_worker_main, name=f"acquisition-{i}", daemon=True,
+                args=(self.shm.name, i * ring_size, self.ring_capacity, lock, shard, self.source_factory,
+                      self.default_period, periods, self.stop_event))
+            process.start()
+            self.processes.append(process)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="acquisition-aggregator", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        if self.shm is None:
+            return
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.poll_once()  # Whatever the workers wrote last
+        self.processes = []
+        self.rings = []  # Drop the views before releasing the block
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def poll_once(self):
+        # Drain every ring and publish the passes, returns the number of samples
+        total = 0
+        for ring in self.rings:
+            records = ring.pop_all()
+            if len(records) == 0:
+                continue
+            total += len(records)
+            # Passes are runs of samples with the same timestamp
+            bounds = np.flatnonzero(np.diff(records["timestamp"])) + 1
+            for chunk in np.split(records, bounds):
+                self.passes += 1
+                for callback in self.listeners:
+                    callback(chunk["channel"], chunk["value"], chunk["status"], float(chunk["timestamp"][0]))
+        self.samples += total
+        AGGREGATED.inc(total)
+        return total
+
+    def _run(self):
+        while not self.stopping.is_set():
+            try:
+                if self.poll_once() == 0:
+                    self.stopping.wait(self.poll_interval)
+            except Exception:
+                log.exception("Aggregator error")
+                self.stopping.wait(self.poll_interval)
+
+    def stats(self):
+        dropped = sum(ring.dropped for ring in self.rings)
+        return {
+            "workers": len(self.shards),
+            "alive": sum(process.is_alive() for process in self.processes),
+            "passes": self.passes,
+            "samples": self.samples,
+            "dropped": dropped,
+        }
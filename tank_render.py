@@ -0,0 +1,194 @@
+from PyQt5.QtGui import QPainter, QColor, QPen, QFont, QPixmap
+from PyQt5.QtCore import QRect, Qt
+
+from alarms import ALARM_STATES, STATE_OFFLINE, alarm_state
+from instrumentation import metrics
+
+# Tank geometry inside the drawing area
+TANK_WIDTH = 60
+TANK_HEIGHT = 100
+
+# Horizontal offset of the liquid type text so that it looks centred
+LIQUID_TEXT_OFFSETS = {"Essence Sans Plomb": -4, "GPL": 30, "Gasoil 50": 20}
+
+# Colours of the gauge bar, from the top (100%) down
+GAUGE_COLORS = {
+    (0, 25): "#94C816",  # Green
+    (25, 50): "#EBA104",  # Yellow
+    (50, 75): "#E4670B",  # Orange
+    (75, 100): "#BA1301",  # Red
+}
+
+MAX_CACHED_PIXMAPS = 16
+
+PAINT_SECONDS = metrics.histogram("tank_paint_seconds", "Time to paint one tank")
+
+_static_cache = {}  # (width, height, device pixel ratio) -> QPixmap
+_resources = {}
+
+
+def _resource(name):
+    # Fonts and colours are created once, after the QApplication exists
+    if not _resources:
+        _resources.update({
+            "background": QColor(4, 12, 36),
+            "tank": QColor(165, 165, 165),  # Light gray color
+            "label_pen": QPen(QColor(194, 221, 228), 8),
+            "label_font": QFont("Arial", 10),
+            "small_font": QFont("Arial", 9),
+            "states": {state: QColor(color) for state, (_, color, _) in ALARM_STATES.items() if color},
+            "gauge": [((start, end), QPen(QColor(color), 8)) for (start, end), color in GAUGE_COLORS.items()],
+        })
+    return _resources[name]
+
+
+def _tank_origin(width, height):
+    tank_x = ((width - TANK_WIDTH) // 2) - 25
+    tank_y = (height - TANK_HEIGHT) // 2
+    return tank_x, tank_y
+
+
+def _paint_static(painter, width, height):
+    # Everything that only depends on the size: background, tank shell, gauge bar and its labels
+    painter.setRenderHint(QPainter.Antialiasing)
+
+    # Set background color to blue
+    painter.setBrush(_resource("background"))
+    painter.drawRect(2, 0, width + 130, height)
+
+    # Set color of the tank
+    tank_color = _resource("tank")
+    painter.setBrush(tank_color)
+    painter.setPen(QPen(tank_color, 2))
+
+    # Draw tank shape
+    tank_x, tank_y = _tank_origin(width, height)
+
+    # Fill top ellipse
+    painter.drawEllipse(QRect(int(tank_x), int(tank_y), int(TANK_WIDTH), int(TANK_WIDTH // 2)))
+
+    # Fill bottom ellipse
+    painter.drawEllipse(QRect(int(tank_x), int(tank_y + TANK_HEIGHT - TANK_WIDTH // 2), int(TANK_WIDTH), int(TANK_WIDTH // 2)))
+
+    # Draw curved sides
+    painter.drawRect(int(tank_x), int(tank_y + TANK_WIDTH // 4), int(TANK_WIDTH), int(TANK_HEIGHT - TANK_WIDTH // 2))
+
+    # Draw tank level indicator line with different colors based on tank level percentage
+    level_x = tank_x + TANK_WIDTH + 20
+    for (start, end), pen in _resource("gauge"):
+        start_y = tank_y + TANK_HEIGHT * start / 100
+        end_y = tank_y + TANK_HEIGHT * end / 100
+        painter.setPen(pen)
+        painter.drawLine(int(level_x), int(start_y), int(level_x), int(end_y))  # Vertical line
+
+    # Draw tank level labels
+    painter.setFont(_resource("label_font"))
+    painter.setPen(_resource("label_pen"))
+    painter.drawText(level_x + 3, tank_y + TANK_HEIGHT + 25, "0%")  # 0% label
+    painter.drawText(level_x + 3, tank_y - 13, "100%")  # 100% label
+
+
+def static_pixmap(width, height, device_pixel_ratio=1.0):
+    # Pre-rendered static layer for this size, rendered on first use
+    key = (width, height, device_pixel_ratio)
+    pixmap = _static_cache.get(key)
+    if pixmap is None:
+        if len(_static_cache) >= MAX_CACHED_PIXMAPS:
+            del _static_cache[next(iter(_static_cache))]
+        pixmap = QPixmap(int(width * device_pixel_ratio), int(height * device_pixel_ratio))
+        pixmap.setDevicePixelRatio(device_pixel_ratio)
+        pixmap.fill(Qt.transparent)
+        pixmap_painter = QPainter(pixmap)
+        _paint_static(pixmap_painter, width, height)
+        pixmap_painter.end()
+        _static_cache[key] = pixmap
+    return pixmap
+
+
+def paint_tank(painter, width, height, tank_level, tank_name, liquid_type, state=None):
+    # Draw one tank in a width x height area whose top-left corner is the painter origin,
+    # coloured for its alarm state (by default the state of tank_level without hysteresis)
+    with PAINT_SECONDS.time():
+        _paint_tank(painter, width, height, tank_level, tank_name, liquid_type,
+                    alarm_state(tank_level) if state is None else state)
+
+
+def _paint_tank(painter, width, height, tank_level, tank_name, liquid_type, state):
+    device = painter.device()
+    device_pixel_ratio = device.devicePixelRatioF() if device is not None else 1.0
+    painter.drawPixmap(0, 0, static_pixmap(width, height, device_pixel_ratio))
+    painter.setRenderHint(QPainter.Antialiasing)
+
+    tank_x, tank_y = _tank_origin(width, height)
+    level_x = tank_x + TANK_WIDTH + 20
+
+    # Draw tank level indicator
+    level_indicator_height = 5  # Height of the indicator rectangle
+    level_indicator_width = 20  # Width of the indicator rectangle
+    level_indicator_y = int(tank_y + TANK_HEIGHT * (1 - tank_level))
+    level_indicator_x = int(tank_x + TANK_WIDTH + 10)  # Adjust the position of the indicator
+    if state != STATE_OFFLINE:
+        color = _resource("states")[state]
+        painter.setPen(color)
+        painter.setBrush(color)
+    else:
+        painter.setPen(_resource("label_pen"))
+        painter.setBrush(_resource("tank"))
+
+    painter.drawRect(level_indicator_x, level_indicator_y - level_indicator_height // 2, level_indicator_width, level_indicator_height)  # Draw the indicator rectangle
+
+    # Draw tank name
+    painter.setFont(_resource("label_font"))
+    painter.setPen(_resource("label_pen"))
+    painter.drawText(tank_x + 23, tank_y + TANK_HEIGHT + 40, tank_name)
+
+    # Draw liquid type
+    painter.setFont(_resource("small_font"))
+    painter.drawText(tank_x + LIQUID_TEXT_OFFSETS.get(liquid_type, 0), tank_y + TANK_HEIGHT + 60, liquid_type)
+
+    # Draw tank level
+    if state != STATE_OFFLINE:
+        color = _resource("states")[state]
+        painter.setPen(color)
+        painter.setBrush(color)
+        status_text = ALARM_STATES[state][2]
+        painter.drawText(tank_x - 3, tank_y + TANK_HEIGHT - 140, f"Tank Level={int(tank_level * 100)}%")
+        painter.drawText(tank_x - 3, tank_y + TANK_HEIGHT - 120, status_text)
+
+    painter.drawText(level_x + 15, level_indicator_y - level_indicator_height // 2, f"{int(tank_level * 100)}%")
+
+    # Draw tank level indicator shape
+    tank_fill_height = TANK_HEIGHT * tank_level  # Calculate the height of the filled area
+    tank_fill_y = tank_y + TANK_HEIGHT - tank_fill_height  # Calculate the y-coordinate of the filled area
+
+    if tank_level <= 0.29 and tank_level > 0.19:  # If the tank level is between 20% and 30%
+        # Calculate the height and width of the bottom ellipse
+        bottom_ellipse_height = TANK_HEIGHT * tank_level * 1.2  # Adjusting the factor (1.2) to fit visually
+        # Draw the bottom ellipse for the filled area
+        painter.drawEllipse(QRect(int(tank_x), int(tank_y + TANK_HEIGHT - bottom_ellipse_height), int(TANK_WIDTH), int(bottom_ellipse_height)))
+
+    elif tank_level <= 0.19 and tank_level > 0:  # If the tank level is 19% or less
+        bottom_ellipse_height = TANK_HEIGHT * tank_level * 1.2  # Adjusting the factor (1.2) to fit visually
+        if tank_level > 0.09:
+            bottom_ellipse_width = TANK_WIDTH * 3 / 4  # Adjusting the factor to fit visually
+        elif tank_level > 0.02:
+            bottom_ellipse_width = TANK_WIDTH * 0.4  # Adjusting the factor to fit visually
+        else:
+            bottom_ellipse_width = TANK_WIDTH * 0.3  # Adjusting the factor to fit visually
+        # Draw the bottom ellipse for the filled area
+        painter.drawEllipse(QRect(int(tank_x + (TANK_WIDTH - bottom_ellipse_width) / 2), int(tank_y + TANK_HEIGHT - bottom_ellipse_height), int(bottom_ellipse_width), int(bottom_ellipse_height)))
+
+    elif tank_level > 0:
+        # Draw the top ellipse of the filled area
+        painter.drawEllipse(QRect(int(tank_x), int(tank_fill_y), int(TANK_WIDTH), int(TANK_WIDTH // 2)))
+
+        # Limit the filled area to the lower edge of the bottom ellipse
+        bottom_ellipse_bottom_y = tank_y + TANK_HEIGHT  # Y-coordinate of the bottom edge of the bottom ellipse
+        if tank_fill_y + tank_fill_height > bottom_ellipse_bottom_y:
+            tank_fill_height = bottom_ellipse_bottom_y - tank_fill_y
+
+        # Draw the bottom ellipse of the filled area
+        painter.drawEllipse(QRect(int(tank_x), int(tank_fill_y + tank_fill_height - TANK_WIDTH // 2), int(TANK_WIDTH), int(TANK_WIDTH // 2)))
+
+        # Draw the curved sides of the filled area
+        painter.drawRect(int(tank_x), int(tank_fill_y + TANK_WIDTH // 4), int(TANK_WIDTH), int(tank_fill_height - TANK_WIDTH // 2))
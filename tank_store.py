@@ -0,0 +1,168 @@
+import heapq
+import time
+import zlib
+from decimal import Decimal
+
+from uploader import batch_write, coalesce
+
+MAX_BATCH_GET_KEYS = 100  # DynamoDB limit for one BatchGetItem request
+LATEST_SK = "LATEST"
+TIMESTAMP_PREFIX = "TS#"
+
+
+def format_timestamp(timestamp):
+    # Epoch seconds to ISO 8601 with milliseconds, sortable as a string
+    seconds = int(timestamp)
+    millis = int(round((timestamp - seconds) * 1000))
+    if millis == 1000:
+        seconds, millis = seconds + 1, 0
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(seconds)) + f".{millis:03d}Z"
+
+
+def tank_pk(site, tank_number, shard=None):
+    pk = f"SITE#{site}#TANK#{tank_number:04d}"
+    return pk if shard is None else f"{pk}#{shard}"
+
+
+def timestamp_sk(timestamp):
+    return TIMESTAMP_PREFIX + format_timestamp(timestamp)
+
+
+def to_decimal(value, digits=2):
+    # DynamoDB wants Decimal instead of float
+    return Decimal(str(round(value, digits))) if value is not None else Decimal("0.0")
+
+
+class TankStore:
+    """Data-access layer for the Tanks table.
+
+    Key scheme:
+      history  PK = SITE#<site>#TANK#<nnnn>[#<shard>]  SK = TS#<ISO 8601 ms timestamp>
+      latest   PK = SITE#<site>#TANK#<nnnn>            SK = LATEST
+
+    Every tank has its own partitions and its readings are sorted by time, so
+    nothing is overwritten and writes spread across the table. A high-rate
+    tank can be given several shards (shards maps tank number to count); its
+    readings are spread over them by timestamp and history() merges them back.
+    The LATEST item of every tank is overwritten by each reading, so the
+    current state of many tanks is one BatchGetItem away.
+    """
+
+    def __init__(self, dynamodb, table_name="Tanks", site="1", shards=None, max_retries=5):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self._table = None
+        self.site = site
+        self.shards = shards or {}
+        self.max_retries = max_retries
+
+    @property
+    def table(self):
+        # Resolved on first query, building items must not need the AWS session
+        if self._table is None:
+            self._table = self.dynamodb.Table(self.table_name)
+        return self._table
+
+    def shard_count(self, tank_number):
+        return self.shards.get(tank_number, 1)
+
+    def history_pks(self, tank_number):
+        count = self.shard_count(tank_number)
+        if count == 1:
+            return [tank_pk(self.site, tank_number)]
+        return [tank_pk(self.site, tank_number, shard) for shard in range(count)]
+
+    def reading_items(self, tank_number, timestamp, pressure, volume, tank_level, status="Connected", alarm=None):
+        # (history item, latest item) for one reading, timestamp in epoch seconds, alarm is the alarm state name
+        shards = self.shard_count(tank_number)
+        sk = timestamp_sk(timestamp)
+        # Hash of the sort key: spreads evenly, and a retried write lands on the same shard
+        shard = zlib.crc32(sk.encode()) % shards if shards > 1 else None
+        attributes = {
+            "Site": self.site,
+            "TankNumber": tank_number,
+            "Value": Decimal(str(pressure)) if pressure is not None else Decimal("0.0"),
+            "Status": status,
+            "timestamp": format_timestamp(timestamp),
+            "Volume": to_decimal(volume),
+            "TankLevelPercentage": to_decimal(tank_level * 100 if tank_level is not None else None),
+        }
+        if alarm is not None:
+            attributes["Alarm"] = alarm
+        history_item = dict(attributes, PK=tank_pk(self.site, tank_number, shard), SK=sk)
+        latest_item = dict(attributes, PK=tank_pk(self.site, tank_number), SK=LATEST_SK)
+        return history_item, latest_item
+
+    def put_readings(self, items):
+        # Synchronous batched write, returns the items DynamoDB did not accept
+        return batch_write(self.dynamodb, self.table_name, coalesce(items), self.max_retries)
+
+    def latest(self, tank_numbers):
+        # Latest item of each tank, as {tank number: item}, through BatchGetItem
+        keys = [{"PK": tank_pk(self.site, n), "SK": LATEST_SK} for n in tank_numbers]
+        result = {}
+        for start in range(0, len(keys), MAX_BATCH_GET_KEYS):
+            request_items = {self.table_name: {"Keys": keys[start:start + MAX_BATCH_GET_KEYS]}}
+            attempt = 0
+            while request_items:
+                response = self.dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get("Responses", {}).get(self.table_name, []):
+                    result[int(item["TankNumber"])] = item
+                request_items = response.get("UnprocessedKeys") or {}
+                attempt += 1
+                if request_items and attempt > self.max_retries:
+                    break
+                if request_items:
+                    time.sleep(0.05 * (2 ** (attempt - 1)))
+        return result
+
+    def query_pages(self, pk, key_condition, values, page_size=1000, newest_first=False):
+        # Items of one partition, following LastEvaluatedKey page by page
+        kwargs = {
+            "KeyConditionExpression": key_condition,
+            "ExpressionAttributeValues": dict(values, **{":pk": pk}),
+            "ScanIndexForward": not newest_first,
+            "Limit": page_size,
+        }
+        while True:
+            response = self.table.query(**kwargs)
+            yield from response.get("Items", [])
+            last_key = response.get("LastEvaluatedKey")
+            if not last_key:
+                return
+            kwargs["ExclusiveStartKey"] = last_key
+
+    def history(self, tank_number, start, end, page_size=1000, newest_first=False):
+        """Readings of a tank between start and end (epoch seconds, inclusive), in time order.
+
+        Results are streamed with paginated Query calls on every shard and
+        merged by sort key, so long ranges never need to fit in memory.
+        """
+        values = {":lo": timestamp_sk(start), ":hi": timestamp_sk(end)}
+        streams = [self.query_pages(pk, "PK = :pk AND SK BETWEEN :lo AND :hi", values, page_size, newest_first)
+                   for pk in self.history_pks(tank_number)]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=lambda item: item["SK"], reverse=newest_first)
+
+    def history_after(self, tank_number, after_sk, page_size=1000):
+        # Readings newer than the sort key after_sk (e.g. the last one seen), oldest first.
+        # Pass TIMESTAMP_PREFIX to get every reading.
+        values = {":after": after_sk}
+        streams = [self.query_pages(pk, "PK = :pk AND SK > :after", values, page_size)
+                   for pk in self.history_pks(tank_number)]
+        if len(streams) == 1:
+            return streams[0]
+        return heapq.merge(*streams, key=lambda item: item["SK"])
+
+    def newest_after(self, tank_number, after_sk):
+        # Newest reading with a sort key after after_sk, or None. One one-item Query per shard, newest
+        # first, so a tank with a long backlog costs no more than a quiet one
+        values = {":after": after_sk}
+        newest = None
+        for pk in self.history_pks(tank_number):
+            item = next(self.query_pages(pk, "PK = :pk AND SK > :after", values, page_size=1, newest_first=True),
+                        None)
+            if item is not None and (newest is None or item["SK"] > newest["SK"]):
+                newest = item
+        return newest
@@ -0,0 +1,214 @@
+"""Compact binary frames of tank readings, for metered uplinks.
+
+A frame carries a batch of history readings of one site in columns:
+
+    header   b"TK", version, compression (FRAME_RAW, FRAME_ZLIB or FRAME_ZSTD)
+    body     site, reading and tank counts, base timestamp in ms, then each column as a
+             width code and a little-endian array:
+               per tank (readings are sorted by tank, then time): tank number, reading
+               count, and its first timestamp (ms after the base), pressure and volume
+               per reading: timestamp, pressure and volume deltas to the tank's previous
+               reading, level in hundredths of a percent, and flags (bit 0 sensor
+               connected, bits 1-3 alarm state + 2, 0 without an Alarm attribute)
+
+Pressures and volumes are in hundredths.
+Every integer column is stored in the narrowest signed width that fits,
+so a steady tank's deltas take one or two bytes before compression. The resolution is that
+of the uploaded items (ms timestamps, two decimals), except for the
+pressure Value, which is rounded to two decimals. LATEST items are not
+sent: expand_frame() rebuilds every reading's history and LATEST items
+with TankStore.reading_items, exactly as the box would have.
+"""
+import calendar
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from alarms import STATE_BY_NAME, STATE_NAMES
+from instrumentation import metrics
+from tank_store import TIMESTAMP_PREFIX, TankStore
+
+MAGIC = b"TK"
+VERSION = 1
+FRAME_RAW = 0
+FRAME_ZLIB = 1
+FRAME_ZSTD = 2  # Needs the zstandard package on both ends
+
+CONNECTED_STATUS = "Connected"
+_HEADER = struct.Struct("<2sBB")
+_COUNTS = struct.Struct("<IIq")
+_WIDTHS = (np.dtype("<i1"), np.dtype("<i2"), np.dtype("<i4"), np.dtype("<i8"))
+
+FRAMES_SENT = metrics.counter("telemetry_frames_sent_total", "Telemetry frames uploaded")
+FRAME_BYTES = metrics.counter("telemetry_frame_bytes_total", "Bytes of telemetry frames uploaded")
+
+
+# Columns
+
+def _pack_column(values):
+    values = np.asarray(values, dtype=np.int64)
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for code, dtype in enumerate(_WIDTHS):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return bytes([code]) + values.astype(dtype).tobytes()
+
+
+def _unpack_column(body, offset, count):
+    dtype = _WIDTHS[body[offset]]
+    end = offset + 1 + count * dtype.itemsize
+    return np.frombuffer(body, dtype=dtype, count=count, offset=offset + 1).astype(np.int64), end
+
+
+def _deltas(values, firsts):
+    # (first value of each tank, difference of each reading to the previous one of the same tank, 0 for the first)
+    deltas = np.diff(values, prepend=values[:1])
+    deltas[firsts] = 0
+    return values[firsts], deltas
+
+
+def _undo_deltas(starts, deltas, firsts, runs):
+    totals = np.cumsum(deltas)
+    return np.repeat(starts - totals[firsts], runs) + totals
+
+
+# Frames
+
+def _compress(body, compression):
+    if compression == FRAME_ZLIB:
+        return zlib.compress(body, 9)
+    if compression == FRAME_ZSTD:
+        import zstandard  # Optional, only for zstd frames
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    return body
+
+
+def _decompress(body, compression):
+    if compression == FRAME_ZLIB:
+        return zlib.decompress(body)
+    if compression == FRAME_ZSTD:
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+def _parse_timestamp(text):
+    # Inverse of tank_store.format_timestamp, in ms
+    return calendar.timegm(time.strptime(text[:19], "%Y-%m-%dT%H:%M:%S")) * 1000 + int(text[20:23])
+
+
+def encode_frame(items, compression=FRAME_ZLIB):
+    """Frame of the history items of one site (e.g. journal items), LATEST items are skipped."""
+    items = [item for item in items if item["SK"].startswith(TIMESTAMP_PREFIX)]
+    site = items[0]["Site"] if items else ""
+    if any(item["Site"] != site for item in items):
+        raise ValueError("A telemetry frame carries the readings of a single site")
+    tanks = np.array([int(item["TankNumber"]) for item in items], dtype=np.int64)
+    timestamps = np.array([_parse_timestamp(item["timestamp"]) for item in items], dtype=np.int64)
+    order = np.lexsort((timestamps, tanks))
+    tanks, timestamps = tanks[order], timestamps[order]
+    items = [items[i] for i in order]
+    pressures = np.array([round(float(item["Value"]) * 100) for item in items], dtype=np.int64)
+    volumes = np.array([round(float(item["Volume"]) * 100) for item in items], dtype=np.int64)
+    levels = np.array([round(float(item["TankLevelPercentage"]) * 100) for item in items], dtype=np.int64)
+    alarms = np.array([STATE_BY_NAME[item["Alarm"]] + 2 if "Alarm" in item else 0 for item in items], dtype=np.int64)
+    flags = np.array([item["Status"] == CONNECTED_STATUS for item in items], dtype=np.int64) | alarms << 1
+
+    numbers, firsts, runs = np.unique(tanks, return_index=True, return_counts=True)
+    base = int(timestamps.min()) if len(items) else 0
+    columns = [numbers, runs]
+    deltas = []
+    for values in (timestamps - base, pressures, volumes):
+        starts, values = _deltas(values, firsts)
+        columns.append(starts)
+        deltas.append(values)
+    site_bytes = site.encode()
+    body = b"".join([bytes([len(site_bytes)]), site_bytes, _COUNTS.pack(len(items), len(numbers), base),
+                     *(_pack_column(column) for column in columns + deltas + [levels, flags])])
+    return _HEADER.pack(MAGIC, VERSION, compression) + _compress(body, compression)
+
+
+def decode_frame(frame):
+    """(site, readings) of a frame, readings as (tank number, epoch seconds, pressure, volume,
+    level fraction, connected, alarm name or None), by tank then time."""
+    magic, version, compression = _HEADER.unpack_from(frame)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a telemetry frame of a supported version")
+    body = _decompress(frame[_HEADER.size:], compression)
+    site_length = body[0]
+    site = body[1:1 + site_length].decode()
+    count, tank_count, base = _COUNTS.unpack_from(body, 1 + site_length)
+    offset = 1 + site_length + _COUNTS.size
+    columns = []
+    for length in [tank_count] * 5 + [count] * 5:
+        column, offset = _unpack_column(body, offset, length)
+        columns.append(column)
+    numbers, runs, first_times, first_pressures, first_volumes = columns[:5]
+    time_deltas, pressure_deltas, volume_deltas, levels, flags = columns[5:]
+
+    firsts = np.cumsum(runs) - runs
+    tanks = np.repeat(numbers, runs)
+    timestamps = (base + _undo_deltas(first_times, time_deltas, firsts, runs)) / 1000
+    pressures = _undo_deltas(first_pressures, pressure_deltas, firsts, runs) / 100
+    volumes = _undo_deltas(first_volumes, volume_deltas, firsts, runs) / 100
+    levels = levels / 10000
+    readings = []
+    for tank, timestamp, pressure, volume, level, flag in zip(tanks.tolist(), timestamps.tolist(),
+                                                              pressures.tolist(), volumes.tolist(),
+                                                              levels.tolist(), flags.tolist()):
+        connected = bool(flag & 1)
+        alarm = STATE_NAMES[(flag >> 1) - 2] if flag >> 1 else None
+        if connected:
+            readings.append((tank, timestamp, pressure, volume, level, True, alarm))
+        else:
+            readings.append((tank, timestamp, None, None, None, False, alarm))
+    return site, readings
+
+
+def expand_frame(frame, table_name="Tanks", shards=None):
+    # The Tanks items (history and LATEST) of every reading of a frame, newest last per key
+    site, readings = decode_frame(frame)
+    store = TankStore(None, table_name=table_name, site=site, shards=shards)
+    items = []
+    for tank, timestamp, pressure, volume, level, connected, alarm in readings:
+        status = CONNECTED_STATUS if connected else "No Sensor Connected"
+        items.extend(store.reading_items(tank, timestamp, pressure, volume, level, status, alarm))
+    return items
+
+
+class TelemetryReceiver:
+    """Cloud side: expands frames into Tanks items and writes them with BatchWriteItem."""
+
+    def __init__(self, dynamodb, table_name="Tanks", shards=None):
+        self.store = TankStore(dynamodb, table_name=table_name)
+        self.shards = shards  # Write shards of the boxes, see TankStore
+        self.frames = 0
+        self.readings = 0
+
+    def receive(self, frame):
+        # Returns the items DynamoDB did not accept
+        items = expand_frame(frame, self.store.table_name, self.shards)
+        failed = self.store.put_readings(items)
+        self.frames += 1
+        self.readings += len(items) // 2
+        return failed
+
+
+class HttpFrameSender:
+    """Box side: POSTs each frame to the telemetry endpoint, raises when it is not accepted."""
+
+    def __init__(self, url, timeout=30.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, frame):
+        import urllib.request  # Not needed until the first metered upload
+        request = urllib.request.Request(self.url, data=frame, method="POST",
+                                         headers={"Content-Type": "application/octet-stream"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise OSError(f"Telemetry endpoint answered {response.status}")
+        FRAMES_SENT.inc()
+        FRAME_BYTES.inc(len(frame))
@@ -0,0 +1,21 @@
+import pytest
+
+from modem import Modem, ModemTimeout
+from modem_sim import ModemSimulator
+
+
+@pytest.fixture
+def modem():
+    sim = ModemSimulator({"AT+NONE": None})
+    modem = Modem(port=sim.port, default_timeout=2.0)
+    modem.open()
+    yield modem
+    modem.close()
+    sim.close()
+
+
+def test_never_answering_command_times_out(modem):
+    with pytest.raises(ModemTimeout):
+        modem.command("AT+NONE", timeout=0.3)
+    # The simulator is still answering
+    assert modem.command("AT") == []
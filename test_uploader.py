@@ -0,0 +1,31 @@
+import sqlite3
+import time
+
+from uploader import BatchUploader
+
+
+class BrokenJournal:
+    def __init__(self):
+        self.batches = []
+
+    def append_many(self, items):
+        if not self.batches:
+            self.batches.append(None)
+            raise sqlite3.OperationalError("database or disk is full")
+        self.batches.append(list(items))
+
+
+def test_journal_error_does_not_stop_the_worker():
+    journal = BrokenJournal()
+    uploader = BatchUploader(None, flush_size=2, max_latency=0.05, journal=journal)
+    uploader.start()
+    for i in range(2):
+        uploader.submit({"PK": "Tank#1", "SK": str(i)})
+    while not journal.batches:
+        time.sleep(0.01)
+    uploader.submit({"PK": "Tank#1", "SK": "2"})
+    uploader.stop()
+    stats = uploader.stats()
+    assert stats["failed"] == 2
+    assert stats["written"] == 1
+    assert journal.batches[1] == [{"PK": "Tank#1", "SK": "2"}]
@@ -0,0 +1,196 @@
+import logging
+import queue
+import threading
+import time
+
+from instrumentation import metrics
+
+log = logging.getLogger(__name__)
+
+MAX_BATCH_ITEMS = 25  # DynamoDB limit for one BatchWriteItem request
+
+WRITE_SECONDS = metrics.histogram("dynamodb_batch_write_seconds", "Latency of one BatchWriteItem request")
+WRITE_RETRIES = metrics.counter("dynamodb_write_retries_total", "BatchWriteItem requests retried for unprocessed items")
+WRITE_FAILURES = metrics.counter("dynamodb_write_failures_total", "Items still unprocessed after every retry")
+UPLOAD_DROPPED = metrics.counter("uploader_dropped_total", "Readings dropped because the upload queue was full")
+UPLOAD_ERRORS = metrics.counter("uploader_flush_errors_total", "Upload flushes that raised")
+
+
+class BatchWriteError(Exception):
+    """A BatchWriteItem request raised: failed holds every item that was not written, cause the original error."""
+
+    def __init__(self, failed, cause):
+        super().__init__(f"{len(failed)} items not written: {cause}")
+        self.failed = failed
+        self.cause = cause
+
+
+def batch_write(dynamodb, table_name, items, max_retries=5, base_delay=0.05):
+    # Write the items 25 at a time with BatchWriteItem and retry whatever
+    # DynamoDB hands back as UnprocessedItems, with exponential backoff.
+    # Returns the items that were still unprocessed after max_retries.
+    # A request that raises stops the write with a BatchWriteError listing
+    # the items not written, the chunks before it are written.
+    failed = []
+    for start in range(0, len(items), MAX_BATCH_ITEMS):
+        chunk = items[start:start + MAX_BATCH_ITEMS]
+        request_items = {table_name: [{"PutRequest": {"Item": item}} for item in chunk]}
+        attempt = 0
+        while request_items:
+            try:
+                with WRITE_SECONDS.time():
+                    response = dynamodb.batch_write_item(RequestItems=request_items)
+            except Exception as e:
+                unwritten = [request["PutRequest"]["Item"] for request in request_items[table_name]]
+                raise BatchWriteError(failed + unwritten + items[start + MAX_BATCH_ITEMS:], e) from e
+            request_items = response.get("UnprocessedItems") or {}
+            if not request_items:
+                break
+            attempt += 1
+            if attempt > max_retries:
+                for request in request_items.get(table_name, []):
+                    failed.append(request["PutRequest"]["Item"])
+                WRITE_FAILURES.inc(len(request_items.get(table_name, [])))
+                break
+            WRITE_RETRIES.inc()
+            time.sleep(base_delay * (2 ** (attempt - 1)))
+    return failed
+
+
+def coalesce(items, key_names=("PK", "SK")):
+    # Keep only the newest reading per primary key: a batch may not contain
+    # the same key twice, and an older reading would be overwritten anyway.
+    latest = {}
+    for item in items:
+        latest[tuple(item[k] for k in key_names)] = item
+    return list(latest.values())
+
+
+class BatchUploader:
+    """Background uploader for tank readings.
+
+    submit() never blocks the caller: readings go into a bounded queue and
+    worker threads drain it, flushing with BatchWriteItem once flush_size
+    readings are waiting or the oldest one is max_latency seconds old.
+    When the queue is full the oldest reading is dropped.
+
+    With a journal (see journal.ReadingJournal) the batches are appended to
+    the local journal instead, and a JournalDrainer forwards them.
+    """
+
+    def __init__(self, dynamodb, table_name="Tanks", flush_size=MAX_BATCH_ITEMS, max_latency=2.0,
+                 max_queue=10000, workers=1, max_retries=5, key_names=("PK", "SK"), journal=None):
+        self.dynamodb = dynamodb
+        self.journal = journal
+        self.table_name = table_name
+        self.flush_size = flush_size
+        self.max_latency = max_latency
+        self.max_retries = max_retries
+        self.key_names = key_names
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.workers = workers
+        self.threads = []
+        self.stats_lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.flushes = 0
+
+    def start(self):
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"uploader-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=10.0):
+        # Let the workers flush what is already queued, then exit
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, item):
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    UPLOAD_DROPPED.inc()
+                    with self.stats_lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass
+        with self.stats_lock:
+            self.submitted += 1
+
+    def stats(self):
+        with self.stats_lock:
+            return {
+                "queued": self.queue.qsize(),
+                "submitted": self.submitted,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "coalesced": self.coalesced,
+                "flushes": self.flushes,
+            }
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_latency
+            stopping = False
+            while len(batch) < self.flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._flush(batch)
+            except Exception:
+                # A broken flush (journal error, bad item) loses this batch, not the worker
+                log.exception("Error uploading %d readings", len(batch))
+                UPLOAD_ERRORS.inc()
+                with self.stats_lock:
+                    self.flushes += 1
+                    self.failed += len(batch)
+            if stopping:
+                return
+
+    def _flush(self, batch):
+        if self.journal is not None:
+            self.journal.append_many(batch)
+            with self.stats_lock:
+                self.flushes += 1
+                self.written += len(batch)
+            return
+        items = coalesce(batch, self.key_names)
+        try:
+            failed = batch_write(self.dynamodb, self.table_name, items, self.max_retries)
+        except BatchWriteError as e:
+            # The chunks written before the error count as written
+            log.error("Error storing data: %s", e)
+            UPLOAD_ERRORS.inc()
+            failed = e.failed
+        with self.stats_lock:
+            self.flushes += 1
+            self.coalesced += len(batch) - len(items)
+            self.written += len(items) - len(failed)
+            self.failed += len(failed)
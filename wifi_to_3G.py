@@ -1,53 +1,36 @@
-import subprocess
-import time
-import serial
-import threading
+import asyncio
+import logging
 
-CHECK_INTERVAL = 60
-PING_HOST = "8.8.8.8"
+from link_manager import LinkManager
+from modem import Modem
+from instrumentation import setup_logging
 
-def is_wifi_connected():
-    try:
-        subprocess.check_output(["ping", "-c", "1", PING_HOST])
-        print("Wifi is connected")
-        return True
-    except subprocess.CalledProcessError:
-        print("No wifi detected")
-        return False
-
-def connect_to_lte():
-    port = "/dev/ttyUSB2"
-    baudrate = 115200
-    ser = serial.Serial(port, baudrate, timeout=1)
+log = logging.getLogger("wifi_to_3G")
 
-    ser.write(b"AT\r\n")
-    time.sleep(1)
+LTE_PORT = "/dev/ttyUSB2"
+LTE_BAUDRATE = 115200
+LTE_APN = "weborange"
 
-    ser.write(b"AT+CGDCONT=1,\"IP\",\"weborange\"\r\n")
-    time.sleep(1)
-    ser.write(b"AT+CGACT=1,1\r\n")
-    time.sleep(1)
+# Opened on first use and kept open, so a failover does not pay for the port open
+modem = Modem(LTE_PORT, LTE_BAUDRATE)
 
-    ser.close()
-
-def monitor_wifi_and_switch_to_lte():
-    while True:
-        if not is_wifi_connected():
-            print("WiFi connection lost. Switching to LTE...")
-            connect_to_lte()
-            time.sleep(10)
-        else:
-            print("WiFi is connected.")
-            time.sleep(CHECK_INTERVAL)
+def connect_to_lte():
+    # Each step returns as soon as the modem answers, a failed one raises ModemError
+    modem.connect_lte(LTE_APN)
+    rssi, _ = modem.signal_quality()
+    state, description = modem.registration()
+    log.info("LTE connected: %s, signal %s dBm", description, rssi)
 
 def main():
-    while True:
-        print("Starting script")
-        # Starting the WiFi monitoring in a separate thread
-        monitor_thread = threading.Thread(target=monitor_wifi_and_switch_to_lte)
-        monitor_thread.daemon = True
-        monitor_thread.start()
-        time.sleep(2)
+    setup_logging()
+    log.info("Starting script")
+    # One long-lived link manager replaces the polling threads: it probes every
+    # second, and switches to LTE once when the link is declared down
+    link_manager = LinkManager(interval=1.0, on_down=connect_to_lte)
+    try:
+        asyncio.run(link_manager.run())
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()